@@ -1,22 +1,35 @@
-from typing import Any
+import importlib
+import json
 import os
+import signal
+import threading
+import time
+if __name__ == "__main__" and hasattr(signal, 'SIGUSR1'):
+    # SIGUSR1 starts a profile once the worker is up (see profile_on_signal below); until then it
+    # is ignored, as its default action would kill a worker the supervisor signals while it starts
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-import snowflake.connector
-import pandas as pd
-from snowflake.core import Root
 from dotenv import load_dotenv
-import cortex_chat
-import time
-import requests # Still needed for initial Slack API interaction in upload_chart_to_slack if it remains here
-
-# Import charting functions from the new file
-from chart_utils import select_and_plot_chart, upload_chart_to_slack # We will modify upload_chart_to_slack to be passed app.client
+from shared_store import SharedStore
+from event_filter import EventFilter
+from thread_history import ThreadHistory
+from slack_scheduler import SlackScheduler, PRIORITY_HIGH, PRIORITY_NORMAL
+from query_runner import run_query, SpeculativeQuery, QueryCancelled, QueryTimeout, STATEMENT_TIMEOUT_SECONDS
+from cancellation import CancellationRegistry
+from query_guard import QueryGuard, QueryRefused
+from warehouse_router import WarehouseRouter, parse_routes
+from warehouse_warmer import WarehouseWarmer, parse_range
+from result_cache import ResultCache
+from result_export import ExportError, CSV, PARQUET
+from memory_budget import MemoryAccountant, MemoryBudgetExceeded, FIGURE_BYTES
+from rate_limiter import RateLimiter, FairDispatcher, ReloadingConfig, RateLimited, Overloaded, DEFAULT_LIMITS
+from profiling import Profiler, profile_on_signal
 
-
-# Set Matplotlib backend for server-side generation (can be removed if charting.py handles all plotting)
-# import matplotlib
-# matplotlib.use('Agg') # Moving this to charting.py
+# Heavy modules (pandas, matplotlib via chart_utils, snowflake.connector, cortex_chat)
+# are imported lazily or warmed in a background thread so that the Socket Mode
+# connection comes up first after a deploy or a crash-restart.
+_PROCESS_START = time.perf_counter()
 
 load_dotenv()
 
@@ -36,6 +49,32 @@ SEARCH_SERVICE = os.getenv("SEARCH_SERVICE")
 RSA_PRIVATE_KEY_PATH = os.getenv("RSA_PRIVATE_KEY_PATH")
 MODEL = os.getenv("MODEL")
 
+# --- Optional Scaling Settings ---
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1")) # >1 runs a supervisor with this many Socket Mode workers
+WORKER_ID = os.getenv("BOT_WORKER_ID", "0") # Set by the supervisor for each worker
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH", "bot_state.db") # SQLite (WAL) file shared by all workers
+# Warehouses by estimated query weight, smallest first, e.g. "SLACK_XS:1GB,SLACK_S:100GB,SLACK_M".
+# Empty runs every query on WAREHOUSE.
+WAREHOUSE_ROUTES = os.getenv("WAREHOUSE_ROUTES", "")
+WAREHOUSE_POOL_SIZE = int(os.getenv("WAREHOUSE_POOL_SIZE", "4")) # Connections per routed warehouse
+# Pre-warming: resume the warehouse shortly before expected questions (business hours or past traffic)
+PREWARM_WAREHOUSES = os.getenv("PREWARM_WAREHOUSES", "") # Comma-separated; defaults to the first routed warehouse
+PREWARM_HOURS = os.getenv("PREWARM_HOURS", "8-17") # Local hours (inclusive) treated as business hours
+PREWARM_DAYS = os.getenv("PREWARM_DAYS", "0-4") # Weekdays, Monday = 0
+PREWARM_MAX_CREDITS_PER_DAY = float(os.getenv("PREWARM_MAX_CREDITS_PER_DAY", "1.0")) # 0 disables pre-warming
+# Local copy of the semantic model used to answer common question shapes without the agent; empty disables
+FAST_PATH_MODEL_FILE = os.getenv("FAST_PATH_MODEL_FILE", "retail_sales_data.yaml")
+# Offer the agent only the tool a question clearly needs (uses the local semantic model and document titles)
+TOOL_SELECTION = os.getenv("TOOL_SELECTION", "true").lower() == "true"
+# Local BM25 index of the parsed_pdfs chunks, used for document questions; empty disables
+DOC_INDEX_DIR = os.getenv("DOC_INDEX_DIR", "")
+DOC_INDEX_MIN_SCORE = float(os.getenv("DOC_INDEX_MIN_SCORE", "4.0")) # Best BM25 score needed to skip remote search
+DOC_INDEX_RESULTS = int(os.getenv("DOC_INDEX_RESULTS", "3")) # Excerpts passed to the agent
+DOC_INDEX_SYNC_SECONDS = int(os.getenv("DOC_INDEX_SYNC_SECONDS", "3600")) # Matches the search service's target lag
+# Rollup tables of the fact table (from the local semantic model) that answer equivalent aggregate queries
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+ROLLUP_REFRESH_SECONDS = int(os.getenv("ROLLUP_REFRESH_SECONDS", "900"))
+
 # --- Environment Variable Validation (Added for Robustness) ---
 required_env_vars = ["ACCOUNT", "HOST", "DEMO_USER", "DEMO_DATABASE", "DEMO_SCHEMA", "DEMO_USER_ROLE", "WAREHOUSE", "SLACK_APP_TOKEN", "SLACK_BOT_TOKEN", "AGENT_ENDPOINT", "SEMANTIC_MODEL", "SEARCH_SERVICE", "RSA_PRIVATE_KEY_PATH", "MODEL"]
 for var in required_env_vars:
@@ -44,16 +83,110 @@ for var in required_env_vars:
         exit(1) # Exit if essential environment variables are missing
 
 DEBUG = False # Set to True for more verbose console output
+STARTUP_WAIT_SECONDS = 120 # How long an early message waits for Snowflake/Cortex init before giving up
+
+# --- Startup State ---
+# Set once the Snowflake connection and Cortex Chat Agent are initialized.
+# Socket Mode connects before init() runs, so handlers wait on this event.
+READY = threading.Event()
+CONN, CORTEX_APP = None, None
+ROUTER = None # WarehouseRouter, created after init()
+WARMER = None # WarehouseWarmer, created after init()
+FAST_PATH = None # FastPathRouter, created after init() unless disabled
+SELECTOR = None # ToolSelector, created after init() unless disabled
+DOC_INDEX = None # DocIndex, created after init() if DOC_INDEX_DIR is set
+ROLLUPS = None # RollupManager, created after init() if ROLLUPS_ENABLED
 
 # --- Initializes Slack App ---
 app = App(token=SLACK_BOT_TOKEN)
 
-# --- Global In-Memory Cache for SQL Queries ---
-# WARNING: In a production environment, this should be replaced with a more robust,
-# persistent, and thread-safe caching mechanism (e.g., Redis, database)
-# to handle multiple concurrent users and bot restarts.
-global_sql_cache = {}
+# --- Outbound Slack Calls ---
+# All Web API calls go through the scheduler, which respects per-method rate-limit
+# tiers and Retry-After. User-facing updates jump ahead of uploads.
+SLACK = SlackScheduler(app.client)
+SLACK_HIGH = SLACK.client(PRIORITY_HIGH)
+SLACK_NORMAL = SLACK.client(PRIORITY_NORMAL)
+
+# --- Shared State ---
+# SQL queries behind the "Show SQL Query" button and processed-event claims live in a
+# SQLite (WAL) store shared by all worker processes on this host, so any worker can serve
+# the button click and each Slack event is handled once even if delivered to several workers.
+STORE = SharedStore(SHARED_STORE_PATH)
+SQL_CACHE_NAMESPACE = "sql"
+SQL_CACHE_TTL_SECONDS = 7 * 24 * 3600 # How long the "Show SQL Query" button keeps working
+EVENTS_NAMESPACE = "events"
+EVENT_CLAIM_TTL_SECONDS = 3600 # Slack retries an event for well under an hour
 SQL_SHOW_BUTTON_ACTION_ID = "show_full_sql_query_button"
+CANCEL_BUTTON_ACTION_ID = "cancel_request_button"
+
+# --- Result Pages ---
+# Results of multi-row answers are cached by message ts, so "Previous page" / "Next page"
+# re-render the table in place without another warehouse query.
+RESULTS = ResultCache(
+    STORE,
+    ttl=int(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+    max_result_bytes=int(os.getenv("RESULT_CACHE_MAX_RESULT_BYTES", str(10 * 1024**2))),
+    max_total_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(200 * 1024**2)))
+)
+RESULTS_PAGE_SIZE = 10
+RESULTS_TABLE_BLOCK_ID = "results_table"
+RESULTS_PAGER_BLOCK_ID = "results_pager"
+PREVIOUS_PAGE_ACTION_ID = "results_previous_page"
+NEXT_PAGE_ACTION_ID = "results_next_page"
+
+# --- Result Export ---
+# Results too big for the message can be exported in full as a file. The query id is kept so the
+# export reads Snowflake's stored result instead of running the query again.
+QUERY_ID_NAMESPACE = "export_query_ids" # cancellation.py keeps in-flight query ids under "query_ids"
+RESULTS_EXPORT_BLOCK_ID = "results_export"
+EXPORT_CSV_ACTION_ID = "export_results_csv"
+EXPORT_PARQUET_ACTION_ID = "export_results_parquet"
+
+# --- Query Cost Guardrail ---
+# Generated SQL is EXPLAINed first and run as-is, run on a sample, or refused,
+# using per-channel thresholds from QUERY_GUARD_LIMITS.
+QUERY_GUARD = QueryGuard()
+
+# --- Rate Limits and Fair Queuing ---
+# Token buckets per user and channel, and a bounded number of questions in progress shared
+# fairly across channels; see rate_limiter.py. Edits to RATE_LIMITS_FILE apply without a restart.
+RATE_LIMITS = ReloadingConfig(os.getenv("RATE_LIMITS_FILE", "rate_limits.json"), DEFAULT_LIMITS)
+LIMITER = RateLimiter(STORE, RATE_LIMITS)
+DISPATCHER = FairDispatcher(RATE_LIMITS)
+
+# --- Memory Budget ---
+# Requests are admitted against an estimated memory budget for this process and account for
+# their rows, agent stream, DataFrame and chart as they grow; see memory_budget.py.
+MEMORY = MemoryAccountant(
+    budget_bytes=int(os.getenv("MEMORY_BUDGET_MB", "1024")) * 1024**2,
+    request_reserve=int(os.getenv("MEMORY_REQUEST_RESERVE_MB", "32")) * 1024**2,
+    max_request_bytes=int(os.getenv("MEMORY_REQUEST_MAX_MB", "512")) * 1024**2,
+    queue_timeout=float(os.getenv("MEMORY_QUEUE_SECONDS", "30"))
+)
+
+# --- On-Demand Profiling ---
+# The /profile command (for the user ids in PROFILE_ADMINS) or SIGUSR1 profiles this process
+# for a while without a restart; requests mark their stages with PROFILER.stage(...), which
+# costs nothing while no profile runs. See profiling.py.
+PROFILE_COMMAND = "/profile"
+PROFILE_ADMINS = {user.strip() for user in os.getenv("PROFILE_ADMINS", "").split(",") if user.strip()}
+PROFILE_DEFAULT_SECONDS = int(os.getenv("PROFILE_DEFAULT_SECONDS", "30")) # How long SIGUSR1 or a bare /profile profiles for
+PROFILER = Profiler(os.getenv("PROFILE_DIR", "profiles"), label=f"worker{WORKER_ID}")
+
+# --- Cancellation ---
+# In-flight requests by "<channel>:<ts>" of the question and of the placeholder message,
+# so the Cancel button or deleting the question stops the warehouse query.
+CANCELLATIONS = CancellationRegistry(STORE)
+
+# --- Event Filter ---
+# Drops retries, duplicates, edits/deletes and bot posts before any expensive call.
+EVENT_FILTER = EventFilter(window_seconds=600, max_entries=10000)
+
+# --- Conversation History ---
+# Last few turns (with their SQL) per Slack thread, so follow-ups like
+# "now break that down by gender" are answered in context. Kept in the shared store,
+# so the worker that gets the follow-up sees the turns another worker recorded.
+HISTORY = ThreadHistory(STORE, ttl=int(os.getenv("THREAD_HISTORY_TTL_SECONDS", str(24 * 3600))), max_turns=4, max_tokens=1500)
 
 # --- Slack Message Handlers ---
 
@@ -79,60 +212,198 @@ SQL_SHOW_BUTTON_ACTION_ID = "show_full_sql_query_button"
 #     )
 
 @app.event("message")
-def handle_message_events(ack, body, say):
+def handle_message_events(ack, body, say, context):
+    channel_id, placeholder_ts, speculative, cancel_token, memory = None, None, None, None, None
+    turn_started, thread_ts = None, None
     try:
         ack()
-        prompt = body['event']['text']
-        say(
-            text = "Snowflake Cortex AI is generating a response",
-            blocks=[
-                {
-                    "type": "divider"
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "plain_text",
-                        "text": ":snowflake: Snowflake Cortex AI is generating a response. Please wait...",
-                    }
-                },
-                {
-                    "type": "divider"
-                },
-            ]
+        event = body['event']
+        thread_ts = event.get('thread_ts') # Replies to a thread are answered in that thread
+        if event.get('subtype') == 'message_deleted':
+            # The user deleted their question: stop any work still running for it
+            if READY.is_set() and event.get('deleted_ts'):
+                CANCELLATIONS.cancel(f"{event['channel']}:{event['deleted_ts']}", CONN)
+        drop_reason = EVENT_FILTER.check(body, bot_user_id=context.get('bot_user_id'))
+        if drop_reason is None and not claim_event(body):
+            # Already handled by another worker (Slack retry or duplicate delivery)
+            drop_reason = EVENT_FILTER.record_drop('dropped_claimed')
+        if drop_reason:
+            return
+        prompt = event['text']
+        if not READY.wait(timeout=STARTUP_WAIT_SECONDS):
+            say("I'm still starting up. Please try again in a minute.")
+            return
+        channel_id = event['channel']
+        try:
+            LIMITER.check(event.get('user'), channel_id)
+            DISPATCHER.acquire(channel_id) # Waits for this channel's fair turn, or sheds the question
+            turn_started = time.monotonic()
+        except RateLimited as e:
+            who = "You're" if e.scope == "user" else "This channel is"
+            say(text=f"{who} sending questions faster than I can answer them. Please try again in {max(1, round(e.retry_after))} seconds.",
+                thread_ts=event['ts'])
+            return
+        except Overloaded:
+            say(text="I'm busy answering other questions right now. Please try again in a minute.", thread_ts=event['ts'])
+            return
+        WARMER.record_request() # Request history drives warehouse pre-warming
+        cancel_token = CANCELLATIONS.open([f"{channel_id}:{event['ts']}"])
+        placeholder = SLACK_HIGH.chat_postMessage(
+            channel=channel_id,
+            text="Snowflake Cortex AI is generating a response",
+            thread_ts=thread_ts,
+            blocks=get_status_blocks(":snowflake: Snowflake Cortex AI is generating a response. Please wait...") + [get_cancel_button_block()]
         )
-        # Pass the full body to display_agent_response to extract channel_id
-        response = ask_agent(prompt)
-        display_agent_response(response, say, app.client, body) # Pass app.client and body
+        placeholder_ts = placeholder['ts']
+        CANCELLATIONS.add_key(cancel_token, f"{channel_id}:{placeholder_ts}")
+        # Waits (telling the user) while other requests hold the memory budget
+        memory = MEMORY.admit(on_queued=lambda: SLACK_HIGH.chat_update(
+            channel=channel_id, ts=placeholder_ts, text="Your request is queued",
+            blocks=get_status_blocks(":hourglass_flowing_sand: A few large requests are running. Yours is queued and will start shortly...") + [get_cancel_button_block()]
+        ))
+        # Replies in a thread continue that thread's conversation; a new message starts one
+        thread_key = event.get('thread_ts') or event['ts']
+        # The SQL starts running as soon as the agent streams it, while the agent finishes its answer
+        speculative = SpeculativeQuery(CONN, cancel_token, prepare=QUERY_GUARD.preparer(CONN, channel_id), router=ROUTER, memory=memory)
+        with PROFILER.stage('agent'):
+            response = ask_agent(prompt, thread_key, on_sql=speculative.start, memory=memory)
+        if cancel_token.is_cancelled():
+            raise QueryCancelled("Request was cancelled while the agent was answering.")
+        # The answer replaces the placeholder message in place
+        with PROFILER.stage('display'):
+            display_agent_response(response, channel_id, placeholder_ts, speculative, cancel_token, memory)
+    except QueryCancelled:
+        report_status(channel_id, placeholder_ts, thread_ts, say, "Request cancelled.", ":no_entry_sign: This request was cancelled.")
+    except QueryRefused as e:
+        report_status(channel_id, placeholder_ts, thread_ts, say, "Query not run.", f":warning: {e}")
+    except MemoryBudgetExceeded as e:
+        report_status(channel_id, placeholder_ts, thread_ts, say, "Too busy right now.",
+                      f":warning: {e} Please try again in a few minutes, or narrow your question so it returns fewer rows.")
+    except QueryTimeout:
+        report_status(channel_id, placeholder_ts, thread_ts, say, "Request timed out.",
+                      f"The query ran longer than {STATEMENT_TIMEOUT_SECONDS} seconds and was stopped. Try narrowing your question.")
     except Exception as e:
         error_info = f"{type(e).__name__} at line {e.__traceback__.tb_lineno} of {__file__}: {e}"
         print(f"ERROR: {error_info}") # Use a clear ERROR prefix for logs
-        say(
-            text = "Request failed...",
-            blocks=[
-                {
-                    "type": "divider"
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "plain_text",
-                        "text": f"An unexpected error occurred: {type(e).__name__}. Please try again later or contact support if the issue persists.",
-                    }
-                },
-                {
-                    "type": "divider"
+        report_status(channel_id, placeholder_ts, thread_ts, say, "Request failed...",
+                      f"An unexpected error occurred: {type(e).__name__}. Please try again later or contact support if the issue persists.")
+    finally:
+        if speculative:
+            speculative.cancel() # No-op if the speculative result was used
+        if cancel_token:
+            CANCELLATIONS.close(cancel_token)
+        if memory:
+            memory.release()
+        if turn_started is not None:
+            DISPATCHER.release(time.monotonic() - turn_started)
+            PROFILER.request_done()
+
+def report_status(channel_id, placeholder_ts, thread_ts, say, text, message):
+    """
+    Replaces the placeholder with a status message, or posts one (in the question's thread, if any)
+    if no placeholder exists yet.
+    """
+    try:
+        if placeholder_ts:
+            SLACK_HIGH.chat_update(channel=channel_id, ts=placeholder_ts, text=text, blocks=get_status_blocks(message))
+        else:
+            say(text=text, blocks=get_status_blocks(message), thread_ts=thread_ts)
+    except Exception as post_error:
+        print(f"ERROR: Could not report the status to Slack: {post_error}")
+
+def get_cancel_button_block():
+    """
+    Returns the "Cancel" button shown on the placeholder while a request is running.
+    """
+    return {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {
+                    "type": "plain_text",
+                    "text": "Cancel",
+                    "emoji": True
                 },
-            ]
-        )
+                "style": "danger",
+                "action_id": CANCEL_BUTTON_ACTION_ID
+            }
+        ]
+    }
+
+def get_status_blocks(message):
+    """
+    Slack blocks for a short status message (placeholder, error) between dividers.
+    """
+    return [
+        {
+            "type": "divider"
+        },
+        {
+            "type": "section",
+            "text": {
+                "type": "plain_text",
+                "text": message,
+            }
+        },
+        {
+            "type": "divider"
+        },
+    ]
+
+def claim_event(body):
+    """
+    Claims the event in the shared store. Returns False if it was already claimed,
+    so Slack retries and deliveries to several workers are processed once.
+    """
+    event = body.get('event', {})
+    event_key = body.get('event_id') or event.get('client_msg_id') or f"{event.get('channel')}:{event.get('ts')}"
+    return STORE.claim(EVENTS_NAMESPACE, event_key, ttl=EVENT_CLAIM_TTL_SECONDS, value=WORKER_ID)
 
 # --- Agent Interaction ---
 
-def ask_agent(prompt):
+def ask_agent(prompt, thread_key=None, on_sql=None, memory=None):
+    """
+    Sends the user prompt to the Cortex Chat Agent, with the thread's prior turns
+    as context, and records the answer in the thread history. The agent's stream is
+    accounted to the memory lease, if given.
+    New questions with a common shape are answered by the fast path instead; follow-ups
+    always go to the agent, since they depend on the conversation so far.
+    """
+    call = plan_agent_call(prompt, thread_key)
+    resp = call['resp']
+    if resp is None:
+        on_bytes = memory.tracker('stream') if memory else None
+        resp = CORTEX_APP.chat(prompt, history=call['history'], on_sql=on_sql, tools=call['tools'],
+                               context=call['context'], on_bytes=on_bytes)
+    return record_agent_answer(prompt, thread_key, resp, call)
+
+def plan_agent_call(prompt, thread_key=None):
     """
-    Sends the user prompt to the Cortex Chat Agent.
+    Decides how a question is answered: 'resp' is the fast path answer (or None), otherwise the
+    agent is called with 'history', 'tools' and 'context' (local document excerpts from 'hits').
     """
-    resp = CORTEX_APP.chat(prompt)
+    history = HISTORY.get_messages(thread_key) if thread_key else None
+    resp = FAST_PATH.route(prompt) if FAST_PATH and not history else None
+    tools, context, hits = None, None, []
+    if resp is None:
+        tools = SELECTOR.select(prompt) if SELECTOR and not history else None
+        if DOC_INDEX and tools is not None and len(tools) == 1:
+            from cortex_chat import SEARCH_TOOL # Already loaded by init()
+            from doc_index import format_context
+            # Confident local matches for a document question replace the remote search call
+            hits = DOC_INDEX.search(prompt, k=DOC_INDEX_RESULTS) if tools[0] == SEARCH_TOOL else []
+            if hits and hits[0]['score'] >= DOC_INDEX_MIN_SCORE:
+                context, tools = format_context(hits), ()
+    return {'resp': resp, 'history': history, 'tools': tools, 'context': context, 'hits': hits}
+
+def record_agent_answer(prompt, thread_key, resp, call):
+    """Cites the local document the answer came from, if any, and adds the turn to the thread history."""
+    if resp and call['context']:
+        from doc_index import format_citation
+        resp['citations'] = format_citation(call['hits'][0])
+    if resp and thread_key:
+        HISTORY.add_turn(thread_key, prompt, resp['text'], resp['sql'])
     return resp
 
 # --- NEW: Helper for SQL display blocks ---
@@ -192,225 +463,401 @@ def get_sql_display_blocks(sql_query, show_full=False):
 
 # --- Response Display and Charting Logic ---
 
-def display_agent_response(content, say, app_client, original_body): # Added original_body parameter
+def display_agent_response(content, channel_id, message_ts, speculative=None, cancel_token=None, memory=None):
     """
-    Displays the agent's response, handling both SQL results (with charts)
-    and unstructured text responses.
+    Displays the agent's response by updating the placeholder message (message_ts) in place,
+    handling both SQL results (table and chart in one message) and unstructured text responses.
+    If a speculative query already ran the final SQL, its result is used. The rows, DataFrame
+    and chart are accounted to the memory lease, if given.
     """
-    channel_id = original_body['event']['channel'] # Extract channel_id from original message body
+    from chart_utils import select_and_plot_chart
 
     if content['sql']:
         sql = content['sql']
 
-        df = pd.read_sql(sql, CONN)
+        with PROFILER.stage('query'):
+            df = speculative.result_for(sql) if speculative else None
+            if df is None:
+                df = run_query(sql, CONN, cancel_token, prepare=QUERY_GUARD.preparer(CONN, channel_id), router=ROUTER, memory=memory)
+        with PROFILER.stage('frame'):
+            df = prepare_result_frame(df, memory)
+            initial_blocks = get_answer_blocks(df, sql, message_ts)
 
-        if DEBUG:
-            print("Original DataFrame info:")
-            df.info() # Debugging: Print DataFrame info to check dtypes
+        # Replace the placeholder with the results right away; the chart is added to the same message below
+        try:
+            SLACK_HIGH.chat_update(
+                channel=channel_id,
+                ts=message_ts,
+                blocks=initial_blocks,
+                text="Your query results are ready." # Fallback text
+            )
+            remember_query(df, sql, message_ts)
+
+        except Exception as e:
+            print(f"Error posting initial message to Slack: {e}")
+            SLACK_HIGH.chat_postMessage(channel=channel_id, text=f"An error occurred while posting results: {e}")
+            return
+
+
+        # --- Dynamic Chart Selection Logic (added to the results message) ---
+        if memory:
+            memory.track('figure', FIGURE_BYTES)
+        with PROFILER.stage('chart'):
+            chart_img_url = select_and_plot_chart(df, SLACK_NORMAL) # Uploads go through the scheduler too
+        if memory:
+            memory.track('figure', 0)
+        SLACK_NORMAL.chat_update(
+            channel=channel_id,
+            ts=message_ts,
+            blocks=initial_blocks + get_chart_blocks(chart_img_url),
+            text="Your query results are ready."
+        )
+    else:
+        # --- Handle Unstructured Text Responses ---
+        SLACK_HIGH.chat_update(
+            channel=channel_id,
+            ts=message_ts,
+            text = "Answer:",
+            blocks = get_text_answer_blocks(content)
+        )
+
+# The steps of display_agent_response, shared with the async entry point (async_app.py)
 
-        # --- Robust Type Conversion for Plotting ---
-        # Attempt to convert relevant columns to expected types before charting logic
-        if len(df.columns) >= 2:
+def prepare_result_frame(df, memory=None):
+    """
+    Converts result columns to the types charting expects, drops incomplete numeric rows and
+    compacts the DataFrame. The compacted size is accounted to the memory lease, if given.
+    """
+    import pandas as pd # Lazy import; normally already loaded by warm_up()
+    from frame_compact import compact_frame, frame_bytes
+
+    if DEBUG:
+        print("Original DataFrame info:")
+        df.info() # Debugging: Print DataFrame info to check dtypes
+
+    # --- Robust Type Conversion for Plotting ---
+    # Attempt to convert relevant columns to expected types before charting logic
+    if len(df.columns) >= 2:
+        try:
+            # Try to convert the first column to datetime if it's an object/string
+            if pd.api.types.is_object_dtype(df.iloc[:, 0]) or pd.api.types.is_string_dtype(df.iloc[:, 0]):
+                temp_col = pd.to_datetime(df.iloc[:, 0], errors='coerce')
+                if not temp_col.isna().all(): # Only convert if some values are valid datetimes
+                    df[df.columns[0]] = temp_col
+                    if DEBUG:
+                        print(f"Converted column '{df.columns[0]}' to datetime where possible.")
+        except Exception as e:
+            if DEBUG:
+                print(f"Could not convert column '{df.columns[0]}' to datetime: {e}")
+        
+        # Iterate through all columns to convert to numeric if appropriate
+        for i in range(len(df.columns)):
             try:
-                # Try to convert the first column to datetime if it's an object/string
-                if pd.api.types.is_object_dtype(df.iloc[:, 0]) or pd.api.types.is_string_dtype(df.iloc[:, 0]):
-                    temp_col = pd.to_datetime(df.iloc[:, 0], errors='coerce')
-                    if not temp_col.isna().all(): # Only convert if some values are valid datetimes
-                        df[df.columns[0]] = temp_col
+                if pd.api.types.is_object_dtype(df.iloc[:, i]) or pd.api.types.is_string_dtype(df.iloc[:, i]):
+                    temp_col = pd.to_numeric(df.iloc[:, i], errors='coerce')
+                    # Convert if mostly numeric and not entirely NaN after coercion
+                    if not temp_col.isna().all() and (temp_col.notna().sum() / len(temp_col) > 0.5):
+                        df[df.columns[i]] = temp_col
                         if DEBUG:
-                            print(f"Converted column '{df.columns[0]}' to datetime where possible.")
+                            print(f"Converted column '{df.columns[i]}' to numeric where possible.")
             except Exception as e:
                 if DEBUG:
-                    print(f"Could not convert column '{df.columns[0]}' to datetime: {e}")
-            
-            # Iterate through all columns to convert to numeric if appropriate
-            for i in range(len(df.columns)):
-                try:
-                    if pd.api.types.is_object_dtype(df.iloc[:, i]) or pd.api.types.is_string_dtype(df.iloc[:, i]):
-                        temp_col = pd.to_numeric(df.iloc[:, i], errors='coerce')
-                        # Convert if mostly numeric and not entirely NaN after coercion
-                        if not temp_col.isna().all() and (temp_col.notna().sum() / len(temp_col) > 0.5):
-                            df[df.columns[i]] = temp_col
-                            if DEBUG:
-                                print(f"Converted column '{df.columns[i]}' to numeric where possible.")
-                    elif pd.api.types.is_numeric_dtype(df.iloc[:, i]):
-                        # Ensure standard float type for plotting consistency
-                        df[df.columns[i]] = df[df.columns[i]].astype(float)
-                except Exception as e:
-                    if DEBUG:
-                        print(f"Could not convert column '{df.columns[i]}' to numeric: {e}")
-        
-        # --- Drop rows with NaN in numeric columns after conversion ---
+                    print(f"Could not convert column '{df.columns[i]}' to numeric: {e}")
+    
+    # --- Drop rows with NaN in numeric columns after conversion ---
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            if df[col].isnull().any():
+                df.dropna(subset=[col], inplace=True)
+                if DEBUG:
+                    print(f"Dropped rows with NaN in numeric column '{col}'.")
+
+    # Numeric columns keep their own dtypes: compact_frame downcasts them (and makes low-cardinality
+    # strings categorical) before the result is charted, cached for paging and held in memory
+    df = compact_frame(df)
+    if memory:
+        memory.track('stream', 0) # The agent's answer has been parsed
+        memory.track('rows', 0)
+        memory.track('dataframe', frame_bytes(df))
+
+    if DEBUG:
+        print("\nDataFrame after type conversion info:")
+        df.info() # Debugging: Print DataFrame info after conversion
+
+        print("\nDataFrame head after conversion:")
+        print(df.head()) # Debugging: Print head to see actual values and types
+    return df
+
+def get_answer_blocks(df, sql, message_ts):
+    """
+    Returns the blocks of a SQL answer: the single-row answer or the first page of the table
+    (cached for paging under message_ts), the guardrail note and the "Show SQL Query" button.
+    """
+    query_note = df.attrs.get('query_note', '')
+
+    # --- Prepare blocks for initial message ---
+    initial_blocks = []
+
+    # Handle Single-Row Answers Specifically
+    if len(df) == 1:
+        formatted_answer = ""
         for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                if df[col].isnull().any():
-                    df.dropna(subset=[col], inplace=True)
-                    if DEBUG:
-                        print(f"Dropped rows with NaN in numeric column '{col}'.")
+            formatted_answer += f"*{col.replace('_', ' ').title()}*: {df[col].iloc[0]}\n"
+        
+        initial_blocks.append({
+            "type": "rich_text",
+            "elements": [
+                {
+                    "type": "rich_text_section",
+                    "elements": [
+                        {
+                            "type": "text",
+                            "text": "Here's the specific information you requested:",
+                            "style": {
+                                "bold": True
+                            }
+                        }
+                    ]
+                },
+                {
+                    "type": "rich_text_preformatted",
+                    "elements": [
+                        {
+                            "type": "text",
+                            "text": formatted_answer
+                        }
+                    ]
+                }
+            ]
+        })
+    else:
+        # First page of the table; further pages are served from the result cache
+        pageable = len(df) > RESULTS_PAGE_SIZE and RESULTS.put(message_ts, df)
+        initial_blocks.extend(get_results_page_blocks(df, 0, pageable))
+        if len(df) > RESULTS_PAGE_SIZE:
+            initial_blocks.append(get_export_buttons_block())
+    
+    # Tell the user when the guardrail ran the query on a sample
+    if query_note:
+        initial_blocks.append({
+            "type": "context",
+            "elements": [
+                {
+                    "type": "mrkdwn",
+                    "text": query_note
+                }
+            ]
+        })
+
+    # Add the SQL query button/placeholder block
+    initial_blocks.extend(get_sql_display_blocks(sql_query=sql, show_full=False))
+    return initial_blocks
+
+def remember_query(df, sql, message_ts):
+    """Stores the SQL (and the query id, for exports) behind the results message."""
+    # Store the full SQL query in the shared store, keyed by message_ts
+    STORE.set(SQL_CACHE_NAMESPACE, message_ts, sql, ttl=SQL_CACHE_TTL_SECONDS)
+    if df.attrs.get('query_id'):
+        query_info = {'query_id': df.attrs['query_id'], 'note': df.attrs.get('query_note', '')}
+        STORE.set(QUERY_ID_NAMESPACE, message_ts, json.dumps(query_info), ttl=SQL_CACHE_TTL_SECONDS)
 
+def get_chart_blocks(chart_img_url):
+    """Returns the chart image block, or a note that no chart could be generated."""
+    if chart_img_url is not None:
+        return [
+            {
+                "type": "image",
+                "title": {
+                    "type": "plain_text",
+                    "text": "Chart"
+                },
+                "block_id": "image",
+                "slack_file": {
+                    "url": f"{chart_img_url}"
+                },
+                "alt_text": "Chart"
+            }
+        ]
+    else:
         if DEBUG:
-            print("\nDataFrame after type conversion info:")
-            df.info() # Debugging: Print DataFrame info after conversion
-
-            print("\nDataFrame head after conversion:")
-            print(df.head()) # Debugging: Print head to see actual values and types
-
-        # --- Prepare blocks for initial message ---
-        initial_blocks = []
-
-        # Handle Single-Row Answers Specifically
-        if len(df) == 1:
-            formatted_answer = ""
-            for col in df.columns:
-                formatted_answer += f"*{col.replace('_', ' ').title()}*: {df[col].iloc[0]}\n"
-            
-            initial_blocks.append({
-                "type": "rich_text",
+            print("No suitable chart could be generated for the returned data.")
+        return [ # Inform user no chart was generated
+            {
+                "type": "context",
                 "elements": [
                     {
-                        "type": "rich_text_section",
-                        "elements": [
-                            {
-                                "type": "text",
-                                "text": "Here's the specific information you requested:",
-                                "style": {
-                                    "bold": True
-                                }
-                            }
-                        ]
-                    },
-                    {
-                        "type": "rich_text_preformatted",
-                        "elements": [
-                            {
-                                "type": "text",
-                                "text": formatted_answer
-                            }
-                        ]
+                        "type": "mrkdwn",
+                        "text": "Note: No chart could be generated for this data due to its format or content."
                     }
                 ]
-            })
+            }
+        ]
+
+def get_text_answer_blocks(content):
+    """Returns the blocks of an unstructured (document) answer with its citation."""
+    return [
+        {
+            "type": "rich_text",
+            "elements": [
+                {
+                    "type": "rich_text_quote",
+                    "elements": [
+                        {
+                            "type": "text",
+                            "text": f"Answer: {content['text']}",
+                            "style": {
+                                "bold": True
+                            }
+                        }
+                    ]
+                },
+                {
+                    "type": "rich_text_quote",
+                    "elements": [
+                        {
+                            "type": "text",
+                            "text": f"* Citation: {content['citations']}",
+                            "style": {
+                                "italic": True
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
+
+def get_results_page_blocks(df, page, pageable=True):
+    """
+    Returns the table block for one page of the results, plus Previous/Next buttons when the
+    full result is cached (otherwise the table is truncated to the first page, as before).
+    """
+    total_rows = len(df)
+    page_count = max(1, -(-total_rows // RESULTS_PAGE_SIZE))
+    page = min(max(page, 0), page_count - 1)
+    start = page * RESULTS_PAGE_SIZE
+    display_df = df.iloc[start:start + RESULTS_PAGE_SIZE]
+    footer = ""
+    if total_rows > RESULTS_PAGE_SIZE:
+        if pageable:
+            footer = f"\n\n(Rows {start + 1}-{start + len(display_df)} of {total_rows}, page {page + 1} of {page_count}.)"
         else:
-            # Limit displayed rows and indicate truncation
-            original_rows = len(df)
-            display_df = df.head(10) # Limit to first 10 rows for display
-            truncated_message = ""
-            if original_rows > 10:
-                truncated_message = "\n\n(Results truncated to 10 lines.)"
-
-            # Display DataFrame as Text Table
-            initial_blocks.append({
-                "type": "rich_text",
+            footer = f"\n\n(Results truncated to {RESULTS_PAGE_SIZE} lines.)"
+
+    blocks = [{
+        "type": "rich_text",
+        "block_id": RESULTS_TABLE_BLOCK_ID,
+        "elements": [
+            {
+                "type": "rich_text_quote",
                 "elements": [
                     {
-                        "type": "rich_text_quote",
-                        "elements": [
-                            {
-                                "type": "text",
-                                "text": "Answer:",
-                                "style": {
-                                    "bold": True
-                                }
-                            }
-                        ]
-                    },
+                        "type": "text",
+                        "text": "Answer:",
+                        "style": {
+                            "bold": True
+                        }
+                    }
+                ]
+            },
+            {
+                "type": "rich_text_preformatted",
+                "elements": [
                     {
-                        "type": "rich_text_preformatted",
-                        "elements": [
-                            {
-                                "type": "text",
-                                "text": f"{display_df.to_string()}{truncated_message}"
-                            }
-                        ]
+                        "type": "text",
+                        "text": f"{display_df.to_string()}{footer}"
                     }
                 ]
+            }
+        ]
+    }]
+    if pageable and page_count > 1:
+        buttons = []
+        if page > 0:
+            buttons.append({
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Previous page", "emoji": True},
+                "value": str(page - 1),
+                "action_id": PREVIOUS_PAGE_ACTION_ID
             })
-        
-        # Add the SQL query button/placeholder block
-        initial_blocks.extend(get_sql_display_blocks(sql_query=sql, show_full=False))
+        if page < page_count - 1:
+            buttons.append({
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Next page", "emoji": True},
+                "value": str(page + 1),
+                "action_id": NEXT_PAGE_ACTION_ID
+            })
+        blocks.append({"type": "actions", "block_id": RESULTS_PAGER_BLOCK_ID, "elements": buttons})
+    return blocks
 
-        # Send the initial message and capture its timestamp (ts)
-        try:
-            post_response = app_client.chat_postMessage(
-                channel=channel_id,
-                blocks=initial_blocks,
-                text="Your query results are ready." # Fallback text
-            )
-            message_ts = post_response['ts']
-            
-            # Store the full SQL query in the global cache, keyed by message_ts
-            global_sql_cache[message_ts] = sql
+def get_export_buttons_block():
+    """Returns the "Export CSV" / "Export Parquet" buttons shown under results that don't fit in the message."""
+    return {
+        "type": "actions",
+        "block_id": RESULTS_EXPORT_BLOCK_ID,
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Export CSV", "emoji": True},
+                "value": CSV,
+                "action_id": EXPORT_CSV_ACTION_ID
+            },
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Export Parquet", "emoji": True},
+                "value": PARQUET,
+                "action_id": EXPORT_PARQUET_ACTION_ID
+            }
+        ]
+    }
 
-        except Exception as e:
-            print(f"Error posting initial message to Slack: {e}")
-            say(f"An error occurred while posting results: {e}")
-            return
+def get_reusable_blocks(blocks):
+    """
+    Slack returns image blocks with extra read-only fields; keeps only the inputs
+    so the blocks of a message can be sent back in chat_update.
+    """
+    reusable = []
+    for block in blocks:
+        if block.get("type") == "image":
+            block = {k: v for k, v in block.items() if k in ("type", "block_id", "title", "alt_text", "slack_file", "image_url")}
+        reusable.append(block)
+    return reusable
 
+def get_blocks_with_full_sql(current_blocks, sql_query):
+    """Returns the message blocks with the "Show SQL Query" button replaced by the full SQL."""
+    # Filter out the "Show SQL Query" button block from the current blocks
+    # We identify it by its type "section" and the action_id in its accessory
+    updated_blocks = []
+    for block in current_blocks:
+        if (block.get("type") == "section" and 
+            block.get("accessory", {}).get("type") == "button" and 
+            block.get("accessory", {}).get("action_id") == SQL_SHOW_BUTTON_ACTION_ID):
+            continue # Skip this block (the button)
+        updated_blocks.append(block)
+    updated_blocks = get_reusable_blocks(updated_blocks)
+    
+    # Add the full SQL query blocks to the end of the updated_blocks list
+    updated_blocks.extend(get_sql_display_blocks(sql_query, show_full=True))
+    return updated_blocks
 
-        # --- Dynamic Chart Selection Logic (sent as a follow-up message) ---
-        chart_img_url = select_and_plot_chart(df, app_client) # Pass app_client to charting function
-        if chart_img_url is not None:
-            # Send chart as a new message, referencing the original for context if desired
-            app_client.chat_postMessage(
-                channel=channel_id,
-                blocks=[
-                    {
-                        "type": "image",
-                        "title": {
-                            "type": "plain_text",
-                            "text": "Chart"
-                        },
-                        "block_id": "image",
-                        "slack_file": {
-                            "url": f"{chart_img_url}"
-                        },
-                        "alt_text": "Chart"
-                    }
-                ]
-            )
-        else:
-            if DEBUG:
-                print("No suitable chart could be generated for the returned data.")
-            app_client.chat_postMessage( # Inform user no chart was generated
-                channel=channel_id,
-                text="Note: No chart could be generated for this data due to its format or content."
-            )
-    else:
-        # --- Handle Unstructured Text Responses ---
-        say(
-            text = "Answer:",
-            blocks = [
-                {
-                    "type": "rich_text",
-                    "elements": [
-                        {
-                            "type": "rich_text_quote",
-                            "elements": [
-                                {
-                                    "type": "text",
-                                    "text": f"Answer: {content['text']}",
-                                    "style": {
-                                        "bold": True
-                                    }
-                                }
-                            ]
-                        },
-                        {
-                            "type": "rich_text_quote",
-                            "elements": [
-                                {
-                                    "type": "text",
-                                    "text": f"* Citation: {content['citations']}",
-                                    "style": {
-                                        "italic": True
-                                    }
-                                }
-                            ]
-                        }
-                    ]
-                }
-            ]
-        )
+def get_blocks_with_page(current_blocks, df, page):
+    """Returns the message blocks showing another page of the results."""
+    # Replace the table and the page buttons; keep everything else (note, SQL, chart) as it is
+    page_blocks = get_results_page_blocks(df, page)
+    updated_blocks = []
+    for block in get_reusable_blocks(current_blocks):
+        if block.get("block_id") == RESULTS_TABLE_BLOCK_ID:
+            updated_blocks.extend(page_blocks)
+        elif block.get("block_id") != RESULTS_PAGER_BLOCK_ID:
+            updated_blocks.append(block)
+    return updated_blocks
+
+def get_export_comment(export):
+    """Returns the comment posted with an exported results file."""
+    comment = f"Full results: {export.rows:,} rows."
+    if export.note:
+        comment += f" {export.note}"
+    return comment
 
 # --- NEW: Action handler for "Show SQL Query" button ---
 @app.action(SQL_SHOW_BUTTON_ACTION_ID)
@@ -420,12 +867,12 @@ def handle_show_sql_query(ack, body, client):
     message_ts = body['message']['ts']
     channel_id = body['channel']['id']
     
-    # Retrieve the SQL query from the cache using the message's timestamp
-    sql_query = global_sql_cache.get(message_ts)
+    # Retrieve the SQL query from the shared store using the message's timestamp
+    sql_query = STORE.get(SQL_CACHE_NAMESPACE, message_ts)
 
     if not sql_query:
         # If SQL not found (e.g., bot restarted, cache cleared), inform the user ephemerally
-        client.chat_postMessage(
+        SLACK_HIGH.chat_postMessage(
             channel=channel_id,
             text="Sorry, I couldn't retrieve the SQL query for this message. It might have expired or been cleared.",
             thread_ts=message_ts # Reply in thread if message has one
@@ -433,24 +880,11 @@ def handle_show_sql_query(ack, body, client):
         return
 
     # Get the current blocks of the message that the user interacted with
-    current_blocks = body['message']['blocks']
-    
-    # Filter out the "Show SQL Query" button block from the current blocks
-    # We identify it by its type "section" and the action_id in its accessory
-    updated_blocks = []
-    for block in current_blocks:
-        if (block.get("type") == "section" and 
-            block.get("accessory", {}).get("type") == "button" and 
-            block.get("accessory", {}).get("action_id") == SQL_SHOW_BUTTON_ACTION_ID):
-            continue # Skip this block (the button)
-        updated_blocks.append(block)
-    
-    # Add the full SQL query blocks to the end of the updated_blocks list
-    updated_blocks.extend(get_sql_display_blocks(sql_query, show_full=True))
+    updated_blocks = get_blocks_with_full_sql(body['message']['blocks'], sql_query)
 
     # Update the original message in Slack with the new set of blocks
     try:
-        client.chat_update(
+        SLACK_HIGH.chat_update(
             channel=channel_id,
             ts=message_ts,
             blocks=updated_blocks,
@@ -458,16 +892,167 @@ def handle_show_sql_query(ack, body, client):
         )
     except Exception as e:
         print(f"Error updating message with SQL: {e}")
-        client.chat_postMessage(
+        SLACK_HIGH.chat_postMessage(
             channel=channel_id,
             text=f"An error occurred while displaying the query: {e}",
             thread_ts=message_ts
         )
+    # The SQL stays in the store (until its TTL) for the Export buttons
+
+
+# --- Action handler for the "Previous page" / "Next page" buttons ---
+@app.action(PREVIOUS_PAGE_ACTION_ID)
+@app.action(NEXT_PAGE_ACTION_ID)
+def handle_results_page(ack, body):
+    ack() # Acknowledge the button click immediately
+
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+    page = int(body['actions'][0]['value'])
+
+    df = RESULTS.get(message_ts) # The cached result; no warehouse round trip
+    if df is None:
+        SLACK_HIGH.chat_postMessage(
+            channel=channel_id,
+            text="Sorry, these results are no longer cached. Please ask the question again to see more rows.",
+            thread_ts=message_ts
+        )
+        return
+
+    updated_blocks = get_blocks_with_page(body['message']['blocks'], df, page)
+    SLACK_HIGH.chat_update(
+        channel=channel_id,
+        ts=message_ts,
+        blocks=updated_blocks,
+        text="Your query results are ready."
+    )
+
 
-    # Clean up the cache after the SQL has been displayed in the message
-    if message_ts in global_sql_cache:
-        del global_sql_cache[message_ts]
+# --- Action handler for the "Export CSV" / "Export Parquet" buttons ---
+@app.action(EXPORT_CSV_ACTION_ID)
+@app.action(EXPORT_PARQUET_ACTION_ID)
+def handle_export_results(ack, body):
+    ack() # Acknowledge the button click immediately
+    from result_export import export_query
+    from chart_utils import upload_file_to_slack # Already loaded by warm_up()
 
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+    fmt = body['actions'][0]['value']
+
+    sql_query = STORE.get(SQL_CACHE_NAMESPACE, message_ts)
+    if not sql_query:
+        SLACK_HIGH.chat_postMessage(
+            channel=channel_id,
+            text="Sorry, I couldn't find the query for these results any more. Please ask the question again.",
+            thread_ts=message_ts
+        )
+        return
+    query_info = json.loads(STORE.get(QUERY_ID_NAMESPACE, message_ts) or "{}")
+
+    export = None
+    try:
+        # Rows are streamed from the cursor into a spooled file; the result is never held as a DataFrame
+        export = export_query(
+            CONN, sql_query, fmt, "query_results",
+            query_id=query_info.get('query_id'), note=query_info.get('note', ''),
+            prepare=QUERY_GUARD.preparer(CONN, channel_id), router=ROUTER
+        )
+        file_url = upload_file_to_slack(
+            export.file, export.filename, export.size, SLACK_NORMAL, title=f"Query results ({fmt.upper()})",
+            channel_id=channel_id, thread_ts=message_ts, initial_comment=get_export_comment(export)
+        )
+        if file_url is None:
+            raise RuntimeError("the file upload to Slack failed")
+        print(f">>>>>>>>>> Exported {export.rows} rows ({export.size} bytes of {fmt}).")
+    except (QueryRefused, ExportError) as e:
+        SLACK_HIGH.chat_postMessage(channel=channel_id, text=f":warning: {e}", thread_ts=message_ts)
+    except Exception as e:
+        print(f"ERROR: Export failed: {type(e).__name__}: {e}")
+        SLACK_HIGH.chat_postMessage(
+            channel=channel_id,
+            text=f"An error occurred while exporting the results: {type(e).__name__}. Please try again later.",
+            thread_ts=message_ts
+        )
+    finally:
+        if export:
+            export.close()
+
+
+# --- Action handler for the "Cancel" button on the placeholder ---
+@app.action(CANCEL_BUTTON_ACTION_ID)
+def handle_cancel_request(ack, body):
+    ack() # Acknowledge the button click immediately
+
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+    # The request may be owned by another worker; the registry handles both cases
+    CANCELLATIONS.cancel(f"{channel_id}:{message_ts}", CONN)
+    SLACK_HIGH.chat_update(
+        channel=channel_id,
+        ts=message_ts,
+        text="Cancelling...",
+        blocks=get_status_blocks(":no_entry_sign: Cancelling this request...")
+    )
+
+
+# --- Slash command for on-demand profiling (admins only) ---
+@app.command(PROFILE_COMMAND)
+def handle_profile_command(ack, command, respond):
+    ack()
+    reply = start_profile(command['user_id'], command.get('text', ''),
+                          on_done=lambda session: share_profile(session, command['channel_id'], respond))
+    respond(reply) # Ephemeral: only the admin sees it
+
+def start_profile(user_id, text, on_done):
+    """
+    Runs "/profile [<seconds> | <n> requests | status | stop] [nomem]" for user_id and returns the reply.
+    nomem leaves tracemalloc off, which otherwise slows allocation-heavy steps while the profile runs.
+    """
+    if user_id not in PROFILE_ADMINS:
+        return "Sorry, profiling is only available to the bot's admins."
+    words = text.lower().split()
+    trace_memory = 'nomem' not in words
+    words = [word for word in words if word != 'nomem']
+    if words == ['status']:
+        return PROFILER.status()
+    if words == ['stop']:
+        return "Stopping the profile, the results follow shortly." if PROFILER.stop() else "No profile is running."
+    seconds, requests = PROFILE_DEFAULT_SECONDS, None
+    try:
+        if len(words) == 2 and words[1].startswith('request'):
+            seconds, requests = None, int(words[0])
+        elif len(words) == 1:
+            seconds = int(words[0].rstrip('s'))
+        elif words:
+            raise ValueError(text)
+    except ValueError:
+        return f"Usage: {PROFILE_COMMAND} [<seconds> | <n> requests | status | stop] [nomem]"
+    if not PROFILER.start(seconds=seconds, requests=requests, trace_memory=trace_memory, on_done=on_done):
+        return f"A profile is already running. {PROFILER.status()}"
+    limit = f"the next {requests} requests" if requests else f"{seconds}s"
+    # With BOT_WORKERS > 1 only the worker that received the command is profiled
+    return f"Profiling worker {WORKER_ID} for {limit}. The results will be posted here when it's done."
+
+def share_profile(session, channel_id, respond):
+    """
+    Posts a finished profile to the channel /profile was run in: the summary, folded stacks and
+    memory growth as files. The raw tracemalloc snapshot stays in the profile directory.
+    """
+    from chart_utils import upload_file_to_slack # Already loaded by warm_up()
+
+    try:
+        for path in session.paths:
+            if path.endswith('.tracemalloc'):
+                continue
+            with open(path, 'rb') as f:
+                upload_file_to_slack(f, os.path.basename(path), os.path.getsize(path), SLACK_NORMAL,
+                                     title=os.path.basename(path), channel_id=channel_id)
+        respond(f"Profile of worker {WORKER_ID} finished: {session.summary.splitlines()[0] if session.summary else ''}")
+    except Exception as e:
+        print(f"Warning: Could not upload the profile to Slack: {e}")
+        respond(f"Profile finished, but it could not be posted here ({type(e).__name__}). "
+                f"It's on the bot's host: {', '.join(session.paths)}")
 
 # --- Hello World Button Definitions (from previous request) ---
 
@@ -503,23 +1088,47 @@ def handle_hello_world_button_click(ack, say):
 
 # --- Initialization and App Start ---
 
+def warm_up():
+    """
+    Imports the heavy data and charting modules in the background so the first
+    answer after startup doesn't pay for them.
+    """
+    start = time.perf_counter()
+    try:
+        importlib.import_module("pandas")
+        import chart_utils # Pulls in matplotlib, sets the Agg backend and applies the chart style
+        chart_utils.warm_up() # Draws a throwaway chart of each size so the first real one is fast
+        print(f">>>>>>>>>> Warm-up complete in {time.perf_counter() - start:.2f}s.")
+    except Exception as e:
+        print(f"Warning: Warm-up failed, modules will load on first use: {e}")
+
+def connect_snowflake(warehouse=WAREHOUSE):
+    """
+    Opens a Snowflake connection using the given warehouse (also used by the warehouse router's pools).
+    """
+    import snowflake.connector
+
+    return snowflake.connector.connect(
+        user=USER,
+        authenticator="SNOWFLAKE_JWT",
+        private_key_file=RSA_PRIVATE_KEY_PATH,
+        account=ACCOUNT,
+        warehouse=warehouse,
+        role=ROLE,
+        host=HOST,
+        client_session_keep_alive=True # Connector heartbeat so idle sessions don't expire overnight
+    )
+
 def init():
     """
     Initializes Snowflake connection and Cortex Chat Agent.
     """
-    # Removed unused 'jwt' variable
+    import cortex_chat
+
     conn, cortex_app = None, None
 
     try:
-        conn = snowflake.connector.connect(
-            user=USER,
-            authenticator="SNOWFLAKE_JWT",
-            private_key_file=RSA_PRIVATE_KEY_PATH,
-            account=ACCOUNT,
-            warehouse=WAREHOUSE,
-            role=ROLE,
-            host=HOST
-        )
+        conn = connect_snowflake()
         if not conn.rest.token:
             raise Exception("Snowflake connection unsuccessful: No token received.")
         print(">>>>>>>>>> Snowflake connection successful.")
@@ -545,8 +1154,118 @@ def init():
     print(">>>>>>>>>> Init complete")
     return conn, cortex_app
 
-if __name__ == "__main__":
+def sync_doc_index():
+    """
+    Keeps the local document index in step with parsed_pdfs. One worker at a time syncs
+    (shared lease); the others pick up each newly published version.
+    """
+    while True:
+        try:
+            if STORE.claim("leases", "doc-index-sync", ttl=DOC_INDEX_SYNC_SECONDS / 2, value=WORKER_ID):
+                DOC_INDEX.sync(CONN)
+            else:
+                DOC_INDEX.refresh()
+        except Exception as e:
+            print(f"Warning: Document index sync failed: {e}")
+        time.sleep(DOC_INDEX_SYNC_SECONDS)
+
+def refresh_rollups():
+    """Refreshes stale rollups on a schedule; one worker at a time (shared lease)."""
+    ROLLUPS.enable_change_tracking()
+    while True:
+        try:
+            if STORE.claim("leases", "rollup-refresh", ttl=ROLLUP_REFRESH_SECONDS / 2, value=WORKER_ID):
+                ROLLUPS.refresh()
+        except Exception as e:
+            print(f"Warning: Rollup refresh failed: {e}")
+        time.sleep(ROLLUP_REFRESH_SECONDS)
+
+def build_tool_selector(semantic_model):
+    """
+    Builds the per-question tool selector from the semantic model and the titles of the
+    documents behind the search service (from parsed_pdfs, or the local data/ folder).
+    """
+    from tool_selector import ToolSelector, document_titles_from_snowflake, document_titles_from_dir
+
+    try:
+        titles = document_titles_from_snowflake(CONN)
+    except Exception as e:
+        print(f"Warning: Could not read document titles from Snowflake, using data/: {e}")
+        titles = document_titles_from_dir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    print(f">>>>>>>>>> Tool selection enabled ({len(titles)} document titles).")
+    return ToolSelector(semantic_model, titles)
+
+def start_services():
+    """
+    Connects to Snowflake and the agent and starts everything built on them (query routing,
+    pre-warming, fast path, tool selection, rollups, document index), then sets READY.
+    Used by both entry points: Socket Mode (below) and HTTP mode (async_app.py).
+    """
+    global CONN, CORTEX_APP, ROUTER, WARMER, FAST_PATH, SELECTOR, DOC_INDEX, ROLLUPS
     CONN, CORTEX_APP = init()
-    Root = Root(CONN) # Assuming Root is used elsewhere or for Snowpark Session
+    # Queries run on pooled connections of the warehouse matching their weight; CONN is
+    # kept for EXPLAIN and cancellation, which don't need a running warehouse.
+    ROUTER = WarehouseRouter(parse_routes(WAREHOUSE_ROUTES, WAREHOUSE), connect_snowflake, CONN, WAREHOUSE_POOL_SIZE)
+    print(f">>>>>>>>>> Query routing: {', '.join(name for name, _ in ROUTER.routes)}.")
+    WARMER = WarehouseWarmer(
+        STORE,
+        CONN,
+        [name.strip() for name in PREWARM_WAREHOUSES.split(',') if name.strip()] or [ROUTER.routes[0][0]],
+        heartbeat_conns=lambda: [conn for pool in ROUTER.pools.values() for conn in pool.idle_connections(WARMER.heartbeat_interval)],
+        worker_id=WORKER_ID,
+        business_hours=parse_range(PREWARM_HOURS),
+        business_days=parse_range(PREWARM_DAYS),
+        max_credits_per_day=PREWARM_MAX_CREDITS_PER_DAY
+    )
+    WARMER.start()
+    semantic_model = None
+    if FAST_PATH_MODEL_FILE:
+        try:
+            from semantic_model import load_semantic_model
+            from fast_path import FastPathRouter
+            semantic_model = load_semantic_model(FAST_PATH_MODEL_FILE)
+            FAST_PATH = FastPathRouter(semantic_model)
+            print(f">>>>>>>>>> Fast path enabled from {FAST_PATH_MODEL_FILE}.")
+            if TOOL_SELECTION:
+                SELECTOR = build_tool_selector(semantic_model)
+        except Exception as e:
+            print(f"Warning: Fast path disabled, could not load {FAST_PATH_MODEL_FILE}: {e}")
+    if semantic_model is not None and ROLLUPS_ENABLED:
+        try:
+            from rollups import RollupManager
+            # Refreshes run on a session of their own: they use a temporary table and a transaction
+            ROLLUPS = RollupManager(CONN, semantic_model.tables[0], STORE, freshness_ttl=ROLLUP_REFRESH_SECONDS / 2,
+                                    connect=connect_snowflake)
+            QUERY_GUARD.rewrite = ROLLUPS.rewrite
+            print(f">>>>>>>>>> Rollups enabled: {', '.join(rollup.name for rollup in ROLLUPS.rollups)}.")
+            threading.Thread(target=refresh_rollups, name="rollup-refresh", daemon=True).start()
+        except Exception as e:
+            ROLLUPS = None
+            QUERY_GUARD.rewrite = None
+            print(f"Warning: Rollups disabled, could not set them up: {e}")
+    if DOC_INDEX_DIR:
+        from doc_index import DocIndex
+        DOC_INDEX = DocIndex(DOC_INDEX_DIR)
+        print(f">>>>>>>>>> Local document index at {DOC_INDEX_DIR} ({DOC_INDEX.chunk_count} chunks).")
+        threading.Thread(target=sync_doc_index, name="doc-index-sync", daemon=True).start()
+    READY.set()
+    print(f">>>>>>>>>> Ready to answer {time.perf_counter() - _PROCESS_START:.2f}s after start.")
+
+if __name__ == "__main__":
+    if BOT_WORKERS > 1:
+        from supervisor import run_supervisor
+        print(f"Starting supervisor with {BOT_WORKERS} Socket Mode workers...")
+        run_supervisor(BOT_WORKERS, os.path.abspath(__file__))
+        raise SystemExit(0)
+
+    profile_on_signal(PROFILER, PROFILE_DEFAULT_SECONDS) # kill -USR1 <pid> profiles without a restart
+    STORE.purge_expired()
     print("Starting SocketModeHandler...")
-    SocketModeHandler(app, SLACK_APP_TOKEN).start()
\ No newline at end of file
+    handler = SocketModeHandler(app, SLACK_APP_TOKEN)
+    handler.connect() # Non-blocking; events are received on the handler's own threads
+    print(f">>>>>>>>>> Socket Mode connected {time.perf_counter() - _PROCESS_START:.2f}s after start.")
+
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    start_services()
+
+    threading.Event().wait() # Keep the main thread alive, as SocketModeHandler.start() does
@@ -0,0 +1,364 @@
+# HTTP-mode entry point: the bot's handlers on Bolt's AsyncApp, served by aiohttp.
+#
+# Slack sends Events API requests and button clicks to http(s)://<host>:<HTTP_PORT>/slack/events
+# (set it as the Request URL under Event Subscriptions and Interactivity in the Slack app).
+# Each process keeps many requests in flight on one event loop: Slack calls, the agent's
+# stream, waits for the warehouse and export uploads are awaited; the connector's blocking calls,
+# the local lookups and chart rendering run in the default thread pool. Run several processes
+# behind a load balancer; GET /healthz reports whether this one is ready.
+# State shared by the processes (event claims, SQL, result pages, rate limits) lives in
+# SHARED_STORE_PATH, so they must run on one host (or share that file) to dedupe retries.
+#
+# To run this on the command line from the repository root (a filled-in .env is required), enter:
+# python3 async_app.py
+#
+# Socket Mode (python3 app.py) is unchanged and remains the simplest way to develop locally.
+
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+if hasattr(signal, 'SIGUSR1'):
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN) # Until on_startup installs the profiler's handler; the default action kills
+
+import aiohttp
+from aiohttp import web
+from slack_bolt.async_app import AsyncApp
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+
+import app as bot # Shared configuration, state and message builders; its Socket Mode startup doesn't run
+from query_runner import run_query_async, AsyncSpeculativeQuery, QueryCancelled, QueryTimeout, STATEMENT_TIMEOUT_SECONDS
+from query_guard import QueryRefused
+from result_export import ExportError
+from memory_budget import MemoryBudgetExceeded, FIGURE_BYTES
+from rate_limiter import FairDispatcher, RateLimited, Overloaded
+from profiling import profile_on_signal
+
+DEBUG = False
+
+SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+HTTP_PORT = int(os.getenv("HTTP_PORT", "3000"))
+if not SLACK_SIGNING_SECRET:
+    print("Error: Required environment variable 'SLACK_SIGNING_SECRET' is not set. Please check your .env file.")
+    exit(1)
+
+async_app = AsyncApp(token=bot.SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
+# Slack Web API calls back off on HTTP 429 using Retry-After (the Socket Mode app's scheduler does the same)
+async_app.client.retry_handlers.append(AsyncRateLimitErrorRetryHandler(max_retry_count=3))
+SESSION = None # aiohttp.ClientSession for the agent and file uploads, created at startup
+# Waiting questions hold no thread here, so this process takes more at once than Socket Mode's
+# (http_max_concurrent in RATE_LIMITS_FILE); the rate limits and channel weights are shared.
+DISPATCHER = FairDispatcher(bot.RATE_LIMITS, max_concurrent_key="http_max_concurrent")
+
+# --- Slack Message Handlers ---
+
+@async_app.event("message")
+async def handle_message_events(ack, body, say, context, client):
+    channel_id, placeholder_ts, speculative, cancel_token, memory = None, None, None, None, None
+    turn_started, thread_ts = None, None
+    try:
+        await ack()
+        event = body['event']
+        thread_ts = event.get('thread_ts') # Replies to a thread are answered in that thread
+        if event.get('subtype') == 'message_deleted':
+            # The user deleted their question: stop any work still running for it
+            if bot.READY.is_set() and event.get('deleted_ts'):
+                await asyncio.to_thread(bot.CANCELLATIONS.cancel, f"{event['channel']}:{event['deleted_ts']}", bot.CONN)
+        drop_reason = bot.EVENT_FILTER.check(body, bot_user_id=context.get('bot_user_id'))
+        if drop_reason is None and not await asyncio.to_thread(bot.claim_event, body):
+            # Already handled by another process (Slack retry or duplicate delivery)
+            drop_reason = bot.EVENT_FILTER.record_drop('dropped_claimed')
+        if drop_reason:
+            return
+        prompt = event['text']
+        if not await asyncio.to_thread(bot.READY.wait, bot.STARTUP_WAIT_SECONDS):
+            await say("I'm still starting up. Please try again in a minute.")
+            return
+        channel_id = event['channel']
+        try:
+            await asyncio.to_thread(bot.LIMITER.check, event.get('user'), channel_id)
+            await DISPATCHER.acquire_async(channel_id) # Fair turn across channels, or shed
+            turn_started = time.monotonic()
+        except RateLimited as e:
+            who = "You're" if e.scope == "user" else "This channel is"
+            await say(text=f"{who} sending questions faster than I can answer them. Please try again in {max(1, round(e.retry_after))} seconds.",
+                      thread_ts=event['ts'])
+            return
+        except Overloaded:
+            await say(text="I'm busy answering other questions right now. Please try again in a minute.", thread_ts=event['ts'])
+            return
+        bot.WARMER.record_request() # Request history drives warehouse pre-warming
+        cancel_token = bot.CANCELLATIONS.open([f"{channel_id}:{event['ts']}"])
+        placeholder = await client.chat_postMessage(
+            channel=channel_id,
+            text="Snowflake Cortex AI is generating a response",
+            thread_ts=thread_ts,
+            blocks=bot.get_status_blocks(":snowflake: Snowflake Cortex AI is generating a response. Please wait...") + [bot.get_cancel_button_block()]
+        )
+        placeholder_ts = placeholder['ts']
+        bot.CANCELLATIONS.add_key(cancel_token, f"{channel_id}:{placeholder_ts}")
+        memory = await bot.MEMORY.admit_async(on_queued=lambda: client.chat_update(
+            channel=channel_id, ts=placeholder_ts, text="Your request is queued",
+            blocks=bot.get_status_blocks(":hourglass_flowing_sand: A few large requests are running. Yours is queued and will start shortly...") + [bot.get_cancel_button_block()]
+        ))
+        # Replies in a thread continue that thread's conversation; a new message starts one
+        thread_key = event.get('thread_ts') or event['ts']
+        # The SQL starts running as soon as the agent streams it, while the agent finishes its answer
+        speculative = AsyncSpeculativeQuery(bot.CONN, cancel_token, prepare=bot.QUERY_GUARD.preparer(bot.CONN, channel_id),
+                                            router=bot.ROUTER, memory=memory)
+        response = await ask_agent(prompt, thread_key, on_sql=speculative.start, memory=memory)
+        if cancel_token.is_cancelled():
+            raise QueryCancelled("Request was cancelled while the agent was answering.")
+        # The answer replaces the placeholder message in place
+        await display_agent_response(client, response, channel_id, placeholder_ts, speculative, cancel_token, memory)
+    except QueryCancelled:
+        await report_status(client, channel_id, placeholder_ts, thread_ts, say, "Request cancelled.", ":no_entry_sign: This request was cancelled.")
+    except QueryRefused as e:
+        await report_status(client, channel_id, placeholder_ts, thread_ts, say, "Query not run.", f":warning: {e}")
+    except MemoryBudgetExceeded as e:
+        await report_status(client, channel_id, placeholder_ts, thread_ts, say, "Too busy right now.",
+                            f":warning: {e} Please try again in a few minutes, or narrow your question so it returns fewer rows.")
+    except QueryTimeout:
+        await report_status(client, channel_id, placeholder_ts, thread_ts, say, "Request timed out.",
+                            f"The query ran longer than {STATEMENT_TIMEOUT_SECONDS} seconds and was stopped. Try narrowing your question.")
+    except Exception as e:
+        error_info = f"{type(e).__name__} at line {e.__traceback__.tb_lineno} of {__file__}: {e}"
+        print(f"ERROR: {error_info}") # Use a clear ERROR prefix for logs
+        await report_status(client, channel_id, placeholder_ts, thread_ts, say, "Request failed...",
+                            f"An unexpected error occurred: {type(e).__name__}. Please try again later or contact support if the issue persists.")
+    finally:
+        if speculative:
+            speculative.cancel() # No-op if the speculative result was used
+        if cancel_token:
+            bot.CANCELLATIONS.close(cancel_token)
+        if memory:
+            memory.release()
+        if turn_started is not None:
+            DISPATCHER.release(time.monotonic() - turn_started)
+            bot.PROFILER.request_done()
+
+async def report_status(client, channel_id, placeholder_ts, thread_ts, say, text, message):
+    """
+    Replaces the placeholder with a status message, or posts one (in the question's thread, if any)
+    if no placeholder exists yet.
+    """
+    try:
+        if placeholder_ts:
+            await client.chat_update(channel=channel_id, ts=placeholder_ts, text=text, blocks=bot.get_status_blocks(message))
+        else:
+            await say(text=text, blocks=bot.get_status_blocks(message), thread_ts=thread_ts)
+    except Exception as post_error:
+        print(f"ERROR: Could not report the status to Slack: {post_error}")
+
+# --- Agent Interaction ---
+
+async def ask_agent(prompt, thread_key=None, on_sql=None, memory=None):
+    """app.ask_agent with the agent's stream awaited on the event loop."""
+    call = await asyncio.to_thread(bot.plan_agent_call, prompt, thread_key)
+    resp = call['resp']
+    if resp is None:
+        on_bytes = memory.tracker('stream') if memory else None
+        resp = await bot.CORTEX_APP.chat_async(SESSION, prompt, history=call['history'], on_sql=on_sql, tools=call['tools'],
+                                               context=call['context'], on_bytes=on_bytes)
+    return await asyncio.to_thread(bot.record_agent_answer, prompt, thread_key, resp, call)
+
+# --- Response Display ---
+
+async def display_agent_response(client, content, channel_id, message_ts, speculative=None, cancel_token=None, memory=None):
+    """app.display_agent_response with the query and Slack calls awaited; the blocks are the same."""
+    from chart_utils import select_and_plot_chart
+
+    if not content['sql']:
+        await client.chat_update(channel=channel_id, ts=message_ts, text="Answer:", blocks=bot.get_text_answer_blocks(content))
+        return
+
+    sql = content['sql']
+    df = await speculative.result_for(sql) if speculative else None
+    if df is None:
+        df = await run_query_async(sql, bot.CONN, cancel_token, prepare=bot.QUERY_GUARD.preparer(bot.CONN, channel_id),
+                                   router=bot.ROUTER, memory=memory)
+    df = await asyncio.to_thread(bot.prepare_result_frame, df, memory)
+    initial_blocks = await asyncio.to_thread(bot.get_answer_blocks, df, sql, message_ts)
+
+    # Replace the placeholder with the results right away; the chart is added to the same message below
+    try:
+        await client.chat_update(channel=channel_id, ts=message_ts, blocks=initial_blocks, text="Your query results are ready.")
+        await asyncio.to_thread(bot.remember_query, df, sql, message_ts)
+    except Exception as e:
+        print(f"Error posting initial message to Slack: {e}")
+        await client.chat_postMessage(channel=channel_id, text=f"An error occurred while posting results: {e}")
+        return
+
+    # Rendering is CPU-bound, so the chart is drawn (and uploaded) in the thread pool
+    if memory:
+        memory.track('figure', FIGURE_BYTES)
+    chart_img_url = await asyncio.to_thread(select_and_plot_chart, df, bot.SLACK_NORMAL)
+    if memory:
+        memory.track('figure', 0)
+    await client.chat_update(
+        channel=channel_id,
+        ts=message_ts,
+        blocks=initial_blocks + bot.get_chart_blocks(chart_img_url),
+        text="Your query results are ready."
+    )
+
+# --- Action Handlers ---
+
+@async_app.action(bot.SQL_SHOW_BUTTON_ACTION_ID)
+async def handle_show_sql_query(ack, body, client):
+    await ack()
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+
+    sql_query = await asyncio.to_thread(bot.STORE.get, bot.SQL_CACHE_NAMESPACE, message_ts)
+    if not sql_query:
+        await client.chat_postMessage(
+            channel=channel_id,
+            text="Sorry, I couldn't retrieve the SQL query for this message. It might have expired or been cleared.",
+            thread_ts=message_ts
+        )
+        return
+    try:
+        await client.chat_update(
+            channel=channel_id,
+            ts=message_ts,
+            blocks=bot.get_blocks_with_full_sql(body['message']['blocks'], sql_query),
+            text="Your query results and SQL."
+        )
+    except Exception as e:
+        print(f"Error updating message with SQL: {e}")
+        await client.chat_postMessage(channel=channel_id, text=f"An error occurred while displaying the query: {e}", thread_ts=message_ts)
+
+@async_app.action(bot.PREVIOUS_PAGE_ACTION_ID)
+@async_app.action(bot.NEXT_PAGE_ACTION_ID)
+async def handle_results_page(ack, body, client):
+    await ack()
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+    page = int(body['actions'][0]['value'])
+
+    df = await asyncio.to_thread(bot.RESULTS.get, message_ts) # The cached result; no warehouse round trip
+    if df is None:
+        await client.chat_postMessage(
+            channel=channel_id,
+            text="Sorry, these results are no longer cached. Please ask the question again to see more rows.",
+            thread_ts=message_ts
+        )
+        return
+    await client.chat_update(
+        channel=channel_id,
+        ts=message_ts,
+        blocks=bot.get_blocks_with_page(body['message']['blocks'], df, page),
+        text="Your query results are ready."
+    )
+
+@async_app.action(bot.EXPORT_CSV_ACTION_ID)
+@async_app.action(bot.EXPORT_PARQUET_ACTION_ID)
+async def handle_export_results(ack, body, client):
+    await ack()
+    from result_export import export_query
+    from chart_utils import upload_file_to_slack_async
+
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+    fmt = body['actions'][0]['value']
+
+    sql_query = await asyncio.to_thread(bot.STORE.get, bot.SQL_CACHE_NAMESPACE, message_ts)
+    if not sql_query:
+        await client.chat_postMessage(
+            channel=channel_id,
+            text="Sorry, I couldn't find the query for these results any more. Please ask the question again.",
+            thread_ts=message_ts
+        )
+        return
+    query_info = json.loads(await asyncio.to_thread(bot.STORE.get, bot.QUERY_ID_NAMESPACE, message_ts) or "{}")
+
+    export = None
+    try:
+        # The rows are streamed into a spooled file in the thread pool, then uploaded from the event loop
+        export = await asyncio.to_thread(
+            export_query, bot.CONN, sql_query, fmt, "query_results",
+            query_id=query_info.get('query_id'), note=query_info.get('note', ''),
+            prepare=bot.QUERY_GUARD.preparer(bot.CONN, channel_id), router=bot.ROUTER
+        )
+        file_url = await upload_file_to_slack_async(
+            SESSION, export.file, export.filename, export.size, client, title=f"Query results ({fmt.upper()})",
+            channel_id=channel_id, thread_ts=message_ts, initial_comment=bot.get_export_comment(export)
+        )
+        if file_url is None:
+            raise RuntimeError("the file upload to Slack failed")
+        print(f">>>>>>>>>> Exported {export.rows} rows ({export.size} bytes of {fmt}).")
+    except (QueryRefused, ExportError) as e:
+        await client.chat_postMessage(channel=channel_id, text=f":warning: {e}", thread_ts=message_ts)
+    except Exception as e:
+        print(f"ERROR: Export failed: {type(e).__name__}: {e}")
+        await client.chat_postMessage(
+            channel=channel_id,
+            text=f"An error occurred while exporting the results: {type(e).__name__}. Please try again later.",
+            thread_ts=message_ts
+        )
+    finally:
+        if export:
+            export.close()
+
+@async_app.action(bot.CANCEL_BUTTON_ACTION_ID)
+async def handle_cancel_request(ack, body, client):
+    await ack()
+    message_ts = body['message']['ts']
+    channel_id = body['channel']['id']
+    # The request may be owned by another process; the registry handles both cases
+    await asyncio.to_thread(bot.CANCELLATIONS.cancel, f"{channel_id}:{message_ts}", bot.CONN)
+    await client.chat_update(
+        channel=channel_id,
+        ts=message_ts,
+        text="Cancelling...",
+        blocks=bot.get_status_blocks(":no_entry_sign: Cancelling this request...")
+    )
+
+# --- Slash command for on-demand profiling (admins only) ---
+# Requests share the event loop thread here, so they aren't split into stages: a profile shows
+# the loop (MainThread) and the worker threads (asyncio_N) by name.
+
+@async_app.command(bot.PROFILE_COMMAND)
+async def handle_profile_command(ack, command, respond):
+    await ack()
+    loop = asyncio.get_running_loop()
+    # The profile finishes on the profiler's thread; its replies are sent from the event loop
+    respond_later = lambda text: asyncio.run_coroutine_threadsafe(respond(text), loop).result()
+    reply = bot.start_profile(command['user_id'], command.get('text', ''),
+                              on_done=lambda session: bot.share_profile(session, command['channel_id'], respond_later))
+    await respond(reply)
+
+# --- Initialization and Server Start ---
+
+async def healthz(request):
+    """Load balancer health check: 200 once Snowflake and the agent are initialized."""
+    if bot.READY.is_set():
+        return web.Response(text="ok")
+    return web.Response(status=503, text="starting")
+
+async def on_startup(web_app):
+    global SESSION
+    # No total timeout: agent streams and uploads can take minutes; connecting is bounded
+    SESSION = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=30))
+    # kill -USR1 <pid> profiles without a restart; handled as a loop callback (see profile_on_signal)
+    profile_on_signal(bot.PROFILER, bot.PROFILE_DEFAULT_SECONDS, loop=asyncio.get_running_loop())
+    threading.Thread(target=bot.warm_up, name="warm-up", daemon=True).start()
+    # Connecting and building the local indexes block, so they run off the event loop;
+    # requests arriving before they finish wait on READY, as in Socket Mode
+    threading.Thread(target=bot.start_services, name="start-services", daemon=True).start()
+
+async def on_cleanup(web_app):
+    if SESSION:
+        await SESSION.close()
+
+if __name__ == "__main__":
+    bot.STORE.purge_expired()
+    web_app = async_app.web_app(path="/slack/events", port=HTTP_PORT)
+    web_app.router.add_get("/healthz", healthz)
+    web_app.on_startup.append(on_startup)
+    web_app.on_cleanup.append(on_cleanup)
+    print(f">>>>>>>>>> Serving Slack events on port {HTTP_PORT} {time.perf_counter() - bot._PROCESS_START:.2f}s after start.")
+    web.run_app(web_app, port=HTTP_PORT)
@@ -0,0 +1,98 @@
+# Per-chart render time of chart_utils, without uploading to Slack.
+#
+# To run this on the command line from the repository root, enter:
+# python3 benchmarks/chart_render.py
+# python3 benchmarks/chart_render.py --repeat 20 --no-warm-up   # skip chart_utils.warm_up() to see the cold first chart
+#
+# Each chart type is drawn from a typical answer built from the sample sales data. The import of
+# chart_utils, the warm-up and the first chart are timed once (they run in a fresh process, as
+# after a bot restart); every chart type is then drawn --repeat times and the median reported.
+# The upload is replaced by a stub that only records the image size, so times are local CPU only.
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+def sample_frames(pd, path):
+    sales = pd.read_csv(path)
+    sales.columns = [name.upper() for name in sales.columns]
+    sales['DATE'] = pd.to_datetime(sales['DATE'])
+    monthly = sales.assign(MONTH=sales['DATE'].dt.to_period('M').dt.to_timestamp())
+    return {
+        "bar": sales.groupby('PRODUCT_CATEGORY', as_index=False)['TOTAL_AMOUNT'].sum(),
+        "pie": sales.groupby('GENDER', as_index=False)['TOTAL_AMOUNT'].sum(),
+        "line": monthly.groupby('MONTH', as_index=False)['TOTAL_AMOUNT'].sum(),
+        "multi-line": monthly.groupby(['MONTH', 'PRODUCT_CATEGORY'], as_index=False)['TOTAL_AMOUNT'].sum(),
+        "scatter": sales[['AGE', 'TOTAL_AMOUNT']],
+        "grouped scatter": sales[['AGE', 'TOTAL_AMOUNT', 'GENDER']],
+    }
+
+def draw(chart_utils, name, df):
+    columns = list(df.columns)
+    if name == "bar":
+        return chart_utils.plot_bar_chart(df, None)
+    if name == "pie":
+        return chart_utils.plot_pie_chart(df, None)
+    if name == "line":
+        return chart_utils.plot_line_chart(df, columns[0], columns[1], None)
+    if name == "multi-line":
+        return chart_utils.plot_multi_line_chart(df, columns[0], columns[2], columns[1], None)
+    if name == "scatter":
+        return chart_utils.plot_scatter_chart(df, columns[0], columns[1], None)
+    return chart_utils.plot_scatter_chart(df, columns[0], columns[1], None, columns[2])
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--csv', default=os.path.join(REPO_ROOT, 'retail_sales_dataset.csv'), help='Sample data.')
+    cli_parser.add_argument('--repeat', type=int, default=10, help='Times each chart type is drawn.')
+    cli_parser.add_argument('--no-warm-up', action='store_true', help="Don't call chart_utils.warm_up() first.")
+    args = cli_parser.parse_args()
+
+    import pandas as pd
+    frames = sample_frames(pd, args.csv)
+
+    start = time.perf_counter()
+    import chart_utils
+    print(f"import chart_utils: {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+    image_bytes = {}
+    def fake_upload(image, *upload_args, **upload_kwargs):
+        # Counts the bytes of whatever the plot function would upload (an open file or a path)
+        if isinstance(image, str):
+            image_bytes[current] = os.path.getsize(image)
+            os.remove(image)
+        else:
+            image_bytes[current] = len(image.getvalue())
+        return "https://example.invalid/chart"
+    chart_utils.upload_chart_to_slack = fake_upload
+
+    if not args.no_warm_up and hasattr(chart_utils, 'warm_up'):
+        start = time.perf_counter()
+        chart_utils.warm_up()
+        print(f"warm_up():          {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+    print(f"\n{'chart':<16} {'first':>9} {'median':>9} {'min':>9} {'jpg bytes':>10}")
+    total = 0.0
+    for current, df in frames.items():
+        times = []
+        try:
+            for _ in range(1 + args.repeat):
+                start = time.perf_counter()
+                draw(chart_utils, current, df)
+                times.append(time.perf_counter() - start)
+        except Exception as e:
+            print(f"{current:<16} failed: {type(e).__name__}: {e}")
+            continue
+        first, rest = times[0], times[1:] or times
+        total += statistics.median(rest)
+        print(f"{current:<16} {first * 1000:>7.1f}ms {statistics.median(rest) * 1000:>7.1f}ms "
+              f"{min(rest) * 1000:>7.1f}ms {image_bytes.get(current, 0):>10,}")
+    print(f"\nSum of medians: {total * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
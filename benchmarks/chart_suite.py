@@ -0,0 +1,244 @@
+# Chart rendering benchmark suite: every branch of chart_utils.select_and_plot_chart at 10 to 1M rows.
+#
+# To run this on the command line from the repository root, enter:
+# python3 benchmarks/chart_suite.py                                  # table only
+# python3 benchmarks/chart_suite.py --output chart_suite.json        # also write the results as JSON
+# python3 benchmarks/chart_suite.py --rows 10,1000 --compare chart_suite.json --tolerance 0.25
+#
+# Synthetic answers are sampled (with replacement, fixed seed) from the sample sales data and
+# shaped for each branch: multi-line (date, category, number), scatter (number, number),
+# grouped scatter (number, number, category), line (date, number), pie (category, number) and
+# bar (category, number, number). They are compacted the way the bot compacts a result before charting.
+# Each branch and row count runs in a fresh process (after chart_utils.warm_up()), so its peak
+# RSS is its own; the upload is a stub. Per case, the median of --repeat runs of:
+#   select_ms  select_and_plot_chart's own checks, before the plot function is called
+#   render_ms  the plot function (data handling, drawing, layout, Agg rasterization), without encoding
+#   encode_ms  JPEG encoding of the rasterized figure (same bytes as savefig)
+#   bytes      size of the JPEG that would be uploaded
+#   peak_rss_mb  the process's peak resident memory (frame included; rss_before_mb is before charting)
+# Branches have a row limit where a chart stops making sense (a pie has at most 10 slices, a bar
+# chart one bar and tick label per row, which takes seconds from 1,000 rows); larger cases are
+# reported as skipped.
+#
+# With --compare, exits with status 1 if a case's total time (select + render + encode) is more
+# than --tolerance slower than in the given earlier results, or if a case failed.
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# branch -> (plot function select_and_plot_chart should pick, most rows drawn)
+BRANCHES = {
+    "multi_line": ("plot_multi_line_chart", 1_000_000),
+    "scatter": ("plot_scatter_chart", 1_000_000),
+    "grouped_scatter": ("plot_scatter_chart", 1_000_000),
+    "line": ("plot_line_chart", 1_000_000),
+    "pie": ("plot_pie_chart", 10),
+    "bar": ("plot_bar_chart", 1_000),
+}
+DEFAULT_ROWS = "10,1000,100000,1000000"
+PLOT_FUNCTIONS = ["plot_pie_chart", "plot_bar_chart", "plot_line_chart", "plot_multi_line_chart", "plot_scatter_chart"]
+
+def synthetic_frame(pd, np, path, branch, rows, seed=7):
+    """A result shaped for the branch, sampled from the sample data up to the given number of rows."""
+    sales = pd.read_csv(path)
+    sales.columns = [name.upper() for name in sales.columns]
+    rng = np.random.default_rng(seed)
+    sample = sales.iloc[rng.integers(0, len(sales), rows)].reset_index(drop=True)
+    # Spread the dates over ~3 years so large line charts have distinct points
+    dates = pd.to_datetime(sample['DATE']) + pd.to_timedelta(rng.integers(0, 3 * 365, rows), unit='D')
+    if branch == "multi_line":
+        return pd.DataFrame({'DATE': dates, 'PRODUCT_CATEGORY': sample['PRODUCT_CATEGORY'], 'TOTAL_AMOUNT': sample['TOTAL_AMOUNT']})
+    if branch == "scatter":
+        return sample[['AGE', 'TOTAL_AMOUNT']]
+    if branch == "grouped_scatter":
+        return sample[['AGE', 'TOTAL_AMOUNT', 'GENDER']]
+    if branch == "line":
+        return pd.DataFrame({'DATE': dates, 'TOTAL_AMOUNT': sample['TOTAL_AMOUNT']})
+    # pie and bar: one labelled value per row
+    labels = sample['PRODUCT_CATEGORY'] + ' ' + pd.Series(range(rows)).astype(str)
+    df = pd.DataFrame({'PRODUCT_CATEGORY': labels, 'TOTAL_AMOUNT': sample['TOTAL_AMOUNT']})
+    if branch == "bar":
+        df['QUANTITY'] = sample['QUANTITY'] # A third column: up to 10 rows of two columns would be a pie
+    return df
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024**2 if sys.platform == 'darwin' else peak / 1024, 1) # bytes on macOS, KiB on Linux
+
+def run_case(csv_path, branch, rows, repeat, compact):
+    """Runs one case in this process and returns its result."""
+    import numpy as np
+    import pandas as pd
+    from PIL import Image
+    import chart_utils
+    from frame_compact import compact_frame
+
+    df = synthetic_frame(pd, np, csv_path, branch, rows)
+    if compact:
+        df = compact_frame(df)
+    chart_utils.warm_up()
+    rss_before = peak_rss_mb()
+
+    timings = {}
+    def timed_plot(function):
+        def plot(*args, **kwargs):
+            timings['plot_start'] = time.perf_counter()
+            timings['chart'] = function.__name__
+            result = function(*args, **kwargs)
+            timings['plot'] = time.perf_counter() - timings['plot_start']
+            return result
+        return plot
+    for name in PLOT_FUNCTIONS:
+        setattr(chart_utils, name, timed_plot(getattr(chart_utils, name)))
+
+    def timed_save(fig, filename):
+        # What savefig(format='jpg') does, with rasterizing and encoding timed apart
+        start = time.perf_counter()
+        fig.canvas.draw()
+        drawn = time.perf_counter()
+        image = io.BytesIO()
+        Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert('RGB').save(image, format='jpeg', dpi=(fig.dpi, fig.dpi))
+        timings['encode'] = time.perf_counter() - drawn
+        timings['draw'] = drawn - start
+        image.seek(0)
+        image.name = filename
+        return image
+    chart_utils.save_jpg = timed_save
+
+    def fake_upload(image, app_client):
+        timings['bytes'] = len(image.getvalue())
+        return "https://example.invalid/chart"
+    chart_utils.upload_chart_to_slack = fake_upload
+
+    select, render, encode = [], [], []
+    for _ in range(repeat):
+        timings.clear()
+        start = time.perf_counter()
+        url = chart_utils.select_and_plot_chart(df, None)
+        if url is None or 'plot' not in timings:
+            return {'error': "no chart was generated"}
+        select.append(timings['plot_start'] - start)
+        render.append(timings['plot'] - timings['encode'])
+        encode.append(timings['encode'])
+    result = {
+        'chart': timings['chart'],
+        'select_ms': statistics.median(select) * 1000,
+        'render_ms': statistics.median(render) * 1000,
+        'encode_ms': statistics.median(encode) * 1000,
+        'bytes': timings['bytes'],
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    result['total_ms'] = result['select_ms'] + result['render_ms'] + result['encode_ms']
+    for name in ('select_ms', 'render_ms', 'encode_ms', 'total_ms'):
+        result[name] = round(result[name], 2)
+    return result
+
+def run_in_subprocess(args, branch, rows):
+    command = [sys.executable, os.path.abspath(__file__), '--case', f"{branch}:{rows}", '--csv', args.csv,
+               '--repeat', str(1 if rows >= 100_000 else args.repeat)]
+    if args.no_compact:
+        command.append('--no-compact')
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=REPO_ROOT)
+    for line in reversed(completed.stdout.splitlines()): # The result is the last line; chart_utils prints before it
+        if line.startswith('{'):
+            return json.loads(line)
+    return {'error': (completed.stderr.strip().splitlines() or ["no output"])[-1]}
+
+def compare(results, baseline_path, tolerance):
+    """Returns the cases that failed or got slower than the baseline by more than tolerance."""
+    with open(baseline_path) as f:
+        baseline = {(r['branch'], r['rows']): r for r in json.load(f)['results']}
+    problems = []
+    for result in results:
+        if 'error' in result:
+            problems.append(f"{result['branch']} at {result['rows']} rows failed: {result['error']}")
+            continue
+        before = baseline.get((result['branch'], result['rows']))
+        if not before or 'total_ms' not in before:
+            continue
+        if result['total_ms'] > before['total_ms'] * (1 + tolerance):
+            problems.append(f"{result['branch']} at {result['rows']} rows: {before['total_ms']:.1f}ms -> {result['total_ms']:.1f}ms")
+    return problems
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--csv', default=os.path.join(REPO_ROOT, 'retail_sales_dataset.csv'), help='Sample data.')
+    cli_parser.add_argument('--rows', default=DEFAULT_ROWS, help='Comma-separated row counts.')
+    cli_parser.add_argument('--branches', default=','.join(BRANCHES), help='Comma-separated branches to run.')
+    cli_parser.add_argument('--repeat', type=int, default=5, help='Runs per case (1 from 100,000 rows up).')
+    cli_parser.add_argument('--no-compact', action='store_true', help="Chart the frames without frame_compact, as before the bot compacted results.")
+    cli_parser.add_argument('--output', help='Write the results to this JSON file.')
+    cli_parser.add_argument('--compare', help='Earlier JSON results to compare total times with.')
+    cli_parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown for --compare (0.25 = 25%%).')
+    cli_parser.add_argument('--case', help=argparse.SUPPRESS) # branch:rows, run by the suite in a fresh process
+    args = cli_parser.parse_args()
+
+    if args.case:
+        branch, rows = args.case.split(':')
+        try:
+            result = run_case(args.csv, branch, int(rows), args.repeat, not args.no_compact)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        print(json.dumps(result))
+        return
+
+    import matplotlib
+    import pandas as pd
+
+    results = []
+    print(f"{'branch':<16} {'rows':>9} {'chart':<22} {'select':>9} {'render':>10} {'encode':>9} {'bytes':>9} {'peak RSS':>9}")
+    for branch in args.branches.split(','):
+        expected_chart, max_rows = BRANCHES[branch]
+        for rows in [int(count) for count in args.rows.split(',')]:
+            result = {'branch': branch, 'rows': rows}
+            if rows > max_rows:
+                result['skipped'] = f"more than {max_rows} rows"
+            else:
+                result.update(run_in_subprocess(args, branch, rows))
+                if 'chart' in result and result['chart'] != expected_chart:
+                    result['error'] = f"selected {result['chart']} instead of {expected_chart}"
+            results.append(result)
+            if 'skipped' in result or 'error' in result:
+                print(f"{branch:<16} {rows:>9} {result.get('skipped') or 'ERROR: ' + result['error']}")
+                continue
+            print(f"{branch:<16} {rows:>9} {result['chart']:<22} {result['select_ms']:>7.1f}ms {result['render_ms']:>8.1f}ms "
+                  f"{result['encode_ms']:>7.1f}ms {result['bytes']:>9,} {result['peak_rss_mb']:>7.0f}MB")
+
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'matplotlib': matplotlib.__version__,
+            'pandas': pd.__version__,
+            'repeat': args.repeat,
+            'compact': not args.no_compact,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}.")
+    if args.compare:
+        problems = compare(results, args.compare, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"No case is more than {args.tolerance:.0%} slower than {args.compare}.")
+
+if __name__ == "__main__":
+    main()
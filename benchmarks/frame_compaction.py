@@ -0,0 +1,82 @@
+# Memory of query results before and after frame_compact.compact_frame.
+#
+# To run this on the command line from the repository root, enter:
+# python3 benchmarks/frame_compaction.py
+# python3 benchmarks/frame_compaction.py --scale 1000   # the sample data repeated 1000 times
+#
+# The sample sales data is loaded into an in-memory SQLite database and typical answers are
+# queried from it (raw rows, totals by category and gender, daily totals, ...). Each result is
+# built the way query_runner builds one (a DataFrame from the fetched rows), then compacted.
+# Reported per result: in-memory size, pickled + compressed size (as kept by the result cache),
+# and the time compaction takes.
+
+import argparse
+import csv
+import os
+import pickle
+import sqlite3
+import sys
+import time
+import zlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+QUERIES = {
+    "raw rows": "SELECT * FROM retail_sales",
+    "sales by category and gender": "SELECT PRODUCT_CATEGORY, GENDER, SUM(TOTAL_AMOUNT) AS TOTAL_SALES "
+                                    "FROM retail_sales GROUP BY 1, 2",
+    "daily sales by category": "SELECT DATE, PRODUCT_CATEGORY, SUM(TOTAL_AMOUNT) AS TOTAL_SALES, SUM(QUANTITY) AS UNITS "
+                               "FROM retail_sales GROUP BY 1, 2 ORDER BY 1",
+    "customers by age and gender": "SELECT AGE, GENDER, COUNT(DISTINCT CUSTOMER_ID) AS CUSTOMERS "
+                                   "FROM retail_sales GROUP BY 1, 2",
+    "transactions with price": "SELECT TRANSACTION_ID, CUSTOMER_ID, PRODUCT_CATEGORY, QUANTITY, PRICE_PER_UNIT, "
+                               "TOTAL_AMOUNT * 1.0825 AS TOTAL_WITH_TAX FROM retail_sales",
+}
+
+def load_sample(path, scale):
+    conn = sqlite3.connect(":memory:")
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.upper() for name in next(reader)]
+        rows = [row for row in reader]
+    conn.execute(f"CREATE TABLE retail_sales ({', '.join(header)})")
+    for copy in range(scale):
+        # Distinct transaction and customer ids per copy, like a bigger table would have
+        offset = copy * len(rows)
+        conn.executemany(
+            f"INSERT INTO retail_sales VALUES ({', '.join('?' * len(header))})",
+            [(int(r[0]) + offset, r[1], f"{r[2]}-{copy}", r[3], int(r[4]), r[5], int(r[6]), int(r[7]), int(r[8])) for r in rows]
+        )
+    return conn
+
+def cached_bytes(df):
+    return len(zlib.compress(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), 1))
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--csv', default=os.path.join(REPO_ROOT, 'retail_sales_dataset.csv'), help='Sample data.')
+    cli_parser.add_argument('--scale', type=int, default=100, help='How many copies of the sample rows to load.')
+    args = cli_parser.parse_args()
+
+    import pandas as pd
+    from frame_compact import compact_frame, frame_bytes
+
+    conn = load_sample(args.csv, args.scale)
+    print(f"{'result':<30} {'rows':>9} {'memory':>12} {'compacted':>12} {'saved':>6} {'cached':>11} {'compacted':>11} {'time':>8}")
+    total_before = total_after = 0
+    for name, sql in QUERIES.items():
+        cursor = conn.execute(sql)
+        df = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+        start = time.perf_counter()
+        compacted = compact_frame(df)
+        elapsed = time.perf_counter() - start
+        before, after = frame_bytes(df), frame_bytes(compacted)
+        total_before += before
+        total_after += after
+        print(f"{name:<30} {len(df):>9} {before:>12,} {after:>12,} {1 - after / max(before, 1):>6.0%} "
+              f"{cached_bytes(df):>11,} {cached_bytes(compacted):>11,} {elapsed * 1000:>6.1f}ms")
+    print(f"\nAll results: {total_before:,} -> {total_after:,} bytes ({1 - total_after / max(total_before, 1):.0%} less memory).")
+
+if __name__ == "__main__":
+    main()
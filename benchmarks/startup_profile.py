@@ -0,0 +1,126 @@
+# Import-time and time-to-ready profile for app.py.
+#
+# To run this on the command line from the repository root (a filled-in .env is required), enter:
+# python3 benchmarks/startup_profile.py            # import profile only
+# python3 benchmarks/startup_profile.py --full     # also start the bot and time Socket Mode / ready
+#
+# Exits with status 1 if a heavy module is imported eagerly by app.py or a budget is exceeded,
+# so it can be used as a check after changing imports.
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must NOT be imported while app.py is being imported.
+HEAVY_MODULES = ["pandas", "matplotlib", "snowflake.connector", "snowflake.core", "cortex_chat", "chart_utils"]
+
+# Matches lines written by `python -X importtime`:
+# import time: self [us] | cumulative | imported package
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+def profile_imports():
+    """
+    Imports app.py in a fresh interpreter with -X importtime.
+    Returns a list of (module, self_us, cumulative_us, depth) and the wall time in seconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stdout)
+        print(result.stderr)
+        raise RuntimeError("Importing app.py failed (is the .env filled in?).")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name.strip(), int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules, wall
+
+def profile_ready(timeout):
+    """
+    Starts app.py and times the Socket Mode and ready log lines. The bot is stopped afterwards.
+    Returns a dict of milestone name -> seconds since process start.
+    """
+    milestones = {}
+    patterns = {
+        "socket_connected": re.compile(r"Socket Mode connected ([\d.]+)s"),
+        "ready": re.compile(r"Ready to answer ([\d.]+)s"),
+        "warm_up": re.compile(r"Warm-up complete in ([\d.]+)s"),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-u", "app.py"],
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    deadline = time.time() + timeout
+    try:
+        for line in proc.stdout:
+            for name, pattern in patterns.items():
+                match = pattern.search(line)
+                if match:
+                    milestones[name] = float(match.group(1))
+            if len(milestones) == len(patterns) or time.time() > deadline:
+                break
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return milestones
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--top', type=int, default=15, help='Number of slowest top-level imports to list.')
+    cli_parser.add_argument('--import_budget', type=float, default=1.5, help='Maximum seconds allowed for importing app.py.')
+    cli_parser.add_argument('--full', action='store_true', help='Also start the bot and measure time-to-ready.')
+    cli_parser.add_argument('--ready_budget', type=float, default=30.0, help='Maximum seconds allowed until the bot is ready (with --full).')
+    args = cli_parser.parse_args()
+
+    failed = False
+    modules, wall = profile_imports()
+    imported = {name for name, _, _, _ in modules}
+
+    print(f"Importing app.py took {wall:.2f}s wall time ({len(modules)} modules).")
+    print("\nSlowest top-level imports (cumulative):")
+    top_level = sorted((m for m in modules if m[3] == 0), key=lambda m: m[2], reverse=True)
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"  {cumulative_us / 1e6:8.3f}s  {name}")
+
+    eager = [name for name in HEAVY_MODULES if name in imported]
+    if eager:
+        print(f"\nFAIL: heavy modules imported eagerly by app.py: {', '.join(eager)}")
+        failed = True
+    if wall > args.import_budget:
+        print(f"\nFAIL: import took {wall:.2f}s, budget is {args.import_budget:.2f}s")
+        failed = True
+
+    if args.full:
+        milestones = profile_ready(timeout=args.ready_budget * 2)
+        print("\nTime-to-ready:")
+        for name in ("socket_connected", "ready", "warm_up"):
+            value = milestones.get(name)
+            print(f"  {name:<17} {'n/a' if value is None else f'{value:.2f}s'}")
+        if milestones.get("ready") is None or milestones["ready"] > args.ready_budget:
+            print(f"\nFAIL: bot was not ready within {args.ready_budget:.2f}s")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
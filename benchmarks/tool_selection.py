@@ -0,0 +1,91 @@
+# Agent latency with one tool versus both tools.
+#
+# To run this on the command line from the repository root (a filled-in .env is required), enter:
+# python3 benchmarks/tool_selection.py                      # built-in sample questions
+# python3 benchmarks/tool_selection.py --repeat 5 --questions my_questions.txt
+#
+# Each question is sent to the Cortex Agent with both tools and with the tools chosen by
+# tool_selector.ToolSelector, alternating the order, and the median latencies are compared.
+# Questions the selector sends to both tools are reported but not timed twice.
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SAMPLE_QUESTIONS = [
+    "What are total sales by product category?",
+    "What is the average age of customers by gender?",
+    "How many transactions were there per month?",
+    "What does the S&P report say about retail?",
+    "Summarize the retail outlook document.",
+    "Why are sales dropping and what does the outlook say?",
+]
+
+def time_chat(cortex_app, question, tools):
+    start = time.perf_counter()
+    response = cortex_app.chat(question, tools=tools)
+    elapsed = time.perf_counter() - start
+    if response is None:
+        raise RuntimeError(f"The agent returned no response for '{question}'.")
+    return elapsed
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--questions', help='Text file with one question per line (default: built-in samples).')
+    cli_parser.add_argument('--repeat', type=int, default=3, help='Timed runs per question and tool set.')
+    cli_parser.add_argument('--model_file', default=os.path.join(REPO_ROOT, 'retail_sales_data.yaml'), help='Local copy of the semantic model.')
+    args = cli_parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(REPO_ROOT, '.env'))
+    import cortex_chat
+    from semantic_model import load_semantic_model
+    from tool_selector import ToolSelector, document_titles_from_dir
+
+    questions = SAMPLE_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    cortex_app = cortex_chat.CortexChat(
+        os.getenv("AGENT_ENDPOINT"),
+        os.getenv("SEARCH_SERVICE"),
+        os.getenv("SEMANTIC_MODEL"),
+        os.getenv("MODEL"),
+        os.getenv("ACCOUNT"),
+        os.getenv("DEMO_USER"),
+        os.getenv("RSA_PRIVATE_KEY_PATH")
+    )
+    selector = ToolSelector(load_semantic_model(args.model_file), document_titles_from_dir(os.path.join(REPO_ROOT, 'data')))
+
+    print(f"{'question':<55} {'tools':<14} {'both (s)':>9} {'one (s)':>9} {'saved':>7}")
+    savings = []
+    for question in questions:
+        tools = selector.select(question)
+        label = tools[0] if len(tools) == 1 else 'both'
+        both_times, one_times = [], []
+        for run in range(args.repeat):
+            if len(tools) == 1 and run % 2:
+                one_times.append(time_chat(cortex_app, question, tools))
+            both_times.append(time_chat(cortex_app, question, cortex_chat.ALL_TOOLS))
+            if len(tools) == 1 and not run % 2:
+                one_times.append(time_chat(cortex_app, question, tools))
+        both = statistics.median(both_times)
+        if one_times:
+            one = statistics.median(one_times)
+            savings.append((both - one) / both)
+            print(f"{question[:55]:<55} {label:<14} {both:9.2f} {one:9.2f} {100 * (both - one) / both:6.1f}%")
+        else:
+            print(f"{question[:55]:<55} {label:<14} {both:9.2f} {'-':>9} {'-':>7}")
+
+    if savings:
+        print(f"\nMedian latency saved on single-tool questions: {100 * statistics.median(savings):.1f}% "
+              f"({len(savings)}/{len(questions)} questions got one tool).")
+
+if __name__ == "__main__":
+    main()
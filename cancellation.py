@@ -0,0 +1,113 @@
+import threading
+
+DEBUG = False
+
+# SharedStore namespaces used to cancel requests owned by another worker process.
+CANCELLED_NAMESPACE = "cancelled"
+QUERY_IDS_NAMESPACE = "query_ids"
+CANCEL_TTL_SECONDS = 3600
+
+class CancelToken:
+    """
+    Cancellation state of one in-flight request, registered under several keys
+    ("<channel>:<ts>" of the user's question and of the bot's placeholder message).
+    Query handles attached to the token are aborted when it is cancelled.
+    """
+    def __init__(self, store, keys: list):
+        self.store = store
+        self.keys = keys
+        self._event = threading.Event()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def is_cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        # Another worker may have received the Cancel click or the deletion event
+        if any(self.store.get(CANCELLED_NAMESPACE, key) for key in self.keys):
+            self.cancel()
+            return True
+        return False
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            handles = list(self._handles)
+        for handle in handles:
+            handle.cancel()
+
+    def attach(self, handle):
+        """Tracks a query_runner.QueryHandle; its query id is published so any worker can abort it."""
+        handle.should_cancel = self.is_cancelled
+        previous_callback = handle.on_submitted
+
+        def publish_query_id(query_id):
+            for key in self.keys:
+                self.store.set(QUERY_IDS_NAMESPACE, key, query_id, ttl=CANCEL_TTL_SECONDS)
+            if previous_callback:
+                previous_callback(query_id)
+
+        handle.on_submitted = publish_query_id
+        with self._lock:
+            self._handles.append(handle)
+        if self._event.is_set():
+            handle.cancel()
+
+    def detach(self, handle):
+        with self._lock:
+            if handle in self._handles:
+                self._handles.remove(handle)
+
+class CancellationRegistry:
+    """
+    Looks up in-flight requests by message key so the "Cancel" button and Slack
+    message deletion can stop them, including requests owned by another worker.
+    """
+    def __init__(self, store):
+        self.store = store
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def open(self, keys: list) -> CancelToken:
+        token = CancelToken(self.store, keys)
+        with self._lock:
+            for key in keys:
+                self._tokens[key] = token
+        return token
+
+    def add_key(self, token: CancelToken, key: str):
+        """Registers an extra key (e.g. the placeholder ts, known only after posting it)."""
+        token.keys.append(key)
+        with self._lock:
+            self._tokens[key] = token
+
+    def close(self, token: CancelToken):
+        with self._lock:
+            for key in token.keys:
+                if self._tokens.get(key) is token:
+                    del self._tokens[key]
+        for key in token.keys:
+            self.store.delete(QUERY_IDS_NAMESPACE, key)
+
+    def cancel(self, key: str, conn=None) -> bool:
+        """
+        Cancels the request registered under key. Returns True if a request was found.
+        For a request owned by another worker, a cancel flag is left in the shared store and
+        its running query, if any, is aborted with conn.
+        """
+        with self._lock:
+            token = self._tokens.get(key)
+        if token is not None:
+            token.cancel()
+            if DEBUG:
+                print(f"CancellationRegistry: cancelled local request {key}.")
+            return True
+
+        self.store.set(CANCELLED_NAMESPACE, key, 1, ttl=CANCEL_TTL_SECONDS)
+        query_id = self.store.get(QUERY_IDS_NAMESPACE, key)
+        if query_id and conn is not None:
+            try:
+                conn.cursor().abort_query(query_id)
+            except Exception as e:
+                print(f"Warning: Could not cancel query {query_id}: {e}")
+        return query_id is not None
@@ -1,7 +1,12 @@
+import io
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
 import matplotlib
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import pandas as pd
-import os
 import requests
 import time
 
@@ -21,6 +26,134 @@ TEXT_COLOR = 'black'
 BACKGROUND_COLOR = 'white'
 GRID_COLOR = 'lightgray'
 
+# --- Chart Style and Templates ---
+# The style is applied once, as Matplotlib defaults, instead of on every chart: fonts, colors,
+# spines (top and right hidden, the others subtle) and the grid's look. Charts are drawn with
+# the object-oriented API on Figures taken from a pool, so the charts of concurrent requests
+# (worker threads, async_app.py) never share pyplot's global "current figure", and a Figure
+# and its canvas are reused instead of built for every chart.
+
+CHART_STYLE = {
+    'figure.facecolor': BACKGROUND_COLOR,
+    'savefig.facecolor': BACKGROUND_COLOR,
+    'axes.facecolor': BACKGROUND_COLOR,
+    'axes.edgecolor': GRID_COLOR,
+    'axes.spines.top': False,
+    'axes.spines.right': False,
+    'axes.labelsize': LABEL_FONTSIZE,
+    'axes.labelcolor': TEXT_COLOR,
+    'axes.titlesize': TITLE_FONTSIZE,
+    'axes.titlecolor': TEXT_COLOR,
+    'text.color': TEXT_COLOR,
+    'xtick.labelsize': TICK_FONTSIZE,
+    'ytick.labelsize': TICK_FONTSIZE,
+    'xtick.labelcolor': TEXT_COLOR,
+    'ytick.labelcolor': TEXT_COLOR,
+    'grid.color': GRID_COLOR,
+    'grid.linestyle': '--',
+    'grid.alpha': 0.7,
+    'legend.fontsize': LEGEND_FONTSIZE,
+    'legend.title_fontsize': LABEL_FONTSIZE,
+    'legend.labelcolor': TEXT_COLOR,
+    'legend.frameon': False,
+}
+matplotlib.rcParams.update(CHART_STYLE)
+
+# Figure size (inches) of each chart type
+FIGURE_SIZES = {
+    'pie': (10, 7),
+    'bar': (12, 7),
+    'line': (12, 7),
+    'multi_line': (14, 8),
+    'scatter': (14, 8),
+}
+LEGEND_LAYOUT_RECT = [0, 0, 0.85, 1] # Leaves room on the right for a legend outside the axes
+
+PIE_COLORS = matplotlib.colormaps['Set3'].colors # More vibrant discrete colormap
+
+@lru_cache(maxsize=64)
+def discrete_colors(name: str, count: int, fallback: str = 'plasma') -> tuple:
+    """
+    count colors sampled from the named colormap (e.g. 'Dark2' has 8 distinct colors), or from
+    fallback when there are more groups than that. Cached: the same few palettes are used again and again.
+    """
+    colormap = matplotlib.colormaps[name]
+    if count > colormap.N:
+        colormap = matplotlib.colormaps[fallback]
+    colormap = colormap.resampled(count)
+    return tuple(colormap(i) for i in range(count))
+
+SUBPLOT_PARAMS = ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')
+
+class FigurePool:
+    """
+    Idle Figures by size. figure(size) hands out a Figure no other chart is using (creating one
+    if none is idle) and takes it back cleared, keeping at most max_idle per size.
+    """
+    def __init__(self, max_idle: int = 2):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def figure(self, figsize: tuple):
+        with self._lock:
+            idle = self._idle.get(figsize)
+            fig = idle.pop() if idle else None
+        if fig is None:
+            fig = Figure(figsize=figsize)
+            FigureCanvasAgg(fig)
+        try:
+            yield fig
+        finally:
+            fig.clear()
+            # tight_layout moved the subplot margins; the next chart starts from the defaults again
+            fig.subplotpars.update(**{name: matplotlib.rcParams[f'figure.subplot.{name}'] for name in SUBPLOT_PARAMS})
+            with self._lock:
+                idle = self._idle.setdefault(figsize, [])
+                if len(idle) < self.max_idle:
+                    idle.append(fig)
+
+FIGURES = FigurePool()
+
+def save_jpg(fig, filename: str):
+    """Renders the figure to an in-memory JPEG (no shared file on disk) named for the upload."""
+    image = io.BytesIO()
+    fig.savefig(image, format='jpg')
+    image.seek(0)
+    image.name = filename
+    return image
+
+def rotate_x_labels(ax):
+    for label in ax.get_xticklabels():
+        label.set(rotation=45, ha='right')
+
+def warm_up():
+    """
+    Draws a small chart on a Figure of every size, using what real charts use (category and date
+    axes, markers, legend, pie, tight layout, the JPEG encoder), so the first charts after startup
+    don't pay for first-use initialization and each size has a Figure ready in the pool.
+    """
+    dates = pd.to_datetime(['2024-01-01', '2024-02-01', '2024-03-01'])
+    for name, figsize in FIGURE_SIZES.items():
+        with FIGURES.figure(figsize) as fig:
+            ax = fig.add_subplot()
+            if name == 'pie':
+                ax.pie([1, 2], labels=['A', 'B'], autopct='%1.1f%%', colors=PIE_COLORS, textprops={'fontsize': PIE_TEXT_FONTSIZE})
+                ax.axis('equal')
+            else:
+                ax.bar(['A', 'B'], [1, 2])
+                ax.scatter([0, 1], [1, 2], color=discrete_colors('Set1', 2)[0], s=80)
+                twin = ax.twiny() # A second x axis for the dates
+                twin.plot(dates, [1, 3, 2], marker='o', label='A', color=discrete_colors('Dark2', 2)[1])
+                twin.legend(title='Warm-up', bbox_to_anchor=(1.02, 1), loc='upper left')
+                ax.grid(True)
+            ax.set_title('Warm-up')
+            ax.set_xlabel('X')
+            rotate_x_labels(ax)
+            fig.tight_layout(rect=LEGEND_LAYOUT_RECT)
+            save_jpg(fig, 'warm_up.jpg')
+
 # --- Chart Selection and Plotting Functions ---
 
 def select_and_plot_chart(df, app_client):
@@ -109,8 +242,6 @@ def select_and_plot_chart(df, app_client):
 
 def plot_pie_chart(df, app_client):
     """Generates a pie chart for categorical vs. numeric data."""
-    plt.figure(figsize=(10, 7), facecolor=BACKGROUND_COLOR)
-
     if not pd.api.types.is_numeric_dtype(df.iloc[:, 1]):
         raise TypeError(f"Second column '{df.columns[1]}' is not numeric for pie chart values.")
     
@@ -121,30 +252,24 @@ def plot_pie_chart(df, app_client):
         print("Too many categories for a pie chart. Consider a bar chart instead.")
         raise ValueError("Too many categories for pie chart.")
 
-    plt.pie(df[df.columns[1]],
-            labels=df[df.columns[0]],
-            autopct='%1.1f%%',
-            startangle=90,
-            colors=plt.cm.Set3.colors, # More vibrant discrete colormap
-            textprops={'color':TEXT_COLOR, 'fontsize': PIE_TEXT_FONTSIZE})
-
-    plt.axis('equal')
-    plt.gca().set_facecolor(BACKGROUND_COLOR)
-    plt.title(f'Distribution of {df.columns[1]} by {df.columns[0]}', color=TEXT_COLOR, fontsize=TITLE_FONTSIZE)
-    plt.tight_layout()
+    with FIGURES.figure(FIGURE_SIZES['pie']) as fig:
+        ax = fig.add_subplot()
+        ax.pie(df[df.columns[1]],
+               labels=df[df.columns[0]],
+               autopct='%1.1f%%',
+               startangle=90,
+               colors=PIE_COLORS,
+               textprops={'color':TEXT_COLOR, 'fontsize': PIE_TEXT_FONTSIZE})
 
-    file_path_jpg = 'pie_chart.jpg'
-    plt.savefig(file_path_jpg, format='jpg')
-    file_size = os.path.getsize(file_path_jpg)
-    plt.clf() # Clear the current figure
-    plt.close() # Close the figure to free memory
+        ax.axis('equal')
+        ax.set_title(f'Distribution of {df.columns[1]} by {df.columns[0]}')
+        fig.tight_layout()
+        image = save_jpg(fig, 'pie_chart.jpg')
 
-    return upload_chart_to_slack(file_path_jpg, file_size, app_client)
+    return upload_chart_to_slack(image, app_client)
 
 def plot_bar_chart(df, app_client):
     """Generates a bar chart for categorical/time vs. numeric data."""
-    plt.figure(figsize=(12, 7), facecolor=BACKGROUND_COLOR)
-    
     x_col = df.columns[0]
     y_col = df.columns[1]
 
@@ -160,37 +285,21 @@ def plot_bar_chart(df, app_client):
         x_values = df_sorted[x_col]
         y_values = df_sorted[y_col]
 
-    plt.bar(x_values, y_values, color='#1f77b4') # Standard Matplotlib blue
-
-    plt.xlabel(x_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.ylabel(y_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.title(f'{y_col} by {x_col}', color=TEXT_COLOR, fontsize=TITLE_FONTSIZE)
-    plt.xticks(rotation=45, ha='right', color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.yticks(color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.grid(axis='y', linestyle='--', alpha=0.0, color=GRID_COLOR) # Removed y-axis grid for cleaner look
-    plt.gca().set_facecolor(BACKGROUND_COLOR)
-    
-    # Hide top and right spines for a cleaner look
-    ax = plt.gca()
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_color(GRID_COLOR)
-    ax.spines['left'].set_color(GRID_COLOR)
-
-    plt.tight_layout()
+    with FIGURES.figure(FIGURE_SIZES['bar']) as fig:
+        ax = fig.add_subplot()
+        ax.bar(x_values, y_values, color='#1f77b4') # Standard Matplotlib blue
 
-    file_path_jpg = 'bar_chart.jpg'
-    plt.savefig(file_path_jpg, format='jpg')
-    file_size = os.path.getsize(file_path_jpg)
-    plt.clf() # Clear the current figure
-    plt.close() # Close the figure to free memory
+        ax.set_xlabel(x_col)
+        ax.set_ylabel(y_col)
+        ax.set_title(f'{y_col} by {x_col}')
+        rotate_x_labels(ax) # No grid, for a cleaner look
+        fig.tight_layout()
+        image = save_jpg(fig, 'bar_chart.jpg')
 
-    return upload_chart_to_slack(file_path_jpg, file_size, app_client)
+    return upload_chart_to_slack(image, app_client)
 
 def plot_line_chart(df, x_col, y_col, app_client):
     """Generates a simple line chart for time-series data (Date vs. Numeric)."""
-    plt.figure(figsize=(12, 7), facecolor=BACKGROUND_COLOR)
-
     if not pd.api.types.is_datetime64_any_dtype(df[x_col]):
         raise TypeError(f"First column '{x_col}' is not a datetime for line chart.")
     if not pd.api.types.is_numeric_dtype(df[y_col]):
@@ -198,37 +307,22 @@ def plot_line_chart(df, x_col, y_col, app_client):
 
     df_sorted = df.sort_values(by=x_col)
 
-    plt.plot(df_sorted[x_col], df_sorted[y_col], marker='o', color='#2ca02c', linestyle='-') # Standard Matplotlib green
-
-    plt.xlabel(x_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.ylabel(y_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.title(f'{y_col} Over Time', color=TEXT_COLOR, fontsize=TITLE_FONTSIZE)
-    plt.xticks(rotation=45, ha='right', color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.yticks(color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.grid(True, linestyle='--', alpha=0.7, color=GRID_COLOR)
-    plt.gca().set_facecolor(BACKGROUND_COLOR)
-
-    # Hide top and right spines for a cleaner look
-    ax = plt.gca()
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_color(GRID_COLOR)
-    ax.spines['left'].set_color(GRID_COLOR)
+    with FIGURES.figure(FIGURE_SIZES['line']) as fig:
+        ax = fig.add_subplot()
+        ax.plot(df_sorted[x_col], df_sorted[y_col], marker='o', color='#2ca02c', linestyle='-') # Standard Matplotlib green
 
-    plt.tight_layout()
+        ax.set_xlabel(x_col)
+        ax.set_ylabel(y_col)
+        ax.set_title(f'{y_col} Over Time')
+        rotate_x_labels(ax)
+        ax.grid(True)
+        fig.tight_layout()
+        image = save_jpg(fig, 'line_chart.jpg')
 
-    file_path_jpg = 'line_chart.jpg'
-    plt.savefig(file_path_jpg, format='jpg')
-    file_size = os.path.getsize(file_path_jpg)
-    plt.clf() # Clear the current figure
-    plt.close() # Close the figure to free memory
-
-    return upload_chart_to_slack(file_path_jpg, file_size, app_client)
+    return upload_chart_to_slack(image, app_client)
 
 def plot_multi_line_chart(df, x_col, y_col, group_col, app_client):
     """Generates a multi-line chart tracking multiple series over time."""
-    plt.figure(figsize=(14, 8), facecolor=BACKGROUND_COLOR)
-
     if not pd.api.types.is_datetime64_any_dtype(df[x_col]):
         raise TypeError(f"X-axis column '{x_col}' is not datetime for multi-line chart.")
     if not pd.api.types.is_numeric_dtype(df[y_col]):
@@ -241,121 +335,113 @@ def plot_multi_line_chart(df, x_col, y_col, group_col, app_client):
     df_sorted[group_col] = df_sorted[group_col].astype(str) # Ensure group column is string for legend labels
     
     unique_groups = df_sorted[group_col].unique()
-    num_colors = len(unique_groups)
-
-    # Use vibrant discrete colormaps
-    colors = plt.cm.get_cmap('Dark2', num_colors) # 'Dark2' for up to 8 categories
-    if num_colors > 8: # Fallback for more categories
-        colors = plt.cm.get_cmap('plasma', num_colors)
-
-    for i, group_name in enumerate(unique_groups):
-        subset = df_sorted[df_sorted[group_col] == group_name]
-        plt.plot(subset[x_col], subset[y_col], marker='o', label=group_name, color=colors(i))
-
-    plt.xlabel(x_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.ylabel(y_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.title(f'{y_col} Over Time by {group_col}', color=TEXT_COLOR, fontsize=TITLE_FONTSIZE)
-    plt.xticks(rotation=45, ha='right', color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.yticks(color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.legend(title=group_col, bbox_to_anchor=(1.02, 1), loc='upper left', frameon=False, fontsize=LEGEND_FONTSIZE, title_fontsize=LABEL_FONTSIZE, labelcolor=TEXT_COLOR)
-    
-    plt.grid(True, linestyle='--', alpha=0.7, color=GRID_COLOR)
-    plt.gca().set_facecolor(BACKGROUND_COLOR)
+    # Use vibrant discrete colormaps: 'Dark2' for up to 8 categories, 'plasma' for more
+    colors = discrete_colors('Dark2', len(unique_groups))
 
-    # Hide top and right spines for a cleaner look
-    ax = plt.gca()
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_color(GRID_COLOR)
-    ax.spines['left'].set_color(GRID_COLOR)
-
-    plt.tight_layout(rect=[0, 0, 0.85, 1]) # Adjust layout for legend
+    with FIGURES.figure(FIGURE_SIZES['multi_line']) as fig:
+        ax = fig.add_subplot()
+        for i, group_name in enumerate(unique_groups):
+            subset = df_sorted[df_sorted[group_col] == group_name]
+            ax.plot(subset[x_col], subset[y_col], marker='o', label=group_name, color=colors[i])
 
-    file_path_jpg = 'multi_line_chart.jpg'
-    plt.savefig(file_path_jpg, format='jpg')
-    file_size = os.path.getsize(file_path_jpg)
-    plt.clf() # Clear the current figure
-    plt.close() # Close the figure to free memory
+        ax.set_xlabel(x_col)
+        ax.set_ylabel(y_col)
+        ax.set_title(f'{y_col} Over Time by {group_col}')
+        rotate_x_labels(ax)
+        ax.legend(title=group_col, bbox_to_anchor=(1.02, 1), loc='upper left')
+        ax.grid(True)
+        fig.tight_layout(rect=LEGEND_LAYOUT_RECT) # Adjust layout for legend
+        image = save_jpg(fig, 'multi_line_chart.jpg')
 
-    return upload_chart_to_slack(file_path_jpg, file_size, app_client)
+    return upload_chart_to_slack(image, app_client)
 
 def plot_scatter_chart(df, x_col, y_col, app_client, group_col=None):
     """Generates a scatter plot to show relationships between two numeric columns, with optional grouping."""
-    plt.figure(figsize=(14, 8), facecolor=BACKGROUND_COLOR)
-    
-    ax = plt.gca()
-    # Remove top and right bounding box (spines), keep bottom/left but make them subtle
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_color(GRID_COLOR)
-    ax.spines['left'].set_color(GRID_COLOR)
-
     if not pd.api.types.is_numeric_dtype(df[x_col]):
         raise TypeError(f"X-axis column '{x_col}' is not numeric for scatter plot.")
     if not pd.api.types.is_numeric_dtype(df[y_col]):
         raise TypeError(f"Y-axis column '{y_col}' is not numeric for scatter plot.")
 
-    if group_col and (pd.api.types.is_string_dtype(df[group_col]) or pd.api.types.is_categorical_dtype(df[group_col]) or pd.api.types.is_numeric_dtype(df[group_col])):
-        unique_groups = df[group_col].unique()
-        num_colors = len(unique_groups)
-        
-        # Use more vibrant discrete colormaps for grouped scatter
-        colors = plt.cm.get_cmap('Set1', num_colors) # 'Set1' for up to 9 categories
-        if num_colors > 9: # Fallback for more categories
-            colors = plt.cm.get_cmap('plasma', num_colors)
+    with FIGURES.figure(FIGURE_SIZES['scatter']) as fig:
+        ax = fig.add_subplot()
+        if group_col and (pd.api.types.is_string_dtype(df[group_col]) or pd.api.types.is_categorical_dtype(df[group_col]) or pd.api.types.is_numeric_dtype(df[group_col])):
+            unique_groups = df[group_col].unique()
+            # Use more vibrant discrete colormaps for grouped scatter: 'Set1' for up to 9 categories, 'plasma' for more
+            colors = discrete_colors('Set1', len(unique_groups))
+
+            for i, group_name in enumerate(unique_groups):
+                subset = df[df[group_col] == group_name]
+                ax.scatter(subset[x_col], subset[y_col], label=group_name, color=colors[i], alpha=0.8, s=80) # Increased marker size (s)
+
+            ax.legend(title=group_col, bbox_to_anchor=(1.02, 1), loc='upper left')
+            ax.set_title(f'Relationship between {y_col} and {x_col} by {group_col}')
+            layout_rect = LEGEND_LAYOUT_RECT # Adjust layout for legend
+        else:
+            # Simple scatter plot without grouping
+            ax.scatter(df[x_col], df[y_col], color='#FF7F0E', alpha=0.8, s=80) # More vibrant orange, increased marker size
+            ax.set_title(f'Relationship between {y_col} and {x_col}')
+            layout_rect = None
+
+        ax.set_xlabel(x_col)
+        ax.set_ylabel(y_col)
+        ax.grid(True)
+        fig.tight_layout(rect=layout_rect)
+        image = save_jpg(fig, 'scatter_chart.jpg')
+
+    return upload_chart_to_slack(image, app_client)
+
+def upload_chart_to_slack(image, app_client):
+    """
+    Helper function to upload a chart image (from save_jpg) to Slack and return its permalink.
+    """
+    img_url = upload_file_to_slack(image, image.name, len(image.getbuffer()), app_client, title="chart")
+    if img_url is not None:
+        time.sleep(2) # Give Slack time to process the image
+    return img_url
 
-        for i, group_name in enumerate(unique_groups):
-            subset = df[df[group_col] == group_name]
-            plt.scatter(subset[x_col], subset[y_col], label=group_name, color=colors(i), alpha=0.8, s=80) # Increased marker size (s)
-        
-        plt.legend(title=group_col, bbox_to_anchor=(1.02, 1), loc='upper left', frameon=False, fontsize=LEGEND_FONTSIZE, title_fontsize=LABEL_FONTSIZE, labelcolor=TEXT_COLOR)
-        plt.title(f'Relationship between {y_col} and {x_col} by {group_col}', color=TEXT_COLOR, fontsize=TITLE_FONTSIZE)
-        plt.tight_layout(rect=[0, 0, 0.85, 1]) # Adjust layout for legend
-    else:
-        # Simple scatter plot without grouping
-        plt.scatter(df[x_col], df[y_col], color='#FF7F0E', alpha=0.8, s=80) # More vibrant orange, increased marker size
-        plt.title(f'Relationship between {y_col} and {x_col}', color=TEXT_COLOR, fontsize=TITLE_FONTSIZE)
-        plt.tight_layout()
-
-    plt.xlabel(x_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.ylabel(y_col, color=TEXT_COLOR, fontsize=LABEL_FONTSIZE)
-    plt.xticks(color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.yticks(color=TEXT_COLOR, fontsize=TICK_FONTSIZE)
-    plt.grid(True, linestyle='--', alpha=0.7, color=GRID_COLOR)
-    plt.gca().set_facecolor(BACKGROUND_COLOR)
-
-    file_path_jpg = 'scatter_chart.jpg'
-    plt.savefig(file_path_jpg, format='jpg')
-    file_size = os.path.getsize(file_path_jpg)
-    plt.clf() # Clear the current figure
-    plt.close() # Close the figure to free memory
-
-    return upload_chart_to_slack(file_path_jpg, file_size, app_client)
-
-def upload_chart_to_slack(file_path_jpg, file_size, app_client):
+def upload_file_to_slack(file_obj, filename, file_size, app_client, title=None, channel_id=None, thread_ts=None, initial_comment=None):
     """
-    Helper function to upload the generated chart image to Slack and return its permalink.
+    Uploads an open binary file (read from its current position) to Slack and returns its permalink.
+    The body is streamed, so the file can be larger than memory (e.g. a spooled result export).
+    With channel_id (and thread_ts) the file is also shared there, with an optional comment.
     """
-    # NOTE: DEBUG variable is not accessible in this file directly unless passed or re-defined.
-    # For now, assuming DEBUG is handled by print statements or not critical for this helper.
-    
-    file_upload_url_response = app_client.files_getUploadURLExternal(filename=file_path_jpg,length=file_size)
-    # if DEBUG: # DEBUG is not directly available here
-    #     print(file_upload_url_response)
+    file_upload_url_response = app_client.files_getUploadURLExternal(filename=filename, length=file_size)
     file_upload_url = file_upload_url_response['upload_url']
     file_id = file_upload_url_response['file_id']
-    with open(file_path_jpg, 'rb') as f:
-        response = requests.post(file_upload_url, files={'file': f})
+    # A file object body is sent in blocks (a multipart form would be built in memory first)
+    response = requests.post(file_upload_url, data=file_obj, headers={'Content-Length': str(file_size)})
 
-    img_url = None
     if response.status_code != 200:
         print(f"File upload failed: {response.text}") # More informative error
-    else:
-        response = app_client.files_completeUploadExternal(files=[{"id":file_id, "title":"chart"}])
-        # if DEBUG: # DEBUG is not directly available here
-        #     print(response)
-        img_url = response['files'][0]['permalink']
-        time.sleep(2) # Give Slack time to process the image
-    
-    os.remove(file_path_jpg) # Clean up the local file after upload
-    return img_url
\ No newline at end of file
+        return None
+    share = {}
+    if channel_id:
+        share['channel_id'] = channel_id
+        if thread_ts:
+            share['thread_ts'] = thread_ts
+        if initial_comment:
+            share['initial_comment'] = initial_comment
+    response = app_client.files_completeUploadExternal(files=[{"id": file_id, "title": title or filename}], **share)
+    return response['files'][0]['permalink']
+
+async def upload_file_to_slack_async(session, file_obj, filename, file_size, app_client, title=None, channel_id=None, thread_ts=None, initial_comment=None):
+    """
+    upload_file_to_slack for asyncio (see async_app.py): app_client is an AsyncWebClient and the
+    body is streamed with the aiohttp session.
+    """
+    file_upload_url_response = await app_client.files_getUploadURLExternal(filename=filename, length=file_size)
+    file_upload_url = file_upload_url_response['upload_url']
+    file_id = file_upload_url_response['file_id']
+    async with session.post(file_upload_url, data=file_obj, headers={'Content-Length': str(file_size)}) as response:
+        if response.status != 200:
+            print(f"File upload failed: {await response.text()}")
+            return None
+    share = {}
+    if channel_id:
+        share['channel_id'] = channel_id
+        if thread_ts:
+            share['thread_ts'] = thread_ts
+        if initial_comment:
+            share['initial_comment'] = initial_comment
+    response = await app_client.files_completeUploadExternal(files=[{"id": file_id, "title": title or filename}], **share)
+    return response['files'][0]['permalink']
@@ -1,2 +1,4 @@
 DROP DATABASE IF EXISTS SLACK_DEMO;
-DROP WAREHOUSE IF EXISTS SLACK_S;
\ No newline at end of file
+DROP WAREHOUSE IF EXISTS SLACK_S;
+DROP WAREHOUSE IF EXISTS SLACK_XS;
+DROP WAREHOUSE IF EXISTS SLACK_M;
@@ -5,6 +5,11 @@ from generate_jwt import JWTGenerator
 
 DEBUG = False
 
+# Agent tool names, as referenced by tool_resources and by tool_selector.ToolSelector
+SEARCH_TOOL = "info_search"
+ANALYST_TOOL = "supply_chain"
+ALL_TOOLS = (SEARCH_TOOL, ANALYST_TOOL)
+
 class CortexChat:
     def __init__(self, 
             agent_url: str, 
@@ -24,20 +29,69 @@ class CortexChat:
         self.private_key_path = private_key_path
         self.jwt = JWTGenerator(self.account, self.user, self.private_key_path).get_token()
 
-    def _retrieve_response(self, query: str, limit=1) -> dict[str, any]:
+    def _retrieve_response(self, query: str, limit=1, history: list = None, on_sql=None, tools=None, context: str = None, on_bytes=None) -> dict[str, any]:
+        url, headers, data = self._build_request(query, limit, history, tools, context)
+        # stream=True so _parse_response sees each SSE event as it arrives
+        response = requests.post(url, headers=headers, json=data, stream=True)
+
+        if response.status_code == 401:  # Unauthorized - likely expired JWT
+            print("JWT has expired. Generating new JWT...")
+            # Generate new token
+            self.jwt = JWTGenerator(self.account, self.user, self.private_key_path).get_token()
+            # Retry the request with the new token
+            headers["Authorization"] = f"Bearer {self.jwt}"
+            print("New JWT generated. Sending new request to Cortex Agents API. Please wait...")
+            response = requests.post(url, headers=headers, json=data, stream=True)
+
+        if DEBUG:
+            print(response.text)
+        if response.status_code == 200:
+            return self._parse_response(response, on_sql, on_bytes)
+        else:
+            print(f"Error: Received status code {response.status_code} with message {response.json()}")
+            return None
+
+    def _build_request(self, query: str, limit=1, history: list = None, tools=None, context: str = None):
+        """Returns the agent URL, headers and JSON body for a question."""
         url = self.agent_url
+        tools = ALL_TOOLS if tools is None else tools
         headers = {
             'X-Snowflake-Authorization-Token-Type': 'KEYPAIR_JWT',
             'Content-Type': 'application/json',
             'Accept': 'application/json',
             'Authorization': f"Bearer {self.jwt}"
         }
+        tool_specs = {
+            SEARCH_TOOL: {
+                "tool_spec": {
+                    "type": "cortex_search",
+                    "name": SEARCH_TOOL
+                }
+            },
+            ANALYST_TOOL: {
+                "tool_spec": {
+                    "type": "cortex_analyst_text_to_sql",
+                    "name": ANALYST_TOOL
+                }
+            }
+        }
+        tool_resources = {
+            SEARCH_TOOL: {
+                "name": self.search_service,
+                "max_results": limit,
+                "title_column": "title",
+                "id_column": "relative_path",
+            },
+            ANALYST_TOOL: {
+                "semantic_model_file": self.semantic_model
+            }
+        }
         data = {
             "model": self.model,
-            "messages": [
+            "messages": (history or []) + [
             {
                 "role": "user",
-                "content": [
+                "content": ([{"type": "text", "text": context}] if context else []) + [
                     {
                         "type": "text",
                         "text": query
@@ -45,50 +99,10 @@ class CortexChat:
                 ]
             }
             ],
-            "tools": [
-                {
-                    "tool_spec": {
-                        "type": "cortex_search",
-                        "name": "info_search"
-                    }
-                },
-                {
-                    "tool_spec": {
-                        "type": "cortex_analyst_text_to_sql",
-                        "name": "supply_chain"
-                    }
-                }
-            ],
-            "tool_resources": {
-                "info_search": {
-                    "name": self.search_service,
-                    "max_results": limit,
-                    "title_column": "title",
-                    "id_column": "relative_path",
-                },
-                "supply_chain": {
-                    "semantic_model_file": self.semantic_model
-                }
-            },
+            "tools": [tool_specs[name] for name in tools],
+            "tool_resources": {name: tool_resources[name] for name in tools},
         }
-        response = requests.post(url, headers=headers, json=data)
-
-        if response.status_code == 401:  # Unauthorized - likely expired JWT
-            print("JWT has expired. Generating new JWT...")
-            # Generate new token
-            self.jwt = JWTGenerator(self.account, self.user, self.private_key_path).get_token()
-            # Retry the request with the new token
-            headers["Authorization"] = f"Bearer {self.jwt}"
-            print("New JWT generated. Sending new request to Cortex Agents API. Please wait...")
-            response = requests.post(url, headers=headers, json=data)
-
-        if DEBUG:
-            print(response.text)
-        if response.status_code == 200:
-            return self._parse_response(response)
-        else:
-            print(f"Error: Received status code {response.status_code} with message {response.json()}")
-            return None
+        return url, headers, data
 
     def _parse_delta_content(self,content: list) -> dict[str, any]:
         """Parse different types of content from the delta."""
@@ -130,27 +144,58 @@ class CortexChat:
         except json.JSONDecodeError:
             return {'type': 'error', 'message': f'Failed to parse: {line}'}
     
-    def _parse_response(self,response: requests.Response) -> dict[str, any]:
-        """Parse and print the SSE chat response with improved organization."""
-        accumulated = {
+    def _sql_from_tool_results(self, tool_results: list) -> str:
+        """Return the SQL carried by Cortex Analyst tool results, or '' if there is none."""
+        sql = ''
+        for result in tool_results:
+            for content in result.get('content', []):
+                if 'sql' in content.get('json', {}):
+                    sql = content['json']['sql']
+        return sql
+
+    def _parse_response(self,response: requests.Response, on_sql=None, on_bytes=None) -> dict[str, any]:
+        """
+        Parse and print the SSE chat response with improved organization.
+        on_sql, if given, is called with the SQL as soon as the Analyst tool result arrives,
+        before the rest of the stream (the agent's narrative text) has been read.
+        on_bytes, if given, is called with the number of stream bytes read so far.
+        """
+        accumulated = self._new_accumulated()
+        stream_bytes = 0
+        for line in response.iter_lines():
+            if on_bytes:
+                stream_bytes += len(line)
+                on_bytes(stream_bytes)
+            self._consume_line(accumulated, line, on_sql)
+        return self._summarize(accumulated)
+
+    def _new_accumulated(self) -> dict[str, any]:
+        return {
             'text': '',
             'tool_use': [],
             'tool_results': [],
             'other': []
         }
 
-        for line in response.iter_lines():
-            if line:
-                result = self._process_sse_line(line.decode('utf-8'))
-                
-                if result.get('type') == 'message':
-                    content = result['content']
-                    accumulated['text'] += content['text']
-                    accumulated['tool_use'].extend(content['tool_use'])
-                    accumulated['tool_results'].extend(content['tool_results'])
-                elif result.get('type') == 'other':
-                    accumulated['other'].append(result['data'])
+    def _consume_line(self, accumulated: dict, line: bytes, on_sql=None):
+        """Adds one SSE line of the stream to the accumulated response."""
+        if line:
+            result = self._process_sse_line(line.decode('utf-8'))
+            
+            if result.get('type') == 'message':
+                content = result['content']
+                accumulated['text'] += content['text']
+                accumulated['tool_use'].extend(content['tool_use'])
+                accumulated['tool_results'].extend(content['tool_results'])
+                if on_sql and content['tool_results']:
+                    streamed_sql = self._sql_from_tool_results(content['tool_results'])
+                    if streamed_sql:
+                        on_sql(streamed_sql)
+            elif result.get('type') == 'other':
+                accumulated['other'].append(result['data'])
 
+    def _summarize(self, accumulated: dict) -> dict[str, any]:
+        """Returns the text, SQL and citations of a fully read stream."""
         text = ''
         sql = ''
         citations = ''
@@ -192,6 +237,43 @@ class CortexChat:
 
         return {"text": text, "sql": sql, "citations": citations}
        
-    def chat(self, query: str) -> any:
-        response = self._retrieve_response(query)
+    def chat(self, query: str, history: list = None, on_sql=None, tools=None, context: str = None, on_bytes=None) -> any:
+        """
+        Sends the query to the agent. history is an optional list of prior messages
+        (see thread_history.ThreadHistory) sent ahead of the query for follow-up questions.
+        on_sql is an optional callback receiving the generated SQL as soon as it is streamed.
+        tools optionally restricts the tools offered to the agent (default: all of ALL_TOOLS).
+        context is optional text sent ahead of the query in the same message, e.g. local document excerpts.
+        on_bytes is an optional callback receiving the size of the stream read so far (see memory_budget.py).
+        """
+        response = self._retrieve_response(query, history=history, on_sql=on_sql, tools=tools, context=context, on_bytes=on_bytes)
         return response
+
+    async def chat_async(self, session, query: str, history: list = None, on_sql=None, tools=None, context: str = None, on_bytes=None) -> any:
+        """
+        chat() for asyncio (see async_app.py): the same request and stream handling over an
+        aiohttp.ClientSession, so waiting for the agent holds no thread.
+        """
+        url, headers, data = self._build_request(query, history=history, tools=tools, context=context)
+        for attempt in range(2):
+            async with session.post(url, headers=headers, json=data) as response:
+                if response.status == 401 and attempt == 0:  # Unauthorized - likely expired JWT
+                    print("JWT has expired. Generating new JWT...")
+                    self.jwt = JWTGenerator(self.account, self.user, self.private_key_path).get_token()
+                    headers["Authorization"] = f"Bearer {self.jwt}"
+                    continue
+                if response.status != 200:
+                    print(f"Error: Received status code {response.status} with message {await response.text()}")
+                    return None
+                accumulated = self._new_accumulated()
+                stream_bytes, pending = 0, b''
+                # Chunks rather than readline(): tool result lines can be longer than aiohttp's line limit
+                async for chunk in response.content.iter_any():
+                    stream_bytes += len(chunk)
+                    if on_bytes:
+                        on_bytes(stream_bytes)
+                    *lines, pending = (pending + chunk).split(b'\n')
+                    for line in lines:
+                        self._consume_line(accumulated, line.rstrip(b'\r'), on_sql)
+                self._consume_line(accumulated, pending.rstrip(b'\r'), on_sql)
+                return self._summarize(accumulated)
@@ -4,6 +4,9 @@ USE WAREHOUSE SLACK_S;
 create warehouse TEMP_MEDIUM warehouse_size = 'MEDIUM' auto_suspend = 60 auto_resume = true;
 use warehouse TEMP_MEDIUM;
 
+-- Note: this rebuilds the tables from scratch, re-parsing every PDF. After the first build, run
+-- `python3 pdf_ingest.py` instead to parse only new or changed PDFs and remove chunks of deleted ones.
+
 -- Pull the data from a stage into a table. 
 -- Note the use of cortex.parse_document function to parse the PDF files.
 create or replace table parse_pdfs as 
@@ -0,0 +1,253 @@
+# Parallel bulk loader for fact files described by the semantic model.
+#
+# Splits a CSV into gzip chunks (compressed on a thread pool), PUTs the chunks with several
+# threads, and loads them all with a single COPY INTO. The header and a sample of rows are
+# checked against the table's columns and data types in the semantic model before anything
+# is uploaded. Progress is kept in the work directory, so a failed run can be re-run with the
+# same arguments and continues where it stopped (COPY itself skips files it already loaded).
+#
+# To run this on the command line from the repository root (a filled-in .env is required), enter:
+# python3 csv_loader.py retail_sales_dataset.csv
+# python3 csv_loader.py big_sales.csv --rows_per_chunk 500000 --threads 8
+# python3 csv_loader.py retail_sales_dataset.csv --validate_only
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from semantic_model import load_semantic_model
+
+DEBUG = False
+
+csv.field_size_limit(sys.maxsize)
+
+class SchemaError(Exception):
+    """The CSV does not match the table in the semantic model."""
+
+# --- Schema Validation ---
+
+def _matches(value: str, data_type: str) -> bool:
+    """True if a CSV value can be loaded into a column of the given Snowflake type ('' loads as NULL)."""
+    if value == '':
+        return True
+    base = data_type.split('(')[0].strip().upper()
+    if base in ('NUMBER', 'DECIMAL', 'NUMERIC', 'INT', 'INTEGER', 'BIGINT', 'SMALLINT'):
+        scale = re.search(r',\s*(\d+)\s*\)', data_type)
+        pattern = r'[-+]?\d+' if not scale or scale.group(1) == '0' else r'[-+]?(\d+\.?\d*|\.\d+)'
+        return re.fullmatch(pattern, value) is not None
+    if base in ('FLOAT', 'DOUBLE', 'REAL'):
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    if base == 'DATE':
+        try:
+            date.fromisoformat(value)
+            return True
+        except ValueError:
+            return False
+    if base.startswith('TIMESTAMP'):
+        try:
+            datetime.fromisoformat(value)
+            return True
+        except ValueError:
+            return False
+    if base == 'BOOLEAN':
+        return value.lower() in ('true', 'false', '1', '0', 'yes', 'no')
+    return True # VARCHAR and anything else
+
+def validate_schema(header: list, sample: list, table) -> list:
+    """
+    Maps CSV header names to model columns (case-insensitive) and checks sample values against
+    the model's data types. Returns the model column names in CSV order; raises SchemaError.
+    """
+    columns = {name.upper(): column for name, column in table.columns.items()}
+    mapped = [name.strip().upper() for name in header]
+    unknown = [name for name, key in zip(header, mapped) if key not in columns]
+    missing = [name for name in columns if name not in mapped]
+    if unknown or missing:
+        raise SchemaError(f"CSV header does not match {table.name}: "
+                          f"unknown columns {unknown or 'none'}, missing columns {missing or 'none'}.")
+    for line_number, row in enumerate(sample, 2):
+        if len(row) != len(header):
+            raise SchemaError(f"Line {line_number} has {len(row)} fields, expected {len(header)}.")
+        for key, value in zip(mapped, row):
+            if not _matches(value, columns[key].data_type):
+                raise SchemaError(f"Line {line_number}: '{value}' is not a valid {columns[key].data_type} for {key}.")
+    return [columns[key].name for key in mapped]
+
+# --- Splitting ---
+
+def _compress(path: str, header: list, rows: list) -> int:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(rows)
+    temp_path = path + ".tmp"
+    with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=6) as f: # zlib releases the GIL
+        f.write(buffer.getvalue())
+    os.replace(temp_path, path) # Only complete chunks ever have the final name
+    return len(rows)
+
+def split_csv(csv_path: str, work_dir: str, rows_per_chunk: int, threads: int) -> dict:
+    """Writes chunk_NNNNN.csv.gz files with a header each. Returns {chunk file name: row count}."""
+    chunks, pending = {}, []
+    with open(csv_path, newline='', encoding='utf-8') as f, ThreadPoolExecutor(max_workers=threads) as pool:
+        reader = csv.reader(f)
+        header = next(reader)
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) == rows_per_chunk:
+                name = f"chunk_{len(pending):05d}.csv.gz"
+                pending.append((name, pool.submit(_compress, os.path.join(work_dir, name), header, batch)))
+                batch = []
+                if len(pending) > 2 * threads: # Bound the batches held in memory
+                    pending[-2 * threads - 1][1].result()
+        if batch:
+            name = f"chunk_{len(pending):05d}.csv.gz"
+            pending.append((name, pool.submit(_compress, os.path.join(work_dir, name), header, batch)))
+        for name, future in pending:
+            chunks[name] = future.result()
+    return chunks
+
+# --- Loader ---
+
+class CsvLoader:
+    def __init__(self, conn, table, stage: str, threads: int = 4):
+        self.conn = conn
+        self.table = table
+        self.stage = stage
+        self.threads = threads
+
+    def _execute(self, sql: str, params=None) -> list:
+        cursor = self.conn.cursor()
+        try:
+            if DEBUG:
+                print(f"CsvLoader: {sql}")
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else []
+        finally:
+            cursor.close()
+
+    def ensure_objects(self, column_names: list):
+        definitions = ", ".join(f"{name} {self.table.columns[name].data_type or 'VARCHAR'}" for name in column_names)
+        self._execute(f"CREATE TABLE IF NOT EXISTS {self.table.fqn} ({definitions})")
+        self._execute(f"CREATE STAGE IF NOT EXISTS {self.stage}")
+
+    def put(self, local_path: str, prefix: str):
+        # Chunks are already gzipped; PARALLEL splits large files across threads within one PUT
+        self._execute(f"PUT 'file://{os.path.abspath(local_path)}' @{self.stage}/{prefix}/ "
+                      "AUTO_COMPRESS=FALSE OVERWRITE=TRUE PARALLEL=4")
+
+    def put_all(self, work_dir: str, names: list, prefix: str, on_done):
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            futures = {pool.submit(self.put, os.path.join(work_dir, name), prefix): name for name in names}
+            for future, name in futures.items():
+                future.result()
+                on_done(name)
+
+    def copy(self, column_names: list, prefix: str) -> int:
+        rows = self._execute(
+            f"COPY INTO {self.table.fqn} ({', '.join(column_names)}) FROM @{self.stage}/{prefix}/ "
+            "FILE_FORMAT = (TYPE = CSV COMPRESSION = GZIP SKIP_HEADER = 1 FIELD_OPTIONALLY_ENCLOSED_BY = '\"' "
+            "EMPTY_FIELD_AS_NULL = TRUE) ON_ERROR = ABORT_STATEMENT"
+        )
+        # One result row per file: (file, status, rows_parsed, rows_loaded, ...); "Copy executed with 0 files" otherwise
+        return sum(row[3] for row in rows if len(row) > 3 and isinstance(row[3], int))
+
+def _file_key(csv_path: str) -> str:
+    """Identifies one version of the input file, so a changed file never resumes stale chunks."""
+    stat = os.stat(csv_path)
+    return hashlib.md5(f"{os.path.abspath(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
+def _save_progress(path: str, progress: dict):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(progress, f)
+    os.replace(path + ".tmp", path)
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('csv_path', help='CSV file to load (with a header row).')
+    cli_parser.add_argument('--model_file', default='retail_sales_data.yaml', help='Semantic model describing the table.')
+    cli_parser.add_argument('--table', default=None, help='Table name in the semantic model (default: the first table).')
+    cli_parser.add_argument('--stage', default='SLACK_DEMO.SLACK_SCHEMA.SLACK_LOAD', help='Internal stage for the chunks.')
+    cli_parser.add_argument('--rows_per_chunk', type=int, default=250000, help='Rows per compressed chunk.')
+    cli_parser.add_argument('--threads', type=int, default=4, help='Threads for compressing and for PUT.')
+    cli_parser.add_argument('--validate_rows', type=int, default=10000, help='Rows checked against the model data types.')
+    cli_parser.add_argument('--work_dir', default='.csv_loader', help='Local directory for chunks and progress.')
+    cli_parser.add_argument('--validate_only', action='store_true', help='Check the file against the model and stop.')
+    args = cli_parser.parse_args()
+
+    model = load_semantic_model(args.model_file)
+    table = model.table(args.table) if args.table else model.tables[0]
+    with open(args.csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        sample = [row for _, row in zip(range(args.validate_rows), reader)]
+    try:
+        column_names = validate_schema(header, sample, table)
+    except SchemaError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    print(f">>>>>>>>>> {args.csv_path} matches {table.fqn} ({len(column_names)} columns, {len(sample)} rows checked).")
+    if args.validate_only:
+        return
+
+    key = _file_key(args.csv_path)
+    work_dir = os.path.join(args.work_dir, key)
+    os.makedirs(work_dir, exist_ok=True)
+    progress_path = os.path.join(work_dir, "progress.json")
+    progress = {'chunks': None, 'uploaded': [], 'loaded': False}
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        print(f">>>>>>>>>> Resuming: {len(progress['uploaded'])} chunks already uploaded.")
+    if progress['loaded']:
+        print(">>>>>>>>>> This file was already loaded.")
+        return
+
+    start = time.perf_counter()
+    if progress['chunks'] is None:
+        progress['chunks'] = split_csv(args.csv_path, work_dir, args.rows_per_chunk, args.threads)
+        _save_progress(progress_path, progress)
+    total_rows = sum(progress['chunks'].values())
+    split_seconds = time.perf_counter() - start
+    print(f">>>>>>>>>> Split {total_rows} rows into {len(progress['chunks'])} chunks "
+          f"in {split_seconds:.1f}s ({total_rows / max(split_seconds, 1e-6):,.0f} rows/s).")
+
+    from snowflake_connect import connect_from_env
+    loader = CsvLoader(connect_from_env(), table, args.stage, args.threads)
+    loader.ensure_objects(column_names)
+
+    put_start = time.perf_counter()
+    remaining = [name for name in sorted(progress['chunks']) if name not in progress['uploaded']]
+    def uploaded(name):
+        progress['uploaded'].append(name)
+        _save_progress(progress_path, progress)
+    loader.put_all(work_dir, remaining, key, uploaded)
+    put_seconds = time.perf_counter() - put_start
+    put_rows = sum(progress['chunks'][name] for name in remaining)
+    print(f">>>>>>>>>> Uploaded {len(remaining)} chunks in {put_seconds:.1f}s ({put_rows / max(put_seconds, 1e-6):,.0f} rows/s).")
+
+    copy_start = time.perf_counter()
+    loaded_rows = loader.copy(column_names, key)
+    copy_seconds = time.perf_counter() - copy_start
+    progress['loaded'] = True
+    _save_progress(progress_path, progress)
+    print(f">>>>>>>>>> COPY loaded {loaded_rows} rows in {copy_seconds:.1f}s ({loaded_rows / max(copy_seconds, 1e-6):,.0f} rows/s).")
+    total_seconds = time.perf_counter() - start
+    print(f">>>>>>>>>> Done: {total_rows} rows in {total_seconds:.1f}s ({total_rows / max(total_seconds, 1e-6):,.0f} rows/s overall).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+from array import array
+from collections import Counter
+
+DEBUG = False
+
+# --- Local Document Index ---
+# A BM25 inverted index over the parsed_pdfs chunks behind the info_search Cortex Search
+# service. Document questions with a confident local match are answered by the agent from
+# the local excerpts, without a remote search call.
+#
+# On disk, each build is an immutable version directory so readers never see a half-written
+# index; CURRENT names the live one:
+#   meta.json      sources (relative_path -> HASH_AGG fingerprint), chunk lengths and offsets
+#   terms.json     term -> [first posting, document frequency]
+#   postings.bin   (chunk id, term frequency) uint32 pairs, memory-mapped for search
+#   chunks.jsonl   chunk title, path and text, memory-mapped and read only for hits
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'how', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'that', 'the', 'their', 'this', 'to', 'was', 'were', 'what', 'which', 'will',
+    'with', 'does', 'do', 'say', 'says', 'about', 'tell', 'me', 'report', 'document',
+}
+
+def tokenize(text: str) -> list:
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+class DocIndex:
+    """
+    Local BM25 index persisted in `directory`. sync() fetches only the documents whose
+    chunks changed in Snowflake; search() reads postings straight from the memory map.
+    """
+    def __init__(self, directory: str, table: str = "parsed_pdfs"):
+        self.directory = directory
+        self.table = table
+        self._lock = threading.Lock()
+        self._version = None
+        self._meta, self._terms = {'sources': {}, 'lengths': [], 'offsets': []}, {}
+        self._postings, self._chunks = None, None
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    # --- Loading ---
+
+    def _current_version(self) -> str:
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """Opens the newest version if another process (or sync) has published one."""
+        version = self._current_version()
+        if version is None or version == self._version:
+            return False
+        path = os.path.join(self.directory, version)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "terms.json")) as f:
+            terms = json.load(f)
+        postings, chunks = self._map(os.path.join(path, "postings.bin")), self._map(os.path.join(path, "chunks.jsonl"))
+        with self._lock:
+            self._version, self._meta, self._terms, self._postings, self._chunks = version, meta, terms, postings, chunks
+        if DEBUG:
+            print(f"DocIndex: opened version {version} ({len(meta['lengths'])} chunks, {len(terms)} terms).")
+        return True
+
+    @staticmethod
+    def _map(path: str):
+        """Read-only memory map of a file (None for an empty file, which mmap can't map)."""
+        if os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # The map stays valid after close
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._meta['lengths'])
+
+    def _chunk(self, chunk_id: int, chunks=None, meta=None) -> dict:
+        chunks = self._chunks if chunks is None else chunks
+        meta = self._meta if meta is None else meta
+        offset, length = meta['offsets'][chunk_id]
+        return json.loads(chunks[offset:offset + length])
+
+    # --- Sync and Build ---
+
+    def sync(self, conn) -> bool:
+        """
+        Brings the index up to date with the chunk table, fetching only documents whose
+        fingerprint changed. Returns True if a new version was published.
+        """
+        self.refresh() # Build on top of the newest version, whoever published it
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT RELATIVE_PATH, HASH_AGG(PAGE_CONTENT) FROM {self.table} GROUP BY RELATIVE_PATH")
+            remote = {path: str(fingerprint) for path, fingerprint in cursor.fetchall()}
+            local = self._meta['sources']
+            changed = [path for path, fingerprint in remote.items() if local.get(path) != fingerprint]
+            removed = [path for path in local if path not in remote]
+            if not changed and not removed:
+                return False
+            chunks = [chunk for chunk in self._all_chunks() if chunk['path'] in remote and chunk['path'] not in changed]
+            if changed:
+                placeholders = ", ".join(["%s"] * len(changed))
+                cursor.execute(
+                    f"SELECT RELATIVE_PATH, TITLE, PAGE_CONTENT FROM {self.table} WHERE RELATIVE_PATH IN ({placeholders})",
+                    changed
+                )
+                chunks += [{'path': path, 'title': title, 'text': text} for path, title, text in cursor.fetchall()]
+        finally:
+            cursor.close()
+        self.build(chunks, remote)
+        print(f">>>>>>>>>> Document index synced: {len(changed)} changed, {len(removed)} removed, {self.chunk_count} chunks.")
+        return True
+
+    def _all_chunks(self) -> list:
+        with self._lock:
+            chunks, meta = self._chunks, self._meta
+        return [self._chunk(chunk_id, chunks, meta) for chunk_id in range(len(meta['lengths']))]
+
+    def build(self, chunks: list, sources: dict):
+        """Writes a new index version from {'path', 'title', 'text'} chunks and publishes it."""
+        postings_by_term, lengths, offsets = {}, [], []
+        version = f"v{int(self._version[1:]) + 1 if self._version else 1}"
+        path = os.path.join(self.directory, version)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "chunks.jsonl"), 'wb') as f:
+            for chunk_id, chunk in enumerate(chunks):
+                tokens = tokenize(f"{chunk['title']} {chunk['text']}")
+                lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    postings_by_term.setdefault(term, array('I')).extend((chunk_id, tf))
+                line = json.dumps(chunk).encode('utf-8') + b"\n"
+                offsets.append((f.tell(), len(line)))
+                f.write(line)
+        terms, position = {}, 0
+        with open(os.path.join(path, "postings.bin"), 'wb') as f:
+            for term, postings in postings_by_term.items():
+                terms[term] = (position, len(postings) // 2)
+                postings.tofile(f)
+                position += len(postings) // 2
+        with open(os.path.join(path, "terms.json"), 'w') as f:
+            json.dump(terms, f)
+        with open(os.path.join(path, "meta.json"), 'w') as f:
+            json.dump({'sources': sources, 'lengths': lengths, 'offsets': offsets}, f)
+        temp_current = os.path.join(self.directory, "CURRENT.tmp")
+        with open(temp_current, 'w') as f:
+            f.write(version)
+        os.replace(temp_current, os.path.join(self.directory, "CURRENT"))
+        previous = self._version
+        self.refresh()
+        for name in os.listdir(self.directory): # Keep the previous version for readers that haven't refreshed yet
+            if name.startswith('v') and name not in (version, previous):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # --- Search ---
+
+    def search(self, query: str, k: int = 3) -> list:
+        """Returns up to k chunks as dicts with 'score', 'title', 'path' and 'text', best first."""
+        with self._lock:
+            meta, terms, postings, chunks = self._meta, self._terms, self._postings, self._chunks
+        count = len(meta['lengths'])
+        if count == 0 or postings is None:
+            return []
+        entries = memoryview(postings).cast('I')
+        average_length = sum(meta['lengths']) / count
+        scores = Counter()
+        for term in set(tokenize(query)):
+            if term not in terms:
+                continue
+            start, df = terms[term]
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for i in range(start, start + df):
+                chunk_id, tf = entries[2 * i], entries[2 * i + 1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * meta['lengths'][chunk_id] / average_length)
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        entries.release()
+        hits = []
+        for chunk_id, score in scores.most_common(k):
+            chunk = self._chunk(chunk_id, chunks, meta)
+            chunk['score'] = score
+            hits.append(chunk)
+        return hits
+
+def format_context(hits: list) -> str:
+    """Excerpts passed to the agent in place of a remote search call."""
+    excerpts = [f"[{i}] {hit['title']} ({hit['path']}):\n{hit['text']}" for i, hit in enumerate(hits, 1)]
+    return "Answer using these excerpts from the document library:\n\n" + "\n\n".join(excerpts)
+
+def format_citation(hit: dict) -> str:
+    """Same layout as the citations built from Cortex Search results in cortex_chat."""
+    return f"{hit['title']} \n {hit['text']} \n\n[Source: {hit['path']}]"
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEBUG = False
+
+# Message subtypes that carry a new question from a person. Everything else
+# (message_changed, message_deleted, bot_message, channel_join, ...) is dropped.
+ANSWERABLE_SUBTYPES = {None, "thread_broadcast", "file_share"}
+
+class EventFilter:
+    """
+    Cheap first stage for incoming message events, run before any agent or warehouse call.
+    Drops Slack retries and duplicate deliveries (a bounded, time-windowed seen-set keyed on
+    event_id and client_msg_id), non-question subtypes, and messages posted by bots,
+    and keeps counters of how much work was dropped.
+    """
+    def __init__(self, window_seconds: float = 600, max_entries: int = 10000, report_every: int = 100):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.report_every = report_every
+        self._seen = OrderedDict() # key -> first-seen time, oldest first
+        self._lock = threading.Lock()
+        self.counters = {
+            'received': 0,
+            'passed': 0,
+            'dropped_duplicate': 0,
+            'dropped_subtype': 0,
+            'dropped_bot': 0,
+            'dropped_empty': 0,
+            'dropped_claimed': 0,
+        }
+
+    def check(self, body: dict, bot_user_id: str = None) -> str:
+        """
+        Returns None if the event should be processed, otherwise the counter name of the drop reason.
+        """
+        event = body.get('event', {})
+        keys = [key for key in (body.get('event_id'), event.get('client_msg_id')) if key]
+
+        with self._lock:
+            self._count('received')
+            now = time.time()
+            self._expire(now)
+
+            if any(key in self._seen for key in keys):
+                return self._drop('dropped_duplicate')
+            for key in keys:
+                self._seen[key] = now
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+            if event.get('subtype') not in ANSWERABLE_SUBTYPES:
+                return self._drop('dropped_subtype')
+            if event.get('bot_id') or event.get('bot_profile') or (bot_user_id and event.get('user') == bot_user_id):
+                return self._drop('dropped_bot')
+            if not (event.get('text') or '').strip():
+                return self._drop('dropped_empty')
+
+            self._count('passed')
+            self._maybe_report()
+            return None
+
+    def record_drop(self, reason: str) -> str:
+        """Reclassifies an event that passed check() as dropped by a later stage (e.g. the shared-store claim)."""
+        with self._lock:
+            self.counters['passed'] -= 1
+            return self._drop(reason)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, seen_set_size=len(self._seen))
+
+    def _expire(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at > cutoff:
+                break
+            self._seen.popitem(last=False)
+
+    def _drop(self, reason: str) -> str:
+        self._count(reason)
+        if DEBUG:
+            print(f"EventFilter: dropped event ({reason}).")
+        self._maybe_report()
+        return reason
+
+    def _count(self, name: str):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def _maybe_report(self):
+        received = self.counters['received']
+        if not self.report_every or received % self.report_every:
+            return
+        dropped = received - self.counters['passed']
+        details = ", ".join(f"{k}={v}" for k, v in self.counters.items() if k.startswith('dropped_'))
+        print(f">>>>>>>>>> Event filter: {received} received, {self.counters['passed']} passed, {dropped} dropped ({details}).")
@@ -0,0 +1,242 @@
+import re
+import threading
+
+from semantic_model import SemanticModel, FACT, TIME_DIMENSION
+
+DEBUG = False
+
+# --- Fast-Path Intent Router ---
+# Common question shapes ("total sales by product category", "average age by gender",
+# "monthly quantity by product category for female") are matched against an index compiled
+# from the semantic model and answered with parameterized SQL, skipping the Cortex Agents
+# round trip. Any unknown word or ambiguous term sends the question to the agent instead.
+
+AGGREGATES = {
+    'SUM': ['total', 'sum', 'sum of', 'overall', 'total of'],
+    'AVG': ['average', 'avg', 'mean', 'average of'],
+    'MAX': ['maximum', 'max', 'highest', 'largest', 'biggest'],
+    'MIN': ['minimum', 'min', 'lowest', 'smallest'],
+    'COUNT': ['how many', 'number of', 'count of'],
+}
+AGGREGATE_PREFIX = {'SUM': 'TOTAL', 'AVG': 'AVG', 'MAX': 'MAX', 'MIN': 'MIN'}
+# With a grouping these usually rank the groups ("highest sales by gender" = the gender with the
+# highest total), not MAX per group, so such questions go to the agent.
+SUPERLATIVES = {'highest', 'largest', 'biggest', 'lowest', 'smallest'}
+
+# Extra everyday names for columns, applied only if the column exists in the model.
+COLUMN_ALIASES = {
+    'TOTAL_AMOUNT': ['sales', 'revenue', 'sales amount', 'spend', 'spending'],
+    'QUANTITY': ['units', 'units sold', 'items sold'],
+    'CUSTOMER_ID': ['customers', 'shoppers', 'buyers'],
+}
+# Words meaning "one row of the fact table", for COUNT(*) questions.
+ROW_NOUNS = ['transactions', 'orders', 'purchases', 'sales transactions', 'records']
+
+GROUP_MARKERS = ['by', 'per', 'for each', 'for every', 'across', 'broken down by', 'split by', 'grouped by', 'group by']
+TIME_GRAINS = {
+    'DAY': ['daily', 'by day', 'per day', 'over time', 'each day'],
+    'WEEK': ['weekly', 'by week', 'per week', 'each week'],
+    'MONTH': ['monthly', 'by month', 'per month', 'each month', 'month over month'],
+    'QUARTER': ['quarterly', 'by quarter', 'per quarter', 'each quarter'],
+    'YEAR': ['yearly', 'annual', 'annually', 'by year', 'per year', 'each year'],
+}
+STOPWORDS = {
+    'what', 'whats', 'is', 'are', 'was', 'were', 'the', 'a', 'an', 'of', 'show', 'me', 'give', 'list',
+    'tell', 'please', 'our', 'all', 'in', 'for', 'with', 'and', 'to', 'do', 'did', 'we', 'have', 'i',
+    'want', 'see', 'can', 'you', 'get', 'display', 'chart', 'plot', 'graph', 'breakdown', 'it', 'us',
+    'there', 'been', 'has', 'had', 'made', 'make', 'from', 'on', 'where',
+}
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> list:
+    """Lowercases, splits into words (underscores count as spaces) and strips plural endings."""
+    return [_stem(token) for token in re.findall(r"[a-z0-9]+", text.lower().replace('_', ' '))]
+
+_STOPWORD_STEMS = {_stem(word) for word in STOPWORDS}
+
+class _Trie:
+    """Token trie mapping phrases to the set of meanings they can have."""
+    def __init__(self):
+        self.root = {}
+
+    def add(self, phrase: str, meaning: tuple):
+        node = self.root
+        for token in tokenize(phrase):
+            node = node.setdefault(token, {})
+        node.setdefault(None, set()).add(meaning)
+
+    def longest_match(self, tokens: list, start: int):
+        """Returns (length, meanings) of the longest phrase starting at tokens[start], or (0, None)."""
+        node, best = self.root, (0, None)
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i])
+            if node is None:
+                break
+            if None in node:
+                best = (i - start + 1, node[None])
+        return best
+
+class FastPathRouter:
+    """
+    Compiles the semantic model's first table into a synonym trie plus a sample-value lookup,
+    and answers high-confidence common question shapes with parameterized SQL.
+    """
+    def __init__(self, model: SemanticModel, report_every: int = 50):
+        self.table = model.tables[0]
+        self.time_column = next(iter(self.table.columns_of_kind(TIME_DIMENSION)), None)
+        self.report_every = report_every
+        self.trie = _Trie()
+        self.counters = {'questions': 0, 'hits': 0, 'no_match': 0, 'ambiguous': 0}
+        self._lock = threading.Lock()
+        self._compile()
+
+    def _compile(self):
+        for column in self.table.columns.values():
+            for phrase in [column.name] + column.synonyms + COLUMN_ALIASES.get(column.name, []):
+                self.trie.add(phrase, ('column', column.name))
+            for value in column.sample_values:
+                if not column.is_numeric and column.kind != TIME_DIMENSION:
+                    self.trie.add(value, ('value', column.name, value))
+        for function, phrases in AGGREGATES.items():
+            for phrase in phrases:
+                self.trie.add(phrase, ('agg', function, phrase in SUPERLATIVES))
+        for phrase in ROW_NOUNS:
+            self.trie.add(phrase, ('rows',))
+        for phrase in GROUP_MARKERS:
+            self.trie.add(phrase, ('by', phrase))
+        if self.time_column is not None:
+            for grain, phrases in TIME_GRAINS.items():
+                for phrase in phrases:
+                    self.trie.add(phrase, ('grain', grain))
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            return self.counters['hits'] / self.counters['questions'] if self.counters['questions'] else 0.0
+
+    def route(self, question: str) -> dict:
+        """
+        Returns an agent-shaped response {"text", "sql", "citations"} for a question the fast path
+        is confident about, or None to fall back to the Cortex Agent.
+        """
+        sql, outcome = self._plan(question)
+        with self._lock:
+            self.counters['questions'] += 1
+            self.counters['hits' if sql else outcome] += 1
+            if self.report_every and self.counters['questions'] % self.report_every == 0:
+                print(f">>>>>>>>>> Fast path: {self.counters['hits']}/{self.counters['questions']} questions answered "
+                      f"locally ({100 * self.counters['hits'] / self.counters['questions']:.1f}%).")
+        if DEBUG:
+            print(f"FastPathRouter: {outcome} for '{question}'" + (f" -> {sql}" if sql else ""))
+        if not sql:
+            return None
+        return {"text": "", "sql": sql, "citations": "", "fast_path": True}
+
+    def _plan(self, question: str):
+        """Returns (sql, 'hit') or (None, reason)."""
+        tokens = tokenize(question)
+        items, i = [], 0
+        while i < len(tokens):
+            length, meanings = self.trie.longest_match(tokens, i)
+            if length == 0:
+                if tokens[i] in _STOPWORD_STEMS:
+                    i += 1
+                    continue
+                return None, 'no_match' # Unknown word: let the agent interpret it
+            if len(meanings) > 1:
+                return None, 'ambiguous' # e.g. "count" is both an aggregate and a QUANTITY synonym
+            items.append(next(iter(meanings)))
+            i += length
+
+        aggregates, measures, groups, filters, grains = set(), [], [], [], []
+        rows, grouping, superlative = False, None, False
+        for item in items:
+            kind = item[0]
+            if kind == 'by':
+                grouping = item[1]
+            elif kind == 'grain':
+                grains.append(item[1])
+                grouping = None
+            elif kind == 'column':
+                if grouping == 'per' and self.table.columns[item[1]].kind == FACT:
+                    return None, 'ambiguous' # "sales per unit" is a ratio, not a grouping
+                if grouping:
+                    groups.append(item[1])
+                else:
+                    measures.append(item[1])
+            elif kind == 'value':
+                filters.append((item[1], item[2]))
+                grouping = None
+            elif kind == 'agg':
+                aggregates.add(item[1])
+                superlative = superlative or item[2]
+                grouping = None
+            elif kind == 'rows':
+                rows = True
+                grouping = None
+
+        if len(aggregates) > 1 or len(measures) > 1 or len(grains) > 1 or (superlative and (groups or grains)):
+            return None, 'ambiguous'
+        aggregate = next(iter(aggregates), None)
+
+        # --- Select expression ---
+        if rows or aggregate == 'COUNT':
+            if measures and (rows or self.table.columns[measures[0]].kind == FACT):
+                return None, 'ambiguous'
+            if measures:
+                select_expr = f"COUNT(DISTINCT {self.table.columns[measures[0]].expr}) AS {measures[0]}_COUNT"
+            else:
+                select_expr = "COUNT(*) AS TRANSACTION_COUNT"
+            value_alias = select_expr.rsplit(' AS ', 1)[1]
+        else:
+            if not measures or not self.table.columns[measures[0]].is_numeric:
+                return None, 'no_match' if not measures else 'ambiguous'
+            column = self.table.columns[measures[0]]
+            aggregate = aggregate or 'SUM'
+            prefix = AGGREGATE_PREFIX[aggregate]
+            value_alias = column.name if column.name.startswith(prefix + '_') else f"{prefix}_{column.name}"
+            select_expr = f"{aggregate}({column.expr}) AS {value_alias}"
+
+        # --- Grouping: at most one time grouping plus at most one other column ---
+        group_exprs = [] # (expression, alias, is_time)
+        if grains:
+            grain = grains[0]
+            if grain == 'DAY':
+                group_exprs.append((self.time_column.expr, self.time_column.name, True))
+            else:
+                group_exprs.append((f"DATE_TRUNC('{grain}', {self.time_column.expr})", grain, True))
+        for name in groups:
+            column = self.table.columns[name]
+            group_exprs.append((column.expr, column.name, column.kind == TIME_DIMENSION))
+        time_groups = [g for g in group_exprs if g[2]]
+        if len(group_exprs) > 2 or len(time_groups) > 1 or (len(group_exprs) == 2 and not time_groups):
+            return None, 'ambiguous'
+        group_exprs.sort(key=lambda g: not g[2]) # Time first, matching the chart column conventions
+
+        # --- SQL ---
+        select_list = [f"{expr} AS {alias}" if expr != alias else expr for expr, alias, _ in group_exprs] + [select_expr]
+        sql = f"SELECT {', '.join(select_list)} FROM {self.table.fqn}"
+        if filters:
+            # Values of the same column are alternatives ("for male and female"), other columns narrow down
+            values_by_column = {}
+            for name, value in filters:
+                if value not in values_by_column.setdefault(name, []):
+                    values_by_column[name].append(value)
+            conditions = []
+            for name, values in values_by_column.items():
+                quoted = [f"'{value.replace(chr(39), chr(39) * 2)}'" for value in values]
+                expr = self.table.columns[name].expr
+                conditions.append(f"{expr} = {quoted[0]}" if len(quoted) == 1 else f"{expr} IN ({', '.join(quoted)})")
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_exprs:
+            sql += " GROUP BY " + ", ".join(expr for expr, _, _ in group_exprs)
+            if time_groups:
+                sql += " ORDER BY " + ", ".join(alias for _, alias, _ in group_exprs)
+            else:
+                sql += f" ORDER BY {value_alias} DESC NULLS LAST"
+        return sql, 'hit'
@@ -0,0 +1,50 @@
+DEBUG = False
+
+# --- DataFrame Compaction ---
+# Query results arrive with every string column as object (or str) dtype and every number as
+# int64/float64. Before a result is charted, cached or paged, low-cardinality strings
+# (PRODUCT_CATEGORY, GENDER) become categoricals and numbers are downcast where no value
+# changes (AGE and QUANTITY fit in int8). Each column keeps whichever form is smaller, so tiny
+# results, where a categorical's overhead outweighs its savings, are left as they are.
+
+MAX_CATEGORY_RATIO = 0.5 # A string column with more distinct values than this share of rows stays as strings
+
+def _compact_column(column, max_category_ratio: float):
+    import pandas as pd # Lazy import; normally already loaded by app.warm_up()
+
+    if isinstance(column.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(column):
+        return column
+    if pd.api.types.is_integer_dtype(column):
+        return pd.to_numeric(column, downcast='integer')
+    if pd.api.types.is_float_dtype(column):
+        narrow = column.astype('float32')
+        # Only if every value survives the round trip: a SUM of money in float32 would lose cents
+        if narrow.astype(column.dtype).equals(column):
+            return narrow
+        return column
+    if pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+        if pd.api.types.infer_dtype(column, skipna=True) != 'string':
+            return column # Other objects (Decimal, dates, dicts from VARIANT, ...) are left alone
+        if column.nunique() <= max_category_ratio * len(column):
+            return column.astype('category')
+    return column
+
+def compact_frame(df, max_category_ratio: float = MAX_CATEGORY_RATIO):
+    """
+    Returns df with smaller dtypes where they are lossless and actually save memory.
+    Values, column order and df.attrs (query_note, query_id) are unchanged.
+    """
+    compacted = df.copy(deep=False)
+    for i in range(len(df.columns)): # By position; generated SQL can repeat a column name
+        original = df.iloc[:, i]
+        column = _compact_column(original, max_category_ratio)
+        if column is not original and column.memory_usage(index=False, deep=True) < original.memory_usage(index=False, deep=True):
+            compacted.isetitem(i, column)
+    compacted.attrs = dict(df.attrs)
+    if DEBUG:
+        print(f"compact_frame: {frame_bytes(df)} -> {frame_bytes(compacted)} bytes ({list(compacted.dtypes.astype(str))}).")
+    return compacted
+
+def frame_bytes(df) -> int:
+    """Memory used by the DataFrame's columns, counting the strings themselves."""
+    return int(df.memory_usage(index=False, deep=True).sum())
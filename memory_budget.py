@@ -0,0 +1,210 @@
+import asyncio
+import sys
+import threading
+import time
+
+DEBUG = False
+
+# --- Memory Budget ---
+# One accountant per bot process. Each request is admitted with a lease that reserves a baseline
+# and then tracks the request's estimated footprint as it grows: rows fetched from the warehouse,
+# the agent's SSE stream, the result DataFrame, the chart figure. New requests wait while the
+# process is over budget and are turned away if no room frees up in time; a single request
+# growing past its own limit is stopped, so one huge result can't take the whole process down.
+
+FIGURE_BYTES = 1200 * 700 * 4 # RGBA canvas of a 12x7 inch chart at 100 dpi
+ROW_SAMPLE_SIZE = 200 # Rows measured to estimate the size of a fetched result
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a request can't be admitted in time, or grows past the per-request limit."""
+
+def estimate_rows_bytes(rows: list, total_rows: int) -> int:
+    """Estimates the memory of total_rows fetched row tuples from a sample of rows."""
+    sample = rows[:ROW_SAMPLE_SIZE]
+    if not sample:
+        return 0
+    sample_bytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+    return int(sample_bytes / len(sample) * total_rows)
+
+class MemoryLease:
+    """
+    One admitted request. track(component, nbytes) sets the current estimate for a part of the
+    request (a later call replaces it, 0 drops it); the lease counts as the larger of its
+    reservation and the sum of its components. Use as a context manager or call release().
+    """
+    def __init__(self, accountant, reserve: int):
+        self.accountant = accountant
+        self.reserve = reserve
+        self.components = {}
+        self.size = reserve
+        self.released = False
+
+    def track(self, component: str, nbytes: int):
+        self.accountant._track(self, component, max(0, int(nbytes)))
+
+    def tracker(self, component: str):
+        """Returns a callback taking a byte count, e.g. for CortexChat.chat(on_bytes=...)."""
+        return lambda nbytes: self.track(component, nbytes)
+
+    def release(self):
+        self.accountant._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def _resolve(future):
+    if not future.done(): # Timed out or cancelled while the wake-up was on its way
+        future.set_result(None)
+
+class MemoryAccountant:
+    """
+    Process-wide admission control on estimated memory. admit() returns a MemoryLease, waiting up to
+    queue_timeout seconds for room; the first request is always admitted, so work can't deadlock.
+    """
+    def __init__(self, budget_bytes: int, request_reserve: int = 32 * 1024**2,
+                 max_request_bytes: int = 512 * 1024**2, queue_timeout: float = 30.0):
+        self.budget_bytes = budget_bytes
+        self.request_reserve = request_reserve
+        self.max_request_bytes = max_request_bytes
+        self.queue_timeout = queue_timeout
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self.active = 0
+        self.waiting = 0
+        self.counters = {'admitted': 0, 'queued': 0, 'rejected': 0, 'too_large': 0}
+        self._condition = threading.Condition()
+        self._async_waiters = [] # (loop, future) of admit_async() calls waiting for room
+
+    def admit(self, on_queued=None) -> MemoryLease:
+        """
+        Admits a request, or raises MemoryBudgetExceeded after queue_timeout. on_queued, if given,
+        is called once (outside the lock) when the request has to wait, e.g. to tell the user.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        queued = False
+        with self._condition:
+            while self._full():
+                if not queued:
+                    queued = True
+                    self.counters['queued'] += 1
+                    self.waiting += 1
+                    if on_queued:
+                        self._condition.release()
+                        try:
+                            on_queued()
+                        finally:
+                            self._condition.acquire()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject()
+                self._condition.wait(remaining)
+            if queued:
+                self.waiting -= 1
+            return self._grant()
+
+    async def admit_async(self, on_queued=None) -> MemoryLease:
+        """
+        admit() for asyncio: the wait is a future that releases resolve, so a queued request holds
+        no thread that running requests need to finish. on_queued is a coroutine function here.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.queue_timeout
+        queued = False
+        while True:
+            with self._condition:
+                if not self._full():
+                    if queued:
+                        self.waiting -= 1
+                    return self._grant()
+                if queued and time.monotonic() >= deadline:
+                    self._reject()
+                room = loop.create_future()
+                self._async_waiters.append((loop, room))
+                if not queued:
+                    self.counters['queued'] += 1
+                    self.waiting += 1
+            try:
+                if not queued:
+                    queued = True
+                    if on_queued:
+                        try:
+                            await on_queued()
+                        except Exception as e:
+                            print(f"Warning: Could not report the queued request: {e}")
+                await asyncio.wait_for(room, max(0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                with self._condition:
+                    self.waiting -= 1
+                raise
+
+    def _full(self) -> bool:
+        return self.active > 0 and self.used_bytes + self.request_reserve > self.budget_bytes
+
+    def _grant(self) -> MemoryLease:
+        """With the condition held: admits a request."""
+        lease = MemoryLease(self, self.request_reserve)
+        self.active += 1
+        self.counters['admitted'] += 1
+        self._add(lease.size)
+        return lease
+
+    def _reject(self):
+        """With the condition held: gives up on a queued request."""
+        self.waiting -= 1
+        self.counters['rejected'] += 1
+        print(f"Warning: Request rejected, memory budget in use ({self.stats()}).")
+        raise MemoryBudgetExceeded("The bot is busy with other large requests right now.")
+
+    def _notify(self):
+        """With the condition held: wakes every waiting admit() and admit_async() to check for room."""
+        self._condition.notify_all()
+        for loop, room in self._async_waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, room)
+        self._async_waiters.clear()
+
+    def _track(self, lease: MemoryLease, component: str, nbytes: int):
+        with self._condition:
+            if lease.released:
+                return
+            if nbytes:
+                lease.components[component] = nbytes
+            else:
+                lease.components.pop(component, None)
+            size = max(lease.reserve, sum(lease.components.values()))
+            self._add(size - lease.size)
+            shrunk = size < lease.size
+            lease.size = size
+            if shrunk:
+                self._notify()
+            if size > self.max_request_bytes:
+                self.counters['too_large'] += 1
+                print(f"Warning: Request stopped at about {size / 1024**2:.0f} MB ({dict(lease.components)}).")
+                raise MemoryBudgetExceeded("This request needs more memory than a single answer is allowed.")
+
+    def _release(self, lease: MemoryLease):
+        with self._condition:
+            if lease.released:
+                return
+            lease.released = True
+            self.active -= 1
+            self._add(-lease.size)
+            self._notify()
+
+    def _add(self, nbytes: int):
+        self.used_bytes += nbytes
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+        if DEBUG:
+            print(f"MemoryAccountant: {self.used_bytes / 1024**2:.1f} MB in use by {self.active} requests.")
+
+    def stats(self) -> dict:
+        """Counters plus current and peak estimated usage, for logging."""
+        return dict(self.counters, active=self.active, waiting=self.waiting,
+                    used_mb=round(self.used_bytes / 1024**2, 1), peak_mb=round(self.peak_bytes / 1024**2, 1),
+                    budget_mb=round(self.budget_bytes / 1024**2, 1))
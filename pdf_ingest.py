@@ -0,0 +1,252 @@
+# Incremental PDF ingestion for the info_search corpus.
+#
+# Instead of rebuilding parse_pdfs / parsed_pdfs with CREATE OR REPLACE (cortex_search_service.sql),
+# this compares the stage directory (path, md5, last_modified) with a manifest table, parses and
+# chunks only new or changed PDFs, MERGEs their chunks into parsed_pdfs and deletes the chunks of
+# removed files. The Cortex Search service picks up the changes within its target lag.
+#
+# To run this on the command line from the repository root (a filled-in .env is required), enter:
+# python3 pdf_ingest.py                 # ingest changes from @SLACK_PDFS
+# python3 pdf_ingest.py --dry_run       # only show what would change
+# python3 pdf_ingest.py --sqlite ingest_test.db --stage_dir data    # local SQLite stand-in
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+DEBUG = False
+
+CHUNK_SIZE = 750 # Same settings as SPLIT_TEXT_RECURSIVE_CHARACTER in cortex_search_service.sql
+CHUNK_OVERLAP = 200
+
+def title_for(relative_path: str) -> str:
+    return re.sub(r'\.pdf$', '', relative_path)
+
+def diff_stage(stage: dict, manifest: dict):
+    """
+    Compares {path: (md5, last_modified)} listings. Returns (new_or_changed, removed) paths.
+    A file counts as changed when its md5 differs; last_modified is only used when a stage
+    reports no md5.
+    """
+    changed = []
+    for path, (md5, last_modified) in stage.items():
+        known = manifest.get(path)
+        if known is None or (md5 and md5 != known[0]) or (not md5 and str(last_modified) != str(known[1])):
+            changed.append(path)
+    removed = [path for path in manifest if path not in stage]
+    return sorted(changed), sorted(removed)
+
+class SnowflakeBackend:
+    """SQL layer for Snowflake: PARSE_DOCUMENT and SPLIT_TEXT_RECURSIVE_CHARACTER run in the warehouse."""
+    def __init__(self, conn, stage: str = "SLACK_DEMO.SLACK_SCHEMA.SLACK_PDFS",
+                 chunks_table: str = "parsed_pdfs", manifest_table: str = "pdf_manifest"):
+        self.conn = conn
+        self.stage = stage
+        self.chunks_table = chunks_table
+        self.manifest_table = manifest_table
+
+    def _execute(self, sql: str, params=None) -> list:
+        cursor = self.conn.cursor()
+        try:
+            if DEBUG:
+                print(f"SnowflakeBackend: {sql}")
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else []
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _placeholders(values: list) -> str:
+        return ", ".join(["%s"] * len(values))
+
+    def ensure_tables(self):
+        self._execute(f"CREATE TABLE IF NOT EXISTS {self.manifest_table} ("
+                      "RELATIVE_PATH VARCHAR PRIMARY KEY, MD5 VARCHAR, LAST_MODIFIED VARCHAR, INGESTED_AT TIMESTAMP_LTZ)")
+        self._execute(f"CREATE TABLE IF NOT EXISTS {self.chunks_table} ("
+                      "PAGE_CONTENT VARCHAR, TITLE VARCHAR, INPUT_STAGE VARCHAR, RELATIVE_PATH VARCHAR, CHUNK_INDEX NUMBER)")
+        # Tables created by cortex_search_service.sql have no chunk index; MERGE needs one as part of the key
+        self._execute(f"ALTER TABLE {self.chunks_table} ADD COLUMN IF NOT EXISTS CHUNK_INDEX NUMBER")
+
+    def list_stage(self) -> dict:
+        self._execute(f"ALTER STAGE {self.stage} REFRESH")
+        rows = self._execute(f"SELECT RELATIVE_PATH, MD5, LAST_MODIFIED FROM DIRECTORY(@{self.stage}) "
+                             "WHERE RELATIVE_PATH ILIKE '%.pdf'")
+        return {path: (md5, str(last_modified)) for path, md5, last_modified in rows}
+
+    def load_manifest(self) -> dict:
+        rows = self._execute(f"SELECT RELATIVE_PATH, MD5, LAST_MODIFIED FROM {self.manifest_table}")
+        return {path: (md5, last_modified) for path, md5, last_modified in rows}
+
+    def ingest(self, paths: list) -> int:
+        """Parses and chunks the given files, MERGEs the chunks and drops chunks past the new end."""
+        self._execute(
+            "CREATE OR REPLACE TEMPORARY TABLE pdf_chunks_staging AS "
+            "WITH parsed AS ("
+            f" SELECT RELATIVE_PATH, SNOWFLAKE.CORTEX.PARSE_DOCUMENT(@{self.stage}, RELATIVE_PATH, {{'mode': 'LAYOUT'}}) AS DATA"
+            f" FROM DIRECTORY(@{self.stage}) WHERE RELATIVE_PATH IN ({self._placeholders(paths)})), "
+            "chunked AS ("
+            f" SELECT RELATIVE_PATH, SNOWFLAKE.CORTEX.SPLIT_TEXT_RECURSIVE_CHARACTER(TO_VARIANT(DATA):content, 'MARKDOWN', {CHUNK_SIZE}, {CHUNK_OVERLAP}) AS CHUNKS"
+            " FROM parsed WHERE TO_VARIANT(DATA):content IS NOT NULL) "
+            "SELECT TO_VARCHAR(c.value) AS PAGE_CONTENT, REGEXP_REPLACE(RELATIVE_PATH, '\\\\.pdf$', '') AS TITLE,"
+            f" '{self.stage}' AS INPUT_STAGE, RELATIVE_PATH, c.index AS CHUNK_INDEX"
+            " FROM chunked p, LATERAL FLATTEN(INPUT => p.CHUNKS) c",
+            paths
+        )
+        self._execute(
+            f"MERGE INTO {self.chunks_table} t USING pdf_chunks_staging s "
+            "ON t.RELATIVE_PATH = s.RELATIVE_PATH AND t.CHUNK_INDEX = s.CHUNK_INDEX "
+            "WHEN MATCHED AND t.PAGE_CONTENT IS DISTINCT FROM s.PAGE_CONTENT THEN UPDATE SET "
+            "PAGE_CONTENT = s.PAGE_CONTENT, TITLE = s.TITLE, INPUT_STAGE = s.INPUT_STAGE "
+            "WHEN NOT MATCHED THEN INSERT (PAGE_CONTENT, TITLE, INPUT_STAGE, RELATIVE_PATH, CHUNK_INDEX) "
+            "VALUES (s.PAGE_CONTENT, s.TITLE, s.INPUT_STAGE, s.RELATIVE_PATH, s.CHUNK_INDEX)"
+        )
+        # A shorter new version leaves old chunks past its end; rows from a full rebuild have no index
+        self._execute(
+            f"DELETE FROM {self.chunks_table} t USING "
+            "(SELECT RELATIVE_PATH, MAX(CHUNK_INDEX) AS LAST_INDEX FROM pdf_chunks_staging GROUP BY RELATIVE_PATH) s "
+            "WHERE t.RELATIVE_PATH = s.RELATIVE_PATH AND (t.CHUNK_INDEX > s.LAST_INDEX OR t.CHUNK_INDEX IS NULL)"
+        )
+        return self._execute("SELECT COUNT(*) FROM pdf_chunks_staging")[0][0]
+
+    def delete_documents(self, paths: list):
+        self._execute(f"DELETE FROM {self.chunks_table} WHERE RELATIVE_PATH IN ({self._placeholders(paths)})", paths)
+        self._execute(f"DELETE FROM {self.manifest_table} WHERE RELATIVE_PATH IN ({self._placeholders(paths)})", paths)
+
+    def record(self, path: str, md5: str, last_modified: str):
+        self._execute(
+            f"MERGE INTO {self.manifest_table} t USING (SELECT %s AS RELATIVE_PATH, %s AS MD5, %s AS LAST_MODIFIED) s "
+            "ON t.RELATIVE_PATH = s.RELATIVE_PATH "
+            "WHEN MATCHED THEN UPDATE SET MD5 = s.MD5, LAST_MODIFIED = s.LAST_MODIFIED, INGESTED_AT = CURRENT_TIMESTAMP() "
+            "WHEN NOT MATCHED THEN INSERT (RELATIVE_PATH, MD5, LAST_MODIFIED, INGESTED_AT) "
+            "VALUES (s.RELATIVE_PATH, s.MD5, s.LAST_MODIFIED, CURRENT_TIMESTAMP())",
+            (path, md5, last_modified)
+        )
+
+class SQLiteBackend:
+    """
+    Local stand-in with the same interface: a directory plays the stage, files are read as text
+    and split in Python, and upserts stand in for MERGE. Used to exercise the diff logic offline.
+    """
+    def __init__(self, path: str, stage_dir: str, chunks_table: str = "parsed_pdfs", manifest_table: str = "pdf_manifest"):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.stage_dir = stage_dir
+        self.chunks_table = chunks_table
+        self.manifest_table = manifest_table
+
+    def ensure_tables(self):
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.manifest_table} ("
+                          "RELATIVE_PATH TEXT PRIMARY KEY, MD5 TEXT, LAST_MODIFIED TEXT, INGESTED_AT TEXT)")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.chunks_table} (PAGE_CONTENT TEXT, TITLE TEXT, INPUT_STAGE TEXT,"
+                          " RELATIVE_PATH TEXT, CHUNK_INDEX INTEGER, PRIMARY KEY (RELATIVE_PATH, CHUNK_INDEX))")
+
+    def list_stage(self) -> dict:
+        listing = {}
+        for name in sorted(os.listdir(self.stage_dir)):
+            full_path = os.path.join(self.stage_dir, name)
+            if os.path.isfile(full_path) and name.lower().endswith('.pdf'):
+                with open(full_path, 'rb') as f:
+                    md5 = hashlib.md5(f.read()).hexdigest()
+                modified = datetime.fromtimestamp(os.path.getmtime(full_path), timezone.utc).isoformat()
+                listing[name] = (md5, modified)
+        return listing
+
+    def load_manifest(self) -> dict:
+        rows = self.conn.execute(f"SELECT RELATIVE_PATH, MD5, LAST_MODIFIED FROM {self.manifest_table}").fetchall()
+        return {path: (md5, last_modified) for path, md5, last_modified in rows}
+
+    def ingest(self, paths: list) -> int:
+        total = 0
+        for path in paths:
+            with open(os.path.join(self.stage_dir, path), 'rb') as f:
+                text = f.read().decode('utf-8', errors='ignore')
+            chunks = split_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                f"INSERT INTO {self.chunks_table} (PAGE_CONTENT, TITLE, INPUT_STAGE, RELATIVE_PATH, CHUNK_INDEX) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (RELATIVE_PATH, CHUNK_INDEX) DO UPDATE SET "
+                "PAGE_CONTENT = excluded.PAGE_CONTENT, TITLE = excluded.TITLE",
+                [(chunk, title_for(path), self.stage_dir, path, index) for index, chunk in enumerate(chunks)]
+            )
+            self.conn.execute(f"DELETE FROM {self.chunks_table} WHERE RELATIVE_PATH = ? AND CHUNK_INDEX >= ?", (path, len(chunks)))
+            self.conn.execute("COMMIT")
+            total += len(chunks)
+        return total
+
+    def delete_documents(self, paths: list):
+        for path in paths:
+            self.conn.execute(f"DELETE FROM {self.chunks_table} WHERE RELATIVE_PATH = ?", (path,))
+            self.conn.execute(f"DELETE FROM {self.manifest_table} WHERE RELATIVE_PATH = ?", (path,))
+
+    def record(self, path: str, md5: str, last_modified: str):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {self.manifest_table} (RELATIVE_PATH, MD5, LAST_MODIFIED, INGESTED_AT) VALUES (?, ?, ?, ?)",
+            (path, md5, last_modified, datetime.now(timezone.utc).isoformat())
+        )
+
+def split_text(text: str, chunk_size: int, overlap: int) -> list:
+    """Simple recursive character splitter (paragraphs, then lines, then words) with overlap."""
+    pieces = [text]
+    for separator in ("\n\n", "\n", " "):
+        pieces = [part for piece in pieces
+                  for part in (piece.split(separator) if len(piece) > chunk_size else [piece])]
+    chunks, current = [], ""
+    for piece in (p.strip() for p in pieces):
+        if not piece:
+            continue
+        if current and len(current) + len(piece) + 1 > chunk_size:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else ""
+        current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+def run(backend, dry_run: bool = False) -> dict:
+    """Ingests changes from the stage. Returns counts of changed, removed and ingested chunks."""
+    backend.ensure_tables()
+    stage = backend.list_stage()
+    changed, removed = diff_stage(stage, backend.load_manifest())
+    print(f">>>>>>>>>> {len(stage)} PDFs on the stage: {len(changed)} new or changed, {len(removed)} removed.")
+    for path in changed:
+        print(f"  + {path}")
+    for path in removed:
+        print(f"  - {path}")
+    if dry_run:
+        return {'changed': len(changed), 'removed': len(removed), 'chunks': 0}
+
+    chunks = 0
+    if removed:
+        backend.delete_documents(removed)
+    for path in changed:
+        # One file at a time, recorded in the manifest as it completes, so a failed run resumes where it stopped
+        start = time.perf_counter()
+        count = backend.ingest([path])
+        md5, last_modified = stage[path]
+        backend.record(path, md5, last_modified)
+        chunks += count
+        print(f">>>>>>>>>> Ingested {path}: {count} chunks in {time.perf_counter() - start:.1f}s.")
+    return {'changed': len(changed), 'removed': len(removed), 'chunks': chunks}
+
+def main():
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--dry_run', action='store_true', help='Only list new, changed and removed files.')
+    cli_parser.add_argument('--stage', default='SLACK_DEMO.SLACK_SCHEMA.SLACK_PDFS', help='Snowflake stage holding the PDFs.')
+    cli_parser.add_argument('--warehouse', default=None, help='Warehouse for parsing (default: WAREHOUSE from .env).')
+    cli_parser.add_argument('--sqlite', default=None, help='Use a local SQLite database instead of Snowflake.')
+    cli_parser.add_argument('--stage_dir', default='data', help='Directory used as the stage with --sqlite.')
+    args = cli_parser.parse_args()
+
+    if args.sqlite:
+        backend = SQLiteBackend(args.sqlite, args.stage_dir)
+    else:
+        from snowflake_connect import connect_from_env
+        backend = SnowflakeBackend(connect_from_env(warehouse=args.warehouse), stage=args.stage)
+    result = run(backend, dry_run=args.dry_run)
+    print(f">>>>>>>>>> Done: {result['changed']} files ingested ({result['chunks']} chunks), {result['removed']} removed.")
+
+if __name__ == "__main__":
+    main()
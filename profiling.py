@@ -0,0 +1,226 @@
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+DEBUG = False
+
+# --- On-Demand Profiling ---
+# A running bot can be profiled without a restart: an admin's /profile command or SIGUSR1 starts
+# a session for some seconds or for the next few requests. During a session a sampler thread
+# records, every SAMPLE_INTERVAL, where each thread is. It is a wall-clock sampler, so time spent
+# waiting on Snowflake, the agent or Slack shows up as the frames doing the waiting. Stacks of
+# threads inside a request are rooted at their stages ([agent], [display];[query], ...), other
+# threads at their thread name. tracemalloc runs for the session too, and its growth by source
+# line is written at the end.
+# Output is written to the profile directory as folded stacks (one "frame;frame;... count" line
+# per stack, for flamegraph.pl, speedscope or inferno), a summary with time per stage, and the
+# memory growth. Off, the only cost is stage() checking one attribute.
+
+SAMPLE_INTERVAL = 0.01 # Seconds between samples (100 Hz)
+MAX_SESSION_SECONDS = 600 # A session for "the next N requests" ends after this even if they don't come
+TOP_MEMORY_LINES = 25 # Source lines listed in the memory growth
+TOP_FRAMES = 20 # Frames listed in the summary
+
+class _NoStage:
+    """What stage() returns while no session runs: does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NO_STAGE = _NoStage()
+
+class _Stage:
+    def __init__(self, session, name: str):
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.session.stages.setdefault(threading.get_ident(), [])
+        self.stack.append(self.name)
+        self.path = ';'.join(self.stack)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.stack.pop()
+        self.session.stage_calls[self.path] += 1
+        self.session.stage_seconds[self.path] += elapsed
+
+class ProfileSession:
+    """One profiling run. After it ends, paths lists the files written and summary describes it."""
+    def __init__(self, seconds: float, requests: int, trace_memory: bool, on_done):
+        self.seconds = seconds
+        self.max_requests = requests
+        self.trace_memory = trace_memory
+        self.on_done = on_done
+        self.requests = 0
+        self.started_at = time.time()
+        self.elapsed = 0.0
+        self.samples = Counter() # Folded stack -> samples
+        self.stages = {} # Thread ident -> stage names it is in (innermost last)
+        self.stage_calls = Counter()
+        self.stage_seconds = Counter()
+        self.stopped = threading.Event()
+        self.paths = []
+        self.summary = ""
+
+class Profiler:
+    """
+    Per-process profiler. start() begins a session unless one is running; stage(name) marks a
+    step of a request (a context manager, nestable); request_done() counts a finished request.
+    """
+    def __init__(self, output_dir: str, label: str = "bot", interval: float = SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.label = label
+        self.interval = interval
+        self.session = None # The running session, if any
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        session = self.session
+        if session is None:
+            return _NO_STAGE
+        return _Stage(session, name)
+
+    def request_done(self):
+        session = self.session
+        if session is None:
+            return
+        with self._lock:
+            session.requests += 1
+            if session.max_requests and session.requests >= session.max_requests:
+                session.stopped.set()
+
+    def start(self, seconds: float = None, requests: int = None, trace_memory: bool = True, on_done=None) -> bool:
+        """
+        Profiles for seconds, or until requests more requests finished (at most MAX_SESSION_SECONDS).
+        tracemalloc slows allocation-heavy code (building DataFrames, parsing) several times over;
+        trace_memory=False leaves it off for timings closer to normal. on_done(session) is called
+        from the sampler thread once the files are written. Returns False if a session is already running.
+        """
+        with self._lock:
+            if self.session is not None:
+                return False
+            self.session = ProfileSession(min(seconds or MAX_SESSION_SECONDS, MAX_SESSION_SECONDS), requests, trace_memory, on_done)
+        limit = f"the next {requests} requests" if requests else f"{self.session.seconds:g}s"
+        print(f">>>>>>>>>> Profiling started for {limit}.")
+        threading.Thread(target=self._run, args=(self.session,), name="profiler", daemon=True).start()
+        return True
+
+    def stop(self) -> bool:
+        """Ends the running session early (its files are still written). False if none is running."""
+        session = self.session
+        if session is None:
+            return False
+        session.stopped.set()
+        return True
+
+    def status(self) -> str:
+        session = self.session
+        if session is None:
+            return "No profile is running."
+        running = time.time() - session.started_at
+        limit = f"{session.requests}/{session.max_requests} requests" if session.max_requests else f"of {session.seconds:g}s"
+        return f"Profiling for {running:.0f}s ({limit}), {sum(session.samples.values())} samples so far."
+
+    def _run(self, session: ProfileSession):
+        traced_before = tracemalloc.is_tracing()
+        if session.trace_memory and not traced_before:
+            tracemalloc.start()
+        memory_before = tracemalloc.take_snapshot() if session.trace_memory else None
+        deadline = time.monotonic() + session.seconds
+        start = time.perf_counter()
+        try:
+            while not session.stopped.wait(self.interval) and time.monotonic() < deadline:
+                self._sample(session)
+        finally:
+            session.elapsed = time.perf_counter() - start
+            with self._lock:
+                self.session = None # Stages entered from now on are no-ops again
+            memory_after = tracemalloc.take_snapshot() if session.trace_memory else None
+            if session.trace_memory and not traced_before:
+                tracemalloc.stop()
+        try:
+            self._write(session, memory_before, memory_after)
+            print(f">>>>>>>>>> Profile written: {', '.join(session.paths)}.")
+        except Exception as e:
+            print(f"ERROR: Could not write the profile to {self.output_dir}: {e}")
+            session.summary = f"The profile could not be written: {e}"
+        if session.on_done:
+            try:
+                session.on_done(session)
+            except Exception as e:
+                print(f"Warning: Could not deliver the profile: {e}")
+
+    def _sample(self, session: ProfileSession):
+        sampler = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == sampler:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            frames.reverse()
+            stages = session.stages.get(ident)
+            root = [f"[{name}]" for name in stages] if stages else [f"[thread {names.get(ident, ident)}]"]
+            session.samples[';'.join(root + frames)] += 1
+
+    def _write(self, session: ProfileSession, memory_before, memory_after):
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"profile-{self.label}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime(session.started_at))}")
+
+        with open(prefix + ".folded", 'w') as f:
+            for stack, count in session.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        session.paths = [prefix + "-summary.txt", prefix + ".folded"]
+        if memory_after is not None:
+            growth = memory_after.compare_to(memory_before, 'lineno')
+            with open(prefix + "-memory.txt", 'w') as f:
+                f.write(f"Memory growth by source line over {session.elapsed:.1f}s (tracemalloc, largest first):\n")
+                for stat in growth[:TOP_MEMORY_LINES]:
+                    f.write(f"{stat}\n")
+            memory_after.dump(prefix + ".tracemalloc") # For tracemalloc.Snapshot.load() and further digging
+            session.paths += [prefix + "-memory.txt", prefix + ".tracemalloc"]
+
+        in_requests = Counter()
+        for stack, count in session.samples.items():
+            if not stack.startswith('[thread '):
+                in_requests[stack.rsplit(';', 1)[-1]] += count
+        lines = [
+            f"Profile of {self.label} started {time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(session.started_at))}: "
+            f"{session.elapsed:.1f}s, {session.requests} requests finished, {sum(session.samples.values())} samples "
+            f"every {self.interval * 1000:.0f}ms.",
+            "",
+            f"{'stage':<30} {'calls':>6} {'total s':>9} {'avg s':>8}",
+        ]
+        for path, calls in sorted(session.stage_calls.items()):
+            lines.append(f"{path:<30} {calls:>6} {session.stage_seconds[path]:>9.2f} {session.stage_seconds[path] / calls:>8.2f}")
+        lines += ["", "Innermost frames of samples inside a stage (where requests spent their time, waiting included):"]
+        lines += [f"{count:>8}  {frame}" for frame, count in in_requests.most_common(TOP_FRAMES)]
+        session.summary = "\n".join(lines)
+        with open(prefix + "-summary.txt", 'w') as f:
+            f.write(session.summary + "\n")
+
+def profile_on_signal(profiler: Profiler, seconds: float, loop=None):
+    """
+    Makes SIGUSR1 (kill -USR1 <pid>) start a session of the given length. Call from the main thread,
+    or pass the running asyncio loop: a plain signal handler interrupts the loop thread wherever it
+    is, possibly holding the profiler's lock in request_done(), and start() would then deadlock.
+    """
+    if not hasattr(signal, 'SIGUSR1'):
+        return # Not on Windows
+    if loop is not None:
+        loop.add_signal_handler(signal.SIGUSR1, lambda: profiler.start(seconds=seconds))
+        return
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.start(seconds=seconds))
@@ -0,0 +1,208 @@
+import json
+import os
+import re
+
+DEBUG = False
+
+# --- Query Cost Guardrail ---
+# Before Cortex Analyst-generated SQL runs, it is EXPLAINed (compile only, no warehouse time)
+# and the estimated scan decides whether it runs as-is, runs on a block sample, or is refused.
+
+RUN = "run"
+SAMPLE = "sample"
+REFUSE = "refuse"
+
+# Default thresholds; override per channel with the QUERY_GUARD_LIMITS environment variable, e.g.
+# QUERY_GUARD_LIMITS='{"default": {"sample_over_bytes": 5e9}, "C0123ABCD": {"refuse_over_bytes": 1e12}}'
+DEFAULT_LIMITS = {
+    "sample_over_bytes": 20 * 1024**3, # Above this, run on a block sample
+    "refuse_over_bytes": 500 * 1024**3, # Above this, don't run at all
+    "sample_over_partitions": 20000,
+    "refuse_over_partitions": 500000,
+    "min_sample_percent": 1.0,
+}
+
+# Words that can follow a table name in a FROM/JOIN clause and are not an alias.
+_NOT_ALIAS = {
+    "WHERE", "GROUP", "ORDER", "LIMIT", "HAVING", "QUALIFY", "JOIN", "INNER", "LEFT", "RIGHT",
+    "FULL", "CROSS", "NATURAL", "ON", "USING", "UNION", "EXCEPT", "MINUS", "INTERSECT", "SAMPLE",
+    "TABLESAMPLE", "AT", "BEFORE", "CHANGES", "MATCH_RECOGNIZE", "PIVOT", "UNPIVOT", "LATERAL", "WINDOW",
+}
+_TABLE_REF = re.compile(
+    r'\b(FROM|JOIN)\s+((?:"[^"]+"|[A-Za-z_][\w$]*)(?:\.(?:"[^"]+"|[A-Za-z_][\w$]*)){0,2})'
+    r'(\s+(?:AS\s+)?(?:"[^"]+"|[A-Za-z_][\w$]*))?',
+    re.IGNORECASE
+)
+# CTE definitions: WITH name AS (, WITH name (col, ...) AS ( and , name AS ( for the following ones.
+_CTE_NAME = re.compile(
+    r'(?:\bWITH\s+(?:RECURSIVE\s+)?|,\s*)("[^"]+"|[A-Za-z_][\w$]*)\s*(?:\([^()]*\)\s*)?AS\s*\(',
+    re.IGNORECASE
+)
+# Words that can follow FROM/JOIN and are not a table.
+_NOT_TABLE = {"LATERAL", "TABLE"}
+# Functions whose arguments use FROM (EXTRACT(YEAR FROM date)), which must not be rewritten.
+_FROM_FUNCTIONS = {"EXTRACT", "TRIM", "SUBSTRING", "SUBSTR", "POSITION", "OVERLAY", "DATE_PART"}
+
+class QueryRefused(Exception):
+    """Raised when the estimated cost of a query is above the channel's refuse threshold."""
+
+class GuardDecision:
+    def __init__(self, action: str, sql: str, note: str = '', stats: dict = None):
+        self.action = action
+        self.sql = sql # SQL to run (rewritten for SAMPLE)
+        self.note = note # Shown to the user with the results
+        self.stats = stats or {}
+
+def format_bytes(num_bytes: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if num_bytes < 1024 or unit == "TB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def explain_stats(sql: str, conn) -> dict:
+    """
+    Returns the EXPLAIN USING JSON global stats of the SQL:
+    partitionsTotal, partitionsAssigned and bytesAssigned, plus the number of table scans and joins.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"EXPLAIN USING JSON {sql}")
+        plan = json.loads(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+    stats = dict(plan.get("GlobalStats", {}))
+    operations = [op for group in plan.get("Operations", []) for op in group]
+    stats["tableScans"] = sum(1 for op in operations if op.get("operation") == "TableScan")
+    stats["joins"] = sum(1 for op in operations if "Join" in op.get("operation", ""))
+    return stats
+
+def _inside_from_function(sql: str, position: int) -> bool:
+    """True if position is inside the parentheses of a function such as EXTRACT(... FROM ...)."""
+    depth = 0
+    for i in range(position - 1, -1, -1):
+        if sql[i] == ')':
+            depth += 1
+        elif sql[i] == '(':
+            if depth == 0:
+                name = re.search(r'([A-Za-z_]+)\s*$', sql[:i])
+                return bool(name) and name.group(1).upper() in _FROM_FUNCTIONS
+            depth -= 1
+    return False
+
+def _identifier(name: str) -> str:
+    return name[1:-1] if name.startswith('"') else name.upper()
+
+def _cte_names(sql: str) -> set:
+    """Names defined in WITH clauses (upper-cased unless quoted); they are not tables to sample."""
+    return {_identifier(match.group(1)) for match in _CTE_NAME.finditer(sql)}
+
+def add_block_sample(sql: str, percent: float):
+    """
+    Adds SAMPLE BLOCK (percent) after the first base table in a FROM/JOIN clause, and returns
+    (rewritten sql, sampled table). Block sampling skips whole micro-partitions, so it bounds bytes
+    scanned (row sampling would not). Only one table is sampled: sampling both sides of a join, or
+    a table and a CTE built from it, would compound to percent * percent.
+    CTE names, table functions and subqueries are skipped. Returns None if the query has no
+    table that can be rewritten, or already samples one.
+    """
+    ctes = _cte_names(sql)
+    for match in _TABLE_REF.finditer(sql):
+        if _inside_from_function(sql, match.start()):
+            continue
+        name = match.group(2)
+        if _identifier(name.split('.')[-1]) in ctes or name.upper() in _NOT_TABLE:
+            continue
+        if sql[match.end(2):].lstrip().startswith('('):
+            continue # A table function, e.g. FROM TABLE(...)
+        alias = match.group(3)
+        end = match.end()
+        if alias and alias.split()[-1].upper() in _NOT_ALIAS:
+            end = match.end(2) # Keyword, not an alias: sample right after the table name
+        if sql[end:end + 20].lstrip().upper().startswith(("SAMPLE", "TABLESAMPLE")):
+            return None # Already sampled; another sample on top would compound
+        return f"{sql[:end]} SAMPLE BLOCK ({percent:g}){sql[end:]}", name
+    return None
+
+class QueryGuard:
+    """
+    Pre-flight check for generated SQL. Thresholds are configurable per Slack channel,
+    so p99 latency and warehouse credits stay bounded.
+    """
+    def __init__(self, limits: dict = None, rewrite=None):
+        if limits is None:
+            limits = json.loads(os.getenv("QUERY_GUARD_LIMITS", "{}") or "{}")
+        self.limits = limits
+        self.rewrite = rewrite # Optional sql -> sql step run before the check, e.g. RollupManager.rewrite
+        self.counters = {RUN: 0, SAMPLE: 0, REFUSE: 0, 'explain_failed': 0}
+
+    def limits_for(self, channel_id: str = None) -> dict:
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(self.limits.get("default", {}))
+        if channel_id:
+            limits.update(self.limits.get(channel_id, {}))
+        return limits
+
+    def check(self, sql: str, conn, channel_id: str = None) -> GuardDecision:
+        """EXPLAINs the SQL and decides whether to run it, sample it, or refuse it."""
+        limits = self.limits_for(channel_id)
+        try:
+            stats = explain_stats(sql, conn)
+        except Exception as e:
+            # Let the query itself report the error; EXPLAIN failing doesn't mean it's expensive
+            print(f"Warning: EXPLAIN failed, running query unchecked: {e}")
+            self.counters['explain_failed'] += 1
+            return GuardDecision(RUN, sql)
+
+        scan_bytes = stats.get("bytesAssigned", 0)
+        partitions = stats.get("partitionsAssigned", 0)
+        if DEBUG:
+            print(f"QueryGuard: {format_bytes(scan_bytes)} in {partitions} partitions ({stats}).")
+
+        if scan_bytes > limits["refuse_over_bytes"] or partitions > limits["refuse_over_partitions"]:
+            self.counters[REFUSE] += 1
+            return GuardDecision(
+                REFUSE, sql,
+                f"This question would scan about {format_bytes(scan_bytes)} ({partitions} partitions), "
+                f"which is above the limit for this channel. Try narrowing it, for example to a shorter date range.",
+                stats
+            )
+
+        if scan_bytes > limits["sample_over_bytes"] or partitions > limits["sample_over_partitions"]:
+            ratio = min(limits["sample_over_bytes"] / max(scan_bytes, 1),
+                        limits["sample_over_partitions"] / max(partitions, 1))
+            percent = round(max(limits["min_sample_percent"], min(100.0, ratio * 100)), 2)
+            sampled = add_block_sample(sql, percent)
+            if sampled is None:
+                self.counters[REFUSE] += 1
+                return GuardDecision(
+                    REFUSE, sql,
+                    f"This question would scan about {format_bytes(scan_bytes)} and can't be sampled safely. "
+                    f"Try narrowing it, for example to a shorter date range.",
+                    stats
+                )
+            sampled_sql, table = sampled
+            self.counters[SAMPLE] += 1
+            return GuardDecision(
+                SAMPLE, sampled_sql,
+                f"Note: the full query would scan about {format_bytes(scan_bytes)}, so these results are based on "
+                f"an approximately {percent:g}% block sample of {table}. Totals and counts from it are understated accordingly.",
+                stats
+            )
+
+        self.counters[RUN] += 1
+        return GuardDecision(RUN, sql, stats=stats)
+
+    def preparer(self, conn, channel_id: str = None):
+        """
+        Returns a prepare(sql) callable for query_runner: it returns (sql_to_run, note, explain_stats)
+        or raises QueryRefused. The stats are reused by the warehouse router. The rewrite step, if
+        set, runs first, so a query answered from a rollup is checked (and routed) on its own cost.
+        """
+        def prepare(sql):
+            if self.rewrite:
+                sql = self.rewrite(sql)
+            decision = self.check(sql, conn, channel_id)
+            if decision.action == REFUSE:
+                raise QueryRefused(decision.note)
+            return decision.sql, decision.note, decision.stats or None
+        return prepare
@@ -0,0 +1,373 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+
+DEBUG = False
+
+# --- Query Execution ---
+# Warehouse queries run on this pool so they can start while the agent is still streaming.
+QUERY_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sql")
+
+# Sent with each query as STATEMENT_TIMEOUT_IN_SECONDS, so Snowflake itself aborts a runaway
+# statement even if this process dies; the poller also aborts it once the deadline passes.
+STATEMENT_TIMEOUT_SECONDS = 300
+STREAM_BATCH_ROWS = 50000 # Rows per batch when streaming a result instead of loading it whole
+MIN_POLL_INTERVAL = 0.1 # Seconds between status checks, doubling up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 1.0
+
+class QueryCancelled(Exception):
+    """Raised when a query is cancelled (Cancel button, deleted question, discarded speculation)."""
+
+class QueryTimeout(Exception):
+    """Raised when a query runs past its statement timeout."""
+
+class QueryHandle:
+    """
+    A warehouse query submitted with the connector's execute_async and polled by query id,
+    so it can be cancelled from another thread while it runs. conn is a Snowflake connection
+    (or anything with the same cursor()/get_query_status_throw_if_error()/is_still_running() API);
+    it runs the query unless a router (see warehouse_router.py) picks a pooled connection,
+    and is always used to abort it.
+    """
+    def __init__(self, conn, sql: str, timeout: int = STATEMENT_TIMEOUT_SECONDS,
+                 should_cancel=None, on_submitted=None, prepare=None, router=None, query_id=None, memory=None):
+        self.conn = conn
+        self.sql = sql
+        self.prepare = prepare # Optional pre-flight check (see query_guard.py): sql -> (sql_to_run, note, stats)
+        self.router = router
+        self.note = ''
+        self.timeout = timeout
+        self.should_cancel = should_cancel # Optional callable polled while the query runs
+        self.on_submitted = on_submitted # Optional callback receiving the query id
+        self.query_id = query_id # If given, the stored result of that earlier query is read instead of running sql
+        self.memory = memory # Optional memory_budget.MemoryLease, told how much the fetched rows take
+        self.columns = None
+        self._cancelled = threading.Event()
+
+    def run(self):
+        """Submits the query, waits for it and returns the result as a DataFrame."""
+        import pandas as pd # Lazy import; normally already loaded by app.warm_up()
+
+        self._raise_if_cancelled()
+        stats = None
+        if self.prepare:
+            self.sql, self.note, stats = self.prepare(self.sql)
+            self._raise_if_cancelled()
+        if self.router:
+            with self.router.connection(self.sql, stats) as conn:
+                return self._execute(conn, pd)
+        return self._execute(self.conn, pd)
+
+    def stream(self, batch_rows: int = STREAM_BATCH_ROWS, arrow: bool = False):
+        """
+        Like run(), but yields the result in batches (lists of row tuples, or pyarrow Tables with
+        arrow=True) so a result of any size can be written out without holding it in memory.
+        self.columns is set before the first batch.
+        """
+        self._raise_if_cancelled()
+        if self.query_id:
+            yield from self._stream(self.conn, batch_rows, arrow)
+            return
+        stats = None
+        if self.prepare:
+            self.sql, self.note, stats = self.prepare(self.sql)
+            self._raise_if_cancelled()
+        if self.router:
+            with self.router.connection(self.sql, stats) as conn:
+                yield from self._stream(conn, batch_rows, arrow)
+            return
+        yield from self._stream(self.conn, batch_rows, arrow)
+
+    def _execute(self, conn, pd):
+        cursor = conn.cursor()
+        try:
+            self._submit_and_wait(conn, cursor)
+            return self._fetch_frame(cursor, pd)
+        finally:
+            cursor.close()
+
+    def _fetch_rows(self, cursor) -> list:
+        if not self.memory:
+            return cursor.fetchall()
+        # In batches, so a result too big for the memory budget is stopped while it is fetched
+        from memory_budget import estimate_rows_bytes
+        rows = []
+        for batch in iter(lambda: cursor.fetchmany(STREAM_BATCH_ROWS), []):
+            rows.extend(batch)
+            self.memory.track('rows', estimate_rows_bytes(rows, len(rows)))
+        return rows
+
+    def _stream(self, conn, batch_rows: int, arrow: bool):
+        cursor = conn.cursor()
+        try:
+            if not self.query_id:
+                self._submit_and_wait(conn, cursor)
+            cursor.get_results_from_sfqid(self.query_id)
+            self.columns = [column[0] for column in cursor.description]
+            if arrow:
+                batches = cursor.fetch_arrow_batches() # Result chunks as downloaded, typed from the result metadata
+            else:
+                batches = iter(lambda: cursor.fetchmany(batch_rows), [])
+            for batch in batches:
+                self._raise_if_cancelled()
+                yield batch
+        finally:
+            cursor.close()
+
+    async def run_async(self):
+        """
+        run() for asyncio (see async_app.py). The query is polled with asyncio.sleep, so waiting for
+        the warehouse holds no thread; the connector's blocking calls (EXPLAIN, submit, status,
+        fetch) run in the default executor.
+        """
+        import pandas as pd # Lazy import; normally already loaded by app.warm_up()
+
+        self._raise_if_cancelled()
+        stats = None
+        if self.prepare:
+            self.sql, self.note, stats = await asyncio.to_thread(self.prepare, self.sql)
+            self._raise_if_cancelled()
+        if not self.router:
+            return await self._execute_async(self.conn, pd)
+        pooled = self.router.connection(self.sql, stats)
+        conn = await asyncio.to_thread(pooled.__enter__)
+        try:
+            df = await self._execute_async(conn, pd)
+        except BaseException as e:
+            await asyncio.to_thread(pooled.__exit__, type(e), e, e.__traceback__) # The pool drops a broken connection
+            raise
+        await asyncio.to_thread(pooled.__exit__, None, None, None)
+        return df
+
+    async def _execute_async(self, conn, pd):
+        cursor = conn.cursor()
+        try:
+            await asyncio.to_thread(self._submit, cursor)
+            deadline = time.monotonic() + self.timeout
+            interval = MIN_POLL_INTERVAL
+            while True:
+                status = await asyncio.to_thread(conn.get_query_status_throw_if_error, self.query_id)
+                if not conn.is_still_running(status):
+                    break
+                await asyncio.sleep(interval)
+                self._check_progress(deadline)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+            return await asyncio.to_thread(self._fetch_frame, cursor, pd)
+        finally:
+            cursor.close()
+
+    def _fetch_frame(self, cursor, pd):
+        cursor.get_results_from_sfqid(self.query_id)
+        rows = self._fetch_rows(cursor)
+        columns = [column[0] for column in cursor.description]
+        df = pd.DataFrame(rows, columns=columns)
+        df.attrs['query_note'] = self.note # e.g. "results are based on a sample"
+        df.attrs['query_id'] = self.query_id # The stored result can be read again, e.g. for an export
+        return df
+
+    def _submit(self, cursor):
+        # The connector's timeout= is only a client-side timer on the submit call; the statement
+        # parameter is enforced by the warehouse
+        cursor.execute_async(self.sql, _statement_params={'STATEMENT_TIMEOUT_IN_SECONDS': self.timeout})
+        self.query_id = cursor.sfqid
+        if self._cancelled.is_set():
+            self._abort() # Cancelled while submitting, e.g. a discarded speculative task no longer polls
+        if self.on_submitted:
+            self.on_submitted(self.query_id)
+        if DEBUG:
+            print(f"QueryHandle: submitted query {self.query_id}.")
+
+    def _check_progress(self, deadline: float):
+        """Aborts the running query if it was cancelled or is past its deadline."""
+        if self._cancelled.is_set() or (self.should_cancel and self.should_cancel()):
+            self._abort()
+            raise QueryCancelled(f"Query {self.query_id} was cancelled.")
+        if time.monotonic() > deadline:
+            self._abort()
+            raise QueryTimeout(f"Query {self.query_id} exceeded {self.timeout}s.")
+
+    def _submit_and_wait(self, conn, cursor):
+        self._submit(cursor)
+
+        deadline = time.monotonic() + self.timeout
+        interval = MIN_POLL_INTERVAL
+        while True:
+            status = conn.get_query_status_throw_if_error(self.query_id)
+            if not conn.is_still_running(status):
+                break
+            self._cancelled.wait(interval) # Returns early when cancel() is called
+            self._check_progress(deadline)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def cancel(self):
+        """Cancels the query; safe to call from any thread, before or while it runs."""
+        self._cancelled.set()
+        if self.query_id:
+            self._abort()
+
+    def _raise_if_cancelled(self):
+        if self._cancelled.is_set() or (self.should_cancel and self.should_cancel()):
+            raise QueryCancelled("Query was cancelled before it was submitted.")
+
+    def _abort(self):
+        try:
+            self.conn.cursor().abort_query(self.query_id) # SYSTEM$CANCEL_QUERY
+        except Exception as e:
+            print(f"Warning: Could not cancel query {self.query_id}: {e}")
+
+def run_query(sql, conn, cancel_token=None, prepare=None, router=None, memory=None):
+    """
+    Runs the SQL on the Snowflake connection and returns the result as a DataFrame.
+    If a cancel_token (see cancellation.py) is given, the query stops when it is cancelled.
+    prepare is an optional pre-flight check (see QueryGuard.preparer) run before submission,
+    router an optional WarehouseRouter choosing the warehouse to run on, and memory an optional
+    MemoryLease (see memory_budget.py) the fetched rows are accounted to.
+    """
+    handle = QueryHandle(conn, sql, prepare=prepare, router=router, memory=memory)
+    if cancel_token:
+        cancel_token.attach(handle)
+    try:
+        return handle.run()
+    finally:
+        if cancel_token:
+            cancel_token.detach(handle)
+
+async def run_query_async(sql, conn, cancel_token=None, prepare=None, router=None, memory=None):
+    """run_query() for asyncio; the same arguments, awaited (see QueryHandle.run_async)."""
+    handle = QueryHandle(conn, sql, prepare=prepare, router=router, memory=memory)
+    if cancel_token:
+        cancel_token.attach(handle)
+    try:
+        return await handle.run_async()
+    finally:
+        if cancel_token:
+            cancel_token.detach(handle)
+
+class SpeculativeQuery:
+    """
+    Starts the warehouse query as soon as the Cortex Analyst tool result carrying the SQL
+    arrives in the agent's stream, overlapping query execution with the rest of the
+    model output. If the final answer uses different SQL, or no SQL at all, the
+    speculative query is cancelled.
+    """
+    counters = {'started': 0, 'used': 0, 'discarded': 0}
+    _counters_lock = threading.Lock()
+
+    def __init__(self, conn, cancel_token=None, prepare=None, router=None, memory=None):
+        self.conn = conn
+        self.cancel_token = cancel_token
+        self.prepare = prepare # The same pre-flight check runs before a speculative query
+        self.router = router
+        self.memory = memory
+        self.sql = None
+        self.future = None
+        self.handle = None
+        self._lock = threading.Lock()
+
+    def start(self, sql: str):
+        """Called from the stream consumer with each SQL statement seen (callback for CortexChat.chat)."""
+        with self._lock:
+            if self.future is not None and sql == self.sql:
+                return
+            self._discard()
+            self.sql = sql
+            self.handle = QueryHandle(self.conn, sql, prepare=self.prepare, router=self.router, memory=self.memory)
+            if self.cancel_token:
+                self.cancel_token.attach(self.handle)
+            self.future = QUERY_POOL.submit(self.handle.run)
+            self._count('started')
+            if DEBUG:
+                print("SpeculativeQuery: started query while the agent is still streaming.")
+
+    def result_for(self, final_sql: str):
+        """
+        Returns the DataFrame of the speculative query if it ran final_sql (waiting for it to finish),
+        otherwise cancels it and returns None so the caller runs final_sql itself.
+        """
+        with self._lock:
+            if self.future is None or final_sql != self.sql:
+                self._discard()
+                return None
+            future, handle = self.future, self.handle
+            self.future, self.handle, self.sql = None, None, None
+            self._count('used')
+        try:
+            return future.result()
+        finally:
+            if self.cancel_token:
+                self.cancel_token.detach(handle)
+
+    def cancel(self):
+        """Cancels an unused speculative query (no-op if none is pending)."""
+        with self._lock:
+            self._discard()
+
+    def _discard(self):
+        if self.future is not None:
+            self.future.cancel() # Stops a query still waiting for a pool thread
+            self.handle.cancel() # Aborts it in the warehouse if it was already submitted
+            if self.cancel_token:
+                self.cancel_token.detach(self.handle)
+            self._count('discarded')
+            if DEBUG:
+                print("SpeculativeQuery: discarded speculative query.")
+        self.future, self.handle, self.sql = None, None, None
+
+    @classmethod
+    def _count(cls, name: str):
+        with cls._counters_lock:
+            cls.counters[name] += 1
+
+class AsyncSpeculativeQuery:
+    """
+    SpeculativeQuery for asyncio: start() (called from the agent stream on the event loop) begins
+    the query as a task; result_for() awaits it if the final SQL matches, otherwise cancels it.
+    """
+    def __init__(self, conn, cancel_token=None, prepare=None, router=None, memory=None):
+        self.conn = conn
+        self.cancel_token = cancel_token
+        self.prepare = prepare
+        self.router = router
+        self.memory = memory
+        self.sql = None
+        self.task = None
+        self.handle = None
+
+    def start(self, sql: str):
+        if self.task is not None and sql == self.sql:
+            return
+        self._discard()
+        self.sql = sql
+        self.handle = QueryHandle(self.conn, sql, prepare=self.prepare, router=self.router, memory=self.memory)
+        if self.cancel_token:
+            self.cancel_token.attach(self.handle)
+        self.task = asyncio.ensure_future(self.handle.run_async())
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception()) # Discarded runs aren't errors
+        SpeculativeQuery._count('started')
+
+    async def result_for(self, final_sql: str):
+        if self.task is None or final_sql != self.sql:
+            self._discard()
+            return None
+        task, handle = self.task, self.handle
+        self.task, self.handle, self.sql = None, None, None
+        SpeculativeQuery._count('used')
+        try:
+            return await task
+        finally:
+            if self.cancel_token:
+                self.cancel_token.detach(handle)
+
+    def cancel(self):
+        self._discard()
+
+    def _discard(self):
+        if self.task is not None:
+            self.task.cancel()
+            # Aborting a submitted query is a blocking Snowflake call, so it runs off the event loop
+            asyncio.get_running_loop().run_in_executor(None, self.handle.cancel)
+            if self.cancel_token:
+                self.cancel_token.detach(self.handle)
+            SpeculativeQuery._count('discarded')
+        self.task, self.handle, self.sql = None, None, None
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+DEBUG = False
+
+# --- Rate Limiting and Fair Queuing ---
+# Questions are admitted in two steps before any agent call or warehouse query:
+# 1. Token buckets per user and per channel (shared by all workers through the SharedStore)
+#    allow a burst and then a steady rate; over the limit, the user is told when to try again.
+# 2. A fair dispatcher bounds how many questions this process works on at once. Waiting
+#    questions are served by weighted fair queuing across channels, so one busy channel can't
+#    starve the others, and when the queue is long the question is shed with a quick
+#    "busy, try again" reply instead of a multi-minute wait.
+# Limits come from a JSON file that is re-read when it changes, so they apply without a restart.
+
+BUCKETS_NAMESPACE = "rate_limits"
+
+# Used for anything the file doesn't set. Per-user and per-channel overrides go under "users" and
+# "channels" (a channel "weight" is its share of the dispatcher when channels compete), e.g.
+# {"user": {"per_minute": 10}, "channels": {"C0123ABCD": {"per_minute": 60, "burst": 20, "weight": 3}}}
+DEFAULT_LIMITS = {
+    "user": {"per_minute": 6, "burst": 3},
+    "channel": {"per_minute": 30, "burst": 10},
+    "users": {},
+    "channels": {},
+    "max_concurrent": 4, # Questions worked on at once by this process (one thread each in Socket Mode)
+    "http_max_concurrent": 32, # The same for an HTTP-mode process (async_app.py), where a waiting question holds no thread
+    "max_queue": 8, # Questions allowed to wait for a turn; more are shed
+    "max_wait_seconds": 30, # Questions expected to wait longer than this are shed
+}
+
+class RateLimited(Exception):
+    """Raised when a user or channel is over its rate limit."""
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"{scope} is over its rate limit; retry in {retry_after:.0f}s.")
+        self.scope = scope # "user" or "channel"
+        self.retry_after = retry_after
+
+class Overloaded(Exception):
+    """Raised when a question is shed because too many are already waiting."""
+
+class ReloadingConfig:
+    """
+    JSON settings merged over defaults, re-read when the file's mtime changes (checked at most
+    every check_seconds). A missing file means the defaults; a broken one keeps the last good settings.
+    """
+    def __init__(self, path: str, defaults: dict, check_seconds: float = 5.0):
+        self.path = path
+        self.defaults = defaults
+        self.check_seconds = check_seconds
+        self._settings = dict(defaults)
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        now = time.monotonic()
+        if now - self._checked >= self.check_seconds:
+            with self._lock:
+                if now - self._checked >= self.check_seconds:
+                    self._checked = now
+                    self._reload()
+        return self._settings
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            self._settings = dict(self.defaults)
+            return
+        try:
+            with open(self.path) as f:
+                loaded = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read {self.path}, keeping the previous settings: {e}")
+            return
+        settings = dict(self.defaults)
+        for name, value in loaded.items():
+            if isinstance(value, dict) and isinstance(settings.get(name), dict):
+                value = dict(settings[name], **value)
+            settings[name] = value
+        self._settings = settings
+        print(f">>>>>>>>>> Loaded rate limits from {self.path}.")
+
+class RateLimiter:
+    """Per-user and per-channel token buckets; check() raises RateLimited or takes a token from each."""
+    def __init__(self, store, config: ReloadingConfig):
+        self.store = store
+        self.config = config
+        self.counters = {'allowed': 0, 'limited_user': 0, 'limited_channel': 0}
+
+    def _take(self, scope: str, key: str) -> float:
+        settings = self.config.get()
+        limits = dict(settings[scope], **settings[scope + "s"].get(key, {}))
+        rate = limits.get("per_minute", 0) / 60
+        if rate <= 0:
+            return 0.0 # No limit configured
+        return self.store.take_token(BUCKETS_NAMESPACE, f"{scope}:{key}", rate, limits.get("burst", 1))
+
+    def check(self, user_id: str, channel_id: str):
+        for scope, key in (("user", user_id), ("channel", channel_id)):
+            if not key:
+                continue
+            retry_after = self._take(scope, key)
+            if retry_after > 0:
+                self.counters['limited_' + scope] += 1
+                if DEBUG:
+                    print(f"RateLimiter: {scope} {key} limited for {retry_after:.1f}s ({self.counters}).")
+                raise RateLimited(scope, retry_after)
+        self.counters['allowed'] += 1
+
+class FairDispatcher:
+    """
+    Bounds the questions this process works on at once (the max_concurrent_key setting). Waiting
+    questions are ordered by weighted fair queuing: each gets a virtual finish time of
+    max(now, its channel's last finish) + 1/weight, and the smallest goes next, so channels share
+    turns by weight however many each has queued.
+    """
+    def __init__(self, config: ReloadingConfig, max_concurrent_key: str = "max_concurrent"):
+        self.config = config
+        self.max_concurrent_key = max_concurrent_key
+        self.running = 0
+        self.virtual_time = 0.0
+        self.last_finish = {} # channel -> virtual finish time of its latest queued question
+        self.service_seconds = 10.0 # Moving average of how long a question holds its turn
+        self.counters = {'started': 0, 'queued': 0, 'shed': 0}
+        self._waiting = [] # Heap of [finish, seq, channel, granted, wake]; wake is None for a thread waiting on _turn
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._turn = threading.Condition(self._lock)
+
+    def _expected_wait(self, settings: dict) -> float:
+        return (len(self._waiting) + 1) * self.service_seconds / max(1, settings[self.max_concurrent_key])
+
+    def acquire(self, channel_id: str):
+        """Waits for a turn, or raises Overloaded right away if the wait would be too long."""
+        with self._lock:
+            entry = self._enqueue(channel_id)
+            if entry is None:
+                return
+            while not entry[3]:
+                self._turn.wait()
+            self.counters['started'] += 1
+
+    async def acquire_async(self, channel_id: str):
+        """
+        acquire() for asyncio: the wait is a future resolved by release(), so a queued question holds
+        no thread. (Waiting in the default executor instead would let queued questions take every
+        thread that running ones need to finish, and so release, their turns.)
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        wake = lambda: None if loop.is_closed() else loop.call_soon_threadsafe(_resolve, granted)
+        with self._lock:
+            entry = self._enqueue(channel_id, wake)
+        if entry is None:
+            return
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                has_turn = entry[3]
+                if not has_turn:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+            if has_turn:
+                self.release() # The turn came with the cancellation; pass it on
+            raise
+        with self._lock:
+            self.counters['started'] += 1
+
+    def _enqueue(self, channel_id: str, wake=None):
+        """
+        With the lock held: takes a turn and returns None if one is free, raises Overloaded, or
+        queues the question and returns its heap entry, granted by release().
+        """
+        settings = self.config.get()
+        if self.running < settings[self.max_concurrent_key] and not self._waiting:
+            self.running += 1
+            self.counters['started'] += 1
+            return None
+        if len(self._waiting) >= settings["max_queue"] or self._expected_wait(settings) > settings["max_wait_seconds"]:
+            self.counters['shed'] += 1
+            print(f"Warning: Shedding a question from {channel_id} ({len(self._waiting)} waiting, {self.running} running).")
+            raise Overloaded("Too many questions are waiting.")
+        weight = settings["channels"].get(channel_id, {}).get("weight", 1)
+        finish = max(self.virtual_time, self.last_finish.get(channel_id, 0.0)) + 1.0 / max(weight, 0.01)
+        self.last_finish[channel_id] = finish
+        entry = [finish, next(self._seq), channel_id, False, wake]
+        heapq.heappush(self._waiting, entry)
+        self.counters['queued'] += 1
+        return entry
+
+    def release(self, seconds: float = None):
+        """Ends a turn; seconds is how long it took, for the expected-wait estimate."""
+        settings = self.config.get()
+        with self._lock:
+            if seconds is not None:
+                self.service_seconds = 0.8 * self.service_seconds + 0.2 * seconds
+            self.running -= 1
+            while self._waiting and self.running < settings[self.max_concurrent_key]:
+                entry = heapq.heappop(self._waiting)
+                self.virtual_time = entry[0]
+                entry[3] = True # The turn passes straight to the waiter; running stays counted
+                self.running += 1
+                if entry[4]:
+                    entry[4]()
+            if not self._waiting:
+                self.last_finish.clear() # Idle: nothing to be fair about any more
+            self._turn.notify_all()
+
+    def turn(self, channel_id: str):
+        """Context manager: with DISPATCHER.turn(channel_id): ..."""
+        return _Turn(self, channel_id)
+
+def _resolve(future):
+    if not future.done(): # Cancelled while the wake-up was on its way
+        future.set_result(None)
+
+class _Turn:
+    def __init__(self, dispatcher: FairDispatcher, channel_id: str):
+        self.dispatcher = dispatcher
+        self.channel_id = channel_id
+
+    def __enter__(self):
+        self.dispatcher.acquire(self.channel_id)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.dispatcher.release(time.monotonic() - self.start)
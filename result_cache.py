@@ -0,0 +1,44 @@
+import pickle
+import zlib
+
+DEBUG = False
+
+# --- Result Cache ---
+# Query results (pandas DataFrames) kept in the SharedStore by results message ts, so "Next page" /
+# "Previous page" clicks are served by whichever worker receives them, without re-running the query.
+
+RESULTS_NAMESPACE = "results"
+
+class ResultCache:
+    """
+    Stores pickled, zlib-compressed DataFrames with a TTL. Results larger than max_result_bytes
+    are not cached; the namespace as a whole is trimmed to max_total_bytes (soonest-expiring first).
+    """
+    def __init__(self, store, ttl: float = 3600, max_result_bytes: int = 10 * 1024**2, max_total_bytes: int = 200 * 1024**2):
+        self.store = store
+        self.ttl = ttl
+        self.max_result_bytes = max_result_bytes
+        self.max_total_bytes = max_total_bytes
+        self.counters = {'stored': 0, 'too_large': 0, 'hits': 0, 'misses': 0}
+
+    def put(self, key: str, df) -> bool:
+        """Caches the DataFrame; returns False if it is over the per-result budget."""
+        data = zlib.compress(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        if len(data) > self.max_result_bytes:
+            self.counters['too_large'] += 1
+            if DEBUG:
+                print(f"ResultCache: {len(data)} bytes for {key} is over the {self.max_result_bytes} byte budget.")
+            return False
+        self.store.set(RESULTS_NAMESPACE, key, data, ttl=self.ttl)
+        self.store.trim(RESULTS_NAMESPACE, self.max_total_bytes)
+        self.counters['stored'] += 1
+        return True
+
+    def get(self, key: str):
+        """Returns the cached DataFrame, or None if it expired or was evicted."""
+        data = self.store.get(RESULTS_NAMESPACE, key)
+        if data is None:
+            self.counters['misses'] += 1
+            return None
+        self.counters['hits'] += 1
+        return pickle.loads(zlib.decompress(data))
@@ -0,0 +1,106 @@
+import csv
+import io
+import tempfile
+
+from query_runner import QueryHandle, STREAM_BATCH_ROWS
+
+DEBUG = False
+
+# --- Result Export ---
+# The full result of an answer, written as CSV or Parquet while it is streamed from the cursor,
+# so multi-million-row exports never exist as a DataFrame. Output is kept in a spooled
+# temporary file: in memory up to SPOOL_MEMORY_BYTES, then on local disk.
+
+CSV = "csv"
+PARQUET = "parquet"
+EXPORT_FORMATS = (CSV, PARQUET)
+SPOOL_MEMORY_BYTES = 32 * 1024**2
+
+class ExportError(Exception):
+    """Raised when an export can't be written (e.g. Parquet without pyarrow installed)."""
+
+class ResultExport:
+    """
+    One written export. file is positioned at the start and ready for upload_file_to_slack;
+    close() releases it (and the temporary file on disk, if it spilled over).
+    """
+    def __init__(self, file, filename: str, size: int, rows: int, note: str = ''):
+        self.file = file
+        self.filename = filename
+        self.size = size
+        self.rows = rows
+        self.note = note # e.g. "results are based on a sample", from the query guard
+
+    def close(self):
+        self.file.close()
+
+def _write_csv(handle: QueryHandle, spool, batch_rows: int) -> int:
+    text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    rows = 0
+    for batch in handle.stream(batch_rows):
+        if rows == 0:
+            writer.writerow(handle.columns)
+        writer.writerows(batch)
+        rows += len(batch)
+    if rows == 0:
+        writer.writerow(handle.columns)
+    text.flush()
+    text.detach() # Keep the spooled file open for the upload
+    return rows
+
+def _write_parquet(handle: QueryHandle, spool) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow).")
+
+    writer, rows = None, 0
+    try:
+        for table in handle.stream(arrow=True):
+            if writer is None:
+                writer = pq.ParquetWriter(spool, table.schema, compression='snappy')
+            writer.write_table(table) # One row group per result chunk
+            rows += table.num_rows
+        if writer is None: # Empty result: still a valid file with the column names
+            empty = pa.table({name: pa.array([], type=pa.string()) for name in handle.columns})
+            writer = pq.ParquetWriter(spool, empty.schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+def export_query(conn, sql: str, fmt: str, filename: str, query_id: str = None, note: str = '', prepare=None, router=None,
+                 batch_rows: int = STREAM_BATCH_ROWS, spool_bytes: int = SPOOL_MEMORY_BYTES) -> ResultExport:
+    """
+    Writes the result of sql to a spooled file in the given format. With query_id, the stored
+    result of that earlier query is read (no warehouse time; note is the query guard note it ran with);
+    if it is no longer available, sql runs again through prepare (the query guard) and router.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}'; use one of {', '.join(EXPORT_FORMATS)}.")
+    attempts = []
+    if query_id:
+        stored = QueryHandle(conn, sql, query_id=query_id)
+        stored.note = note
+        attempts.append(stored)
+    attempts.append(QueryHandle(conn, sql, prepare=prepare, router=router))
+    for attempt, handle in enumerate(attempts, 1):
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        try:
+            rows = _write_parquet(handle, spool) if fmt == PARQUET else _write_csv(handle, spool, batch_rows)
+        except ExportError:
+            spool.close()
+            raise
+        except Exception as e:
+            spool.close()
+            if attempt == len(attempts):
+                raise
+            print(f"Warning: Stored result of query {handle.query_id} is not available, running the query again: {e}")
+            continue
+        size = spool.tell()
+        spool.seek(0)
+        if DEBUG:
+            print(f"ResultExport: {rows} rows, {size} bytes of {fmt} for query {handle.query_id}.")
+        return ResultExport(spool, f"{filename}.{fmt}", size, rows, handle.note)
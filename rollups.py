@@ -0,0 +1,462 @@
+import json
+import re
+import threading
+import time
+
+from semantic_model import TIME_DIMENSION, DIMENSION, FACT
+
+DEBUG = False
+
+# --- Rollup Cache ---
+# Materialized aggregates of the fact table (e.g. day x category x gender), derived from the
+# semantic model, refreshed incrementally, and used to answer Analyst SQL without scanning the
+# fact table. A query is only rewritten when the rewrite is provably equivalent:
+#   - one FROM table (the fact table, or Analyst's projection CTE over it), no joins, subqueries,
+#     set operations, window functions or sampling;
+#   - every column outside an aggregate is a rollup dimension, and only known row-level
+#     functions are applied to them, so predicates and groupings depend only on rollup keys;
+#   - aggregates are SUM/COUNT/MIN/MAX of a single column, or COUNT(*), each re-aggregated from
+#     the stored partials (see _rewrite_aggregate). AVG is not rewritten (SUM/COUNT of the partials
+#     has another result scale than AVG), and neither are DISTINCT aggregates;
+#   - the rollup was refreshed at the fact table's current LAST_ALTERED.
+
+ROLLUP_NAMESPACE = "rollups" # SharedStore: rollup name -> {"base_last_altered", "refreshed_at"}
+ROW_COUNT = "ROW_COUNT"
+# Facts that are also useful as group keys (age bands: any expression over AGE works on the rollup).
+GROUPABLE_FACTS = {'AGE'}
+
+SUPPORTED_AGGREGATES = {'SUM', 'COUNT', 'MIN', 'MAX'}
+# Row-level functions allowed on dimension columns; any other function call blocks the rewrite.
+ROW_FUNCTIONS = {
+    'DATE_TRUNC', 'DATE_PART', 'EXTRACT', 'YEAR', 'QUARTER', 'MONTH', 'WEEK', 'WEEKOFYEAR', 'DAY', 'DAYOFWEEK',
+    'DAYOFYEAR', 'DAYNAME', 'MONTHNAME', 'LAST_DAY', 'DATEADD', 'DATEDIFF', 'TO_DATE', 'TO_CHAR', 'TO_VARCHAR',
+    'CURRENT_DATE', 'CURRENT_TIMESTAMP', 'UPPER', 'LOWER', 'TRIM', 'INITCAP', 'CONCAT', 'COALESCE', 'NVL',
+    'IFF', 'NULLIF', 'ZEROIFNULL', 'DIV0', 'ROUND', 'FLOOR', 'CEIL', 'ABS', 'CAST', 'TRY_CAST', 'TO_NUMBER',
+    'WIDTH_BUCKET',
+}
+BLOCKING_KEYWORDS = {
+    'JOIN', 'UNION', 'INTERSECT', 'EXCEPT', 'MINUS', 'OVER', 'QUALIFY', 'SAMPLE', 'TABLESAMPLE', 'LATERAL',
+    'PIVOT', 'UNPIVOT', 'MATCH_RECOGNIZE', 'CONNECT', 'AT', 'BEFORE', 'CHANGES', 'WITH', 'RECURSIVE',
+}
+CLAUSE_KEYWORDS = {'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'FETCH'}
+# Keywords that may be followed by a parenthesis without being a function call.
+PAREN_KEYWORDS = {'IN', 'AND', 'OR', 'NOT', 'WHEN', 'THEN', 'ELSE', 'CASE', 'BETWEEN', 'SELECT', 'WHERE', 'HAVING', 'BY', 'DISTINCT', 'AS', 'IS'}
+FLOAT_TYPES = {'FLOAT', 'FLOAT4', 'FLOAT8', 'DOUBLE', 'REAL'}
+
+_TOKEN = re.compile(
+    r"(?P<space>\s+)|(?P<comment>--[^\n]*|/\*.*?\*/)|(?P<string>'(?:[^']|'')*')|(?P<quoted>\"(?:[^\"]|\"\")*\")"
+    r"|(?P<number>\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+)|(?P<ident>[A-Za-z_][\w$]*)|(?P<op>::|<=|>=|<>|!=|\|\||.)",
+    re.DOTALL
+)
+
+class NotRewritable(Exception):
+    """The query can't be proven equivalent on any rollup; it runs on the fact table."""
+
+def tokenize(sql: str) -> list:
+    """SQL tokens as (kind, text), without whitespace and comments."""
+    tokens = []
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind not in ('space', 'comment'):
+            tokens.append((kind, match.group()))
+    while tokens and tokens[-1][1] == ';':
+        tokens.pop()
+    return tokens
+
+def _name(token) -> str:
+    """Upper-case identifier name (quoted identifiers keep their case, as Snowflake does)."""
+    kind, text = token
+    if kind == 'quoted':
+        return text[1:-1].replace('""', '"')
+    return text.upper() if kind == 'ident' else None
+
+def join_tokens(tokens: list) -> str:
+    sql = ""
+    for i, (kind, text) in enumerate(tokens):
+        previous = tokens[i - 1][1] if i else None
+        if i and text not in (',', ')', '.', '::') and previous not in ('(', '.', '::') \
+                and not (text == '(' and tokens[i - 1][0] == 'ident'):
+            sql += " "
+        sql += text
+    return sql
+
+class Rollup:
+    def __init__(self, name: str, fqn: str, dimensions: list, measures: list, time_column: str = None):
+        self.name = name
+        self.fqn = fqn
+        self.dimensions = dimensions # Column names (group keys)
+        self.measures = measures # Column names stored as _SUM, _COUNT, _MIN and _MAX partials
+        self.time_column = time_column # Set if refreshes can be incremental by this column
+
+    def select_sql(self, table) -> str:
+        items = [table.columns[name].expr + f" AS {name}" for name in self.dimensions] + [f"COUNT(*) AS {ROW_COUNT}"]
+        for name in self.measures:
+            expr = table.columns[name].expr
+            items += [f"SUM({expr}) AS {name}_SUM", f"COUNT({expr}) AS {name}_COUNT",
+                      f"MIN({expr}) AS {name}_MIN", f"MAX({expr}) AS {name}_MAX"]
+        return f"SELECT {', '.join(items)} FROM {table.fqn}"
+
+    def group_by_sql(self, table) -> str:
+        return " GROUP BY " + ", ".join(table.columns[name].expr for name in self.dimensions)
+
+def rollups_for(table) -> list:
+    """
+    Rollups derived from the semantic model: every categorical dimension by day (when there is
+    a time dimension), and every categorical dimension by the groupable facts (age).
+    Identifier columns (*_ID) are too fine-grained to be worth rolling up.
+    """
+    categorical = [c.name for c in table.columns_of_kind(DIMENSION) if not c.name.endswith('_ID')]
+    time_columns = [c.name for c in table.columns_of_kind(TIME_DIMENSION)]
+    groupable = [c.name for c in table.columns_of_kind(FACT) if c.name in GROUPABLE_FACTS]
+    measures = [c.name for c in table.columns_of_kind(FACT) if c.is_numeric and not c.name.endswith('_ID')]
+    prefix = ".".join(part for part in (table.database, table.schema) if part)
+    rollups = []
+    if time_columns:
+        name = f"{table.table}_ROLLUP_DAY"
+        rollups.append(Rollup(name, f"{prefix}.{name}", time_columns[:1] + categorical, measures, time_columns[0]))
+    if groupable:
+        name = f"{table.table}_ROLLUP_{'_'.join(groupable)}"
+        rollups.append(Rollup(name, f"{prefix}.{name}", categorical + groupable, [m for m in measures if m not in groupable]))
+    name = f"{table.table}_ROLLUP_ALL"
+    rollups.append(Rollup(name, f"{prefix}.{name}", categorical, measures))
+    return sorted(rollups, key=lambda rollup: len(rollup.dimensions))
+
+class RollupManager:
+    """
+    Keeps the rollups of one fact table fresh and rewrites queries onto them. Refresh state is
+    kept in the SharedStore so every worker knows which rollups match the fact table.
+    conn serves the freshness checks of rewrite(); refreshes use a temporary table and a
+    transaction, so they run on a session of their own, opened with connect() on first use
+    (conn itself if connect is None). freshness_ttl is how long a fact table's LAST_ALTERED is
+    reused before rewrite() looks it up again.
+    """
+    def __init__(self, conn, table, store, freshness_ttl: float = 60.0, connect=None):
+        self.conn = conn
+        self.connect = connect
+        self._refresh_conn = None
+        self.table = table
+        self.store = store
+        self.freshness_ttl = freshness_ttl
+        self.rollups = rollups_for(table)
+        self.columns = {name.upper() for name in table.columns}
+        self.counters = {'rewritten': 0, 'not_rewritable': 0, 'stale': 0, 'refreshes': 0, 'incremental': 0}
+        self._last_altered, self._checked_at = None, 0.0
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params=None, conn=None) -> list:
+        cursor = (conn or self.conn).cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else []
+        finally:
+            cursor.close()
+
+    # --- Freshness ---
+
+    def base_last_altered(self) -> str:
+        """LAST_ALTERED of the fact table (metadata only, no warehouse), reused for freshness_ttl seconds."""
+        with self._lock:
+            if self._last_altered is not None and time.time() - self._checked_at < self.freshness_ttl:
+                return self._last_altered
+        rows = self._execute(
+            f"SELECT LAST_ALTERED FROM {self.table.database}.INFORMATION_SCHEMA.TABLES "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (self.table.schema, self.table.table)
+        )
+        value = str(rows[0][0]) if rows else None
+        with self._lock:
+            self._last_altered, self._checked_at = value, time.time()
+        return value
+
+    def _state(self, rollup) -> dict:
+        value = self.store.get(ROLLUP_NAMESPACE, rollup.name)
+        return json.loads(value) if value else None
+
+    # --- Refresh ---
+
+    def _refresh_connection(self):
+        if self._refresh_conn is None:
+            self._refresh_conn = self.connect() if self.connect else self.conn
+        return self._refresh_conn
+
+    def refresh(self):
+        """Brings every stale rollup up to date; incremental by changed days where possible."""
+        conn = self._refresh_connection()
+        with self._lock:
+            self._last_altered = None # Always the current value here
+        last_altered = self.base_last_altered()
+        for rollup in self.rollups:
+            state = self._state(rollup)
+            if state and state['base_last_altered'] == last_altered:
+                continue
+            # Captured before reading, so changes made during the refresh make it stale again
+            started_at = str(self._execute("SELECT CURRENT_TIMESTAMP()", conn=conn)[0][0])
+            incremental = False
+            if state and rollup.time_column:
+                try:
+                    self._refresh_changed_days(conn, rollup, state['refreshed_at'])
+                    incremental = True
+                except Exception as e:
+                    print(f"Warning: Incremental refresh of {rollup.name} failed, rebuilding: {e}")
+            if not incremental:
+                self._execute(f"CREATE OR REPLACE TABLE {rollup.fqn} AS {rollup.select_sql(self.table)}{rollup.group_by_sql(self.table)}",
+                              conn=conn)
+            self.store.set(ROLLUP_NAMESPACE, rollup.name, json.dumps({'base_last_altered': last_altered, 'refreshed_at': started_at}))
+            self.counters['refreshes'] += 1
+            self.counters['incremental'] += incremental
+            print(f">>>>>>>>>> Rollup {rollup.name} refreshed ({'changed days' if incremental else 'full rebuild'}).")
+
+    def _refresh_changed_days(self, conn, rollup, since: str):
+        """Recomputes only the days with inserted, updated or deleted rows (needs CHANGE_TRACKING on the fact table)."""
+        time_expr = self.table.columns[rollup.time_column].expr
+        self._execute(
+            f"CREATE OR REPLACE TEMPORARY TABLE rollup_changed_days AS SELECT DISTINCT {time_expr} AS DAY_KEY "
+            f"FROM {self.table.fqn} CHANGES(INFORMATION => DEFAULT) AT(TIMESTAMP => %s::TIMESTAMP_LTZ)",
+            (since,), conn=conn
+        )
+        self._execute("BEGIN", conn=conn)
+        try:
+            self._execute(f"DELETE FROM {rollup.fqn} r USING rollup_changed_days k WHERE EQUAL_NULL(r.{rollup.time_column}, k.DAY_KEY)",
+                          conn=conn)
+            self._execute(
+                f"INSERT INTO {rollup.fqn} {rollup.select_sql(self.table)} "
+                f"WHERE EXISTS (SELECT 1 FROM rollup_changed_days k WHERE EQUAL_NULL({time_expr}, k.DAY_KEY))"
+                f"{rollup.group_by_sql(self.table)}",
+                conn=conn
+            )
+            self._execute("COMMIT", conn=conn)
+        except Exception:
+            self._execute("ROLLBACK", conn=conn)
+            raise
+
+    def enable_change_tracking(self):
+        try:
+            self._execute(f"ALTER TABLE {self.table.fqn} SET CHANGE_TRACKING = TRUE", conn=self._refresh_connection())
+        except Exception as e:
+            print(f"Warning: Could not enable change tracking on {self.table.fqn}; rollups will be rebuilt in full: {e}")
+
+    # --- Query Rewrite ---
+
+    def rewrite(self, sql: str) -> str:
+        """Returns the SQL rewritten onto a fresh rollup, or the original SQL."""
+        try:
+            rollup, rewritten = self.plan(sql)
+        except NotRewritable as e:
+            self.counters['not_rewritable'] += 1
+            if DEBUG:
+                print(f"RollupManager: not rewritten ({e}).")
+            return sql
+        state = self._state(rollup)
+        if not state or state['base_last_altered'] != self.base_last_altered():
+            self.counters['stale'] += 1
+            return sql
+        self.counters['rewritten'] += 1
+        if DEBUG:
+            print(f"RollupManager: answered from {rollup.name}: {rewritten}")
+        return rewritten
+
+    def plan(self, sql: str):
+        """Returns (rollup, rewritten_sql) or raises NotRewritable."""
+        tokens = self._inline_projection_cte(tokenize(sql))
+        names = [_name(token) for token in tokens]
+        if names.count('SELECT') != 1 or names[0] != 'SELECT':
+            raise NotRewritable("not a single SELECT")
+        blocked = BLOCKING_KEYWORDS.intersection(name for name in names if name)
+        if blocked:
+            raise NotRewritable(f"uses {', '.join(sorted(blocked))}")
+
+        # --- FROM clause: exactly the fact table, with an optional alias ---
+        from_index = self._top_level_index(tokens, 'FROM')
+        end = from_index + 1
+        while end < len(tokens) and not (_name(tokens[end]) in CLAUSE_KEYWORDS and self._depth(tokens, end) == 0):
+            end += 1
+        table_tokens = tokens[from_index + 1:end]
+        qualifiers, alias = self._table_qualifiers(table_tokens)
+        body = tokens[:from_index]
+        tail = tokens[end:]
+
+        # --- Pass 1: what the query needs ---
+        dimensions, aggregates, aliases = set(), [], set()
+        self._scan(body, qualifiers, dimensions, aggregates, aliases)
+        self._scan(tail, qualifiers, dimensions, aggregates, aliases)
+        has_group_by = any(_name(token) == 'GROUP' for token in tail)
+        distinct = len(body) > 1 and _name(body[1]) == 'DISTINCT'
+        if not aggregates and not has_group_by and not distinct:
+            raise NotRewritable("row-level query")
+
+        rollup = self._choose(dimensions, aggregates)
+        rewritten = self._emit(body, qualifiers, rollup) + [('ident', 'FROM'), ('ident', rollup.fqn)]
+        rewritten += alias + self._emit(tail, qualifiers, rollup)
+        return rollup, join_tokens(rewritten)
+
+    def _inline_projection_cte(self, tokens: list) -> list:
+        """
+        Cortex Analyst wraps the table in `WITH __t AS (SELECT col, ... FROM table) SELECT ... FROM __t`.
+        A CTE that only projects columns of the fact table is replaced by the table itself.
+        """
+        if not tokens or _name(tokens[0]) != 'WITH':
+            return tokens
+        if len(tokens) < 5 or _name(tokens[2]) != 'AS' or tokens[3][1] != '(':
+            raise NotRewritable("unsupported WITH clause")
+        cte_name = _name(tokens[1])
+        close = self._matching_paren(tokens, 3)
+        inner = tokens[4:close]
+        inner_names = [_name(token) for token in inner]
+        if not inner_names or inner_names[0] != 'SELECT' or 'FROM' not in inner_names:
+            raise NotRewritable("unsupported WITH clause")
+        from_index = inner_names.index('FROM')
+        self._table_qualifiers(inner[from_index + 1:])
+        items = inner[1:from_index]
+        i = 0
+        while i < len(items):
+            column = _name(items[i])
+            if column not in self.columns:
+                raise NotRewritable("CTE computes expressions")
+            i += 1
+            if i < len(items) and _name(items[i]) == 'AS':
+                if i + 1 >= len(items) or _name(items[i + 1]) != column:
+                    raise NotRewritable("CTE renames columns")
+                i += 2
+            if i < len(items):
+                if items[i][1] != ',':
+                    raise NotRewritable("CTE computes expressions")
+                i += 1
+        rest = tokens[close + 1:]
+        if rest and rest[0][1] == ',':
+            raise NotRewritable("several CTEs")
+        # References to the CTE become references to the fact table
+        return [('ident', self.table.table) if _name(token) == cte_name else token for token in rest]
+
+    def _table_qualifiers(self, table_tokens: list) -> set:
+        """
+        Validates a FROM clause naming the fact table. Returns the names that may qualify columns
+        and the alias tokens to keep.
+        """
+        names, i = [], 0
+        while i < len(table_tokens) and table_tokens[i][0] in ('ident', 'quoted'):
+            names.append(_name(table_tokens[i]))
+            i += 1
+            if i < len(table_tokens) and table_tokens[i][1] == '.':
+                i += 1
+            else:
+                break
+        expected = [part.upper() for part in (self.table.database, self.table.schema, self.table.table) if part]
+        if not names or names != expected[-len(names):]:
+            raise NotRewritable("FROM is not the fact table")
+        rest = table_tokens[i:]
+        if rest and _name(rest[0]) == 'AS':
+            rest = rest[1:]
+        if len(rest) > 1 or (rest and rest[0][0] not in ('ident', 'quoted')):
+            raise NotRewritable("complex FROM clause")
+        return {names[-1]} | ({_name(rest[0])} if rest else set()), rest
+
+    @staticmethod
+    def _depth(tokens: list, index: int) -> int:
+        depth = 0
+        for kind, text in tokens[:index]:
+            depth += (text == '(') - (text == ')')
+        return depth
+
+    def _top_level_index(self, tokens: list, keyword: str) -> int:
+        depth = 0
+        for i, token in enumerate(tokens):
+            depth += (token[1] == '(') - (token[1] == ')')
+            if depth == 0 and _name(token) == keyword:
+                return i
+        raise NotRewritable(f"no {keyword}")
+
+    @staticmethod
+    def _matching_paren(tokens: list, open_index: int) -> int:
+        depth = 0
+        for i in range(open_index, len(tokens)):
+            depth += (tokens[i][1] == '(') - (tokens[i][1] == ')')
+            if depth == 0:
+                return i
+        raise NotRewritable("unbalanced parentheses")
+
+    def _aggregate_argument(self, tokens: list, qualifiers: set):
+        """Parses the inside of an aggregate call: returns the column, or None for *."""
+        if tokens and _name(tokens[0]) == 'DISTINCT':
+            raise NotRewritable("DISTINCT aggregate")
+        if len(tokens) == 3 and tokens[1][1] == '.' and _name(tokens[0]) in qualifiers:
+            tokens = tokens[2:]
+        if len(tokens) == 1 and tokens[0][1] == '*':
+            return None
+        if len(tokens) == 1 and _name(tokens[0]) in self.columns:
+            return _name(tokens[0])
+        raise NotRewritable("aggregate of an expression")
+
+    def _scan(self, tokens: list, qualifiers: set, dimensions: set, aggregates: list, aliases: set):
+        depth, in_order_by = 0, False
+        i = 0
+        while i < len(tokens):
+            name = _name(tokens[i])
+            previous = tokens[i - 1] if i else None
+            followed_by_paren = i + 1 < len(tokens) and tokens[i + 1][1] == '('
+            if tokens[i][1] == '*' and (previous is None or previous[1] in (',', '.') or _name(previous) in ('SELECT', 'DISTINCT')):
+                raise NotRewritable("SELECT *")
+            if name in SUPPORTED_AGGREGATES and followed_by_paren:
+                close = self._matching_paren(tokens, i + 1)
+                aggregates.append((name, self._aggregate_argument(tokens[i + 2:close], qualifiers)))
+                i = close + 1
+                continue
+            if followed_by_paren and tokens[i][0] == 'ident' and name not in ROW_FUNCTIONS and name not in PAREN_KEYWORDS:
+                raise NotRewritable(f"function {name}")
+            depth += (tokens[i][1] == '(') - (tokens[i][1] == ')')
+            if depth == 0 and name == 'ORDER':
+                in_order_by = True
+            if previous is not None and (_name(previous) == 'AS' or previous[1] == '::'):
+                if depth == 0 and _name(previous) == 'AS':
+                    aliases.add(name) # Output column name; anything else after AS or :: is a type
+            elif name in self.columns and not (i + 1 < len(tokens) and tokens[i + 1][1] == '.'):
+                # ORDER BY may name an output column that shadows a fact column (SUM(x) AS x ... ORDER BY x)
+                if not (in_order_by and name in aliases):
+                    dimensions.add(name)
+            i += 1
+
+    def _choose(self, dimensions: set, aggregates: list):
+        for rollup in self.rollups: # Smallest first
+            keys = set(rollup.dimensions)
+            if not dimensions <= keys:
+                continue
+            if all(column is None or column in keys or column in rollup.measures for _, column in aggregates):
+                return rollup
+        raise NotRewritable("no rollup has these columns")
+
+    def _rewrite_aggregate(self, function: str, column: str, rollup) -> str:
+        """
+        Re-aggregates stored partials. Rows of a group share every dimension value, so a
+        dimension column aggregates by weighting each rollup row with ROW_COUNT.
+        """
+        if column is None:
+            return f"COALESCE(SUM({ROW_COUNT}), 0)"
+        if function == 'SUM' and self.table.columns[column].base_type in FLOAT_TYPES:
+            raise NotRewritable("floating-point sums depend on summation order")
+        if column in rollup.dimensions:
+            total, count = f"SUM({column} * {ROW_COUNT})", f"SUM(IFF({column} IS NULL, 0, {ROW_COUNT}))"
+        else:
+            total, count = f"SUM({column}_SUM)", f"SUM({column}_COUNT)"
+        if function == 'SUM':
+            return total
+        if function == 'COUNT':
+            return f"COALESCE({count}, 0)"
+        if column in rollup.dimensions:
+            return f"{function}({column})"
+        return f"{function}({column}_{function})"
+
+    def _emit(self, tokens: list, qualifiers: set, rollup) -> list:
+        out, i = [], 0
+        while i < len(tokens):
+            name = _name(tokens[i])
+            if name in SUPPORTED_AGGREGATES and i + 1 < len(tokens) and tokens[i + 1][1] == '(':
+                close = self._matching_paren(tokens, i + 1)
+                column = self._aggregate_argument(tokens[i + 2:close], qualifiers)
+                out.append(('ident', self._rewrite_aggregate(name, column, rollup)))
+                i = close + 1
+                continue
+            if name in qualifiers and i + 1 < len(tokens) and tokens[i + 1][1] == '.':
+                i += 2 # Columns are unqualified in the rewrite
+                continue
+            out.append(tokens[i])
+            i += 1
+        return out
@@ -0,0 +1,68 @@
+import yaml
+
+# --- Semantic Model ---
+# In-memory view of the Cortex Analyst semantic model (retail_sales_data.yaml), shared by the
+# local components that need to know the tables, columns, synonyms and sample values.
+
+DIMENSION = "dimension"
+TIME_DIMENSION = "time_dimension"
+FACT = "fact"
+
+class Column:
+    def __init__(self, spec: dict, kind: str):
+        self.name = spec['name']
+        self.expr = spec.get('expr', self.name)
+        self.data_type = spec.get('data_type', '')
+        self.kind = kind
+        self.synonyms = [str(s) for s in spec.get('synonyms', [])]
+        self.sample_values = [str(v) for v in spec.get('sample_values', [])]
+        self.description = spec.get('description', '')
+
+    @property
+    def base_type(self) -> str:
+        """Data type without precision, e.g. "NUMBER" for NUMBER(38,0)."""
+        return self.data_type.split('(')[0].strip().upper()
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.base_type in ('NUMBER', 'DECIMAL', 'NUMERIC', 'INT', 'INTEGER', 'BIGINT', 'FLOAT', 'DOUBLE', 'REAL')
+
+class Table:
+    def __init__(self, spec: dict):
+        self.name = spec['name']
+        base = spec.get('base_table', {})
+        self.database = base.get('database')
+        self.schema = base.get('schema')
+        self.table = base.get('table', self.name)
+        self.description = spec.get('description', '')
+        self.synonyms = [str(s) for s in spec.get('synonyms', [])]
+        self.columns = {}
+        for key, kind in (('dimensions', DIMENSION), ('time_dimensions', TIME_DIMENSION), ('facts', FACT), ('measures', FACT)):
+            for column_spec in spec.get(key, []) or []:
+                column = Column(column_spec, kind)
+                self.columns[column.name] = column
+
+    @property
+    def fqn(self) -> str:
+        """Fully qualified table name."""
+        return ".".join(part for part in (self.database, self.schema, self.table) if part)
+
+    def columns_of_kind(self, *kinds) -> list:
+        return [column for column in self.columns.values() if column.kind in kinds]
+
+class SemanticModel:
+    def __init__(self, spec: dict):
+        self.name = spec.get('name', '')
+        self.tables = [Table(table_spec) for table_spec in spec.get('tables', [])]
+        self.verified_queries = spec.get('verified_queries', []) or []
+
+    def table(self, name: str) -> Table:
+        for table in self.tables:
+            if table.name.upper() == name.upper() or table.table.upper() == name.upper():
+                return table
+        raise KeyError(f"Table '{name}' is not in semantic model '{self.name}'.")
+
+def load_semantic_model(path: str) -> SemanticModel:
+    """Loads a Cortex Analyst semantic model YAML file."""
+    with open(path, 'r') as f:
+        return SemanticModel(yaml.safe_load(f))
@@ -9,4 +9,8 @@ USE WAREHOUSE SLACK_S;
 create or replace stage SLACK_SEMANTIC_MODELS encryption = (TYPE = 'SNOWFLAKE_SSE') directory = ( ENABLE = true );
 
 -- Run the following statement to create a Snowflake managed internal stage to store the PDF documents.
- create or replace stage SLACK_PDFS encryption = (TYPE = 'SNOWFLAKE_SSE') directory = ( ENABLE = true );
\ No newline at end of file
+ create or replace stage SLACK_PDFS encryption = (TYPE = 'SNOWFLAKE_SSE') directory = ( ENABLE = true );
+
+-- Optional: extra warehouses for query routing by weight (see WAREHOUSE_ROUTES in fill-in-the-env.txt).
+-- CREATE WAREHOUSE IF NOT EXISTS SLACK_XS WAREHOUSE_SIZE=XSMALL AUTO_SUSPEND=60;
+-- CREATE WAREHOUSE IF NOT EXISTS SLACK_M WAREHOUSE_SIZE=MEDIUM AUTO_SUSPEND=60;
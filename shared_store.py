@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+import time
+
+DEBUG = False
+
+class SharedStore:
+    """
+    A small key/value store on a local SQLite database in WAL mode.
+    It is shared by every bot worker process on the host (see supervisor.py), so state such as
+    the "Show SQL Query" store and processed-event claims survive a worker restart and are
+    visible to whichever worker receives the follow-up interaction.
+    Values may be anything SQLite can store (str, bytes, int, float); callers serialize.
+    """
+    def __init__(self, path: str, busy_timeout: float = 10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local() # sqlite3 connections must not be shared across threads
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value BLOB,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None -> autocommit; multi-statement updates use explicit transactions.
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str):
+        """Returns the stored value, or None if it is missing or expired."""
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value, ttl: float = None):
+        """Stores a value, replacing any previous one. ttl is in seconds (None keeps it until deleted)."""
+        expires_at = time.time() + ttl if ttl else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, expires_at)
+        )
+
+    def incr(self, namespace: str, key: str, amount: float = 1, ttl: float = None) -> float:
+        """Atomically adds amount to a numeric value (starting from 0) and returns the new value."""
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = value + excluded.value",
+                (namespace, key, amount, expires_at)
+            )
+            value = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def update(self, namespace: str, key: str, func, ttl: float = None):
+        """
+        Atomically replaces a value with func(current value), where the current value is None if it
+        is missing or expired. Returns the new value; a new value of None deletes the entry.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now)
+            ).fetchone()
+            value = func(row[0] if row else None)
+            if value is None:
+                conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, value, now + ttl if ttl else None)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, namespace: str, key: str):
+        self._connection().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def claim(self, namespace: str, key: str, ttl: float, value=None) -> bool:
+        """
+        Atomically claims a key across all processes sharing the database.
+        Returns True for exactly one caller until the claim expires; used to make event handling idempotent.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, now)
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, now + ttl)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        claimed = cursor.rowcount == 1
+        if DEBUG and not claimed:
+            print(f"SharedStore: '{namespace}/{key}' already claimed by another worker.")
+        return claimed
+
+    def take_token(self, namespace: str, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        """
+        Token bucket shared by all processes: refills at rate tokens per second up to burst.
+        Takes cost tokens and returns 0, or takes nothing and returns the seconds until they are available.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            tokens, updated = (float(part) for part in row[0].split()) if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate if rate > 0 else float('inf')
+            if wait == 0.0:
+                tokens -= cost
+            # A bucket left alone until it is full again is the same as a missing one
+            ttl = (burst - tokens) / rate + 1 if rate > 0 else None
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, f"{tokens} {now}", now + ttl if ttl else None)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def trim(self, namespace: str, max_bytes: int) -> int:
+        """
+        Deletes the entries of a namespace that expire soonest until its values total at most
+        max_bytes. Returns how many were removed.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT key, LENGTH(value) FROM kv WHERE namespace = ? ORDER BY expires_at IS NULL DESC, expires_at DESC",
+                (namespace,)
+            ).fetchall()
+            total, evicted = 0, []
+            for key, size in rows: # Latest-expiring first; whatever no longer fits is evicted
+                if total + (size or 0) > max_bytes:
+                    evicted.append((namespace, key))
+                else:
+                    total += size or 0
+            conn.executemany("DELETE FROM kv WHERE namespace = ? AND key = ?", evicted)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(evicted)
+
+    def purge_expired(self) -> int:
+        """Deletes expired entries and returns how many were removed."""
+        cursor = self._connection().execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEBUG = False
+
+# --- Slack Rate-Limit Tiers ---
+# Requests per minute for each tier (https://api.slack.com/apis/rate-limits).
+TIER_LIMITS = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# Tier of each Web API method the bot calls (by WebClient method name). Unlisted methods use Tier 3.
+METHOD_TIERS = {
+    'chat_update': 3,
+    'chat_delete': 3,
+    'chat_postEphemeral': 4,
+    'files_getUploadURLExternal': 4,
+    'files_completeUploadExternal': 4,
+    'conversations_info': 3,
+    'users_info': 4,
+}
+DEFAULT_TIER = 3
+
+# chat.postMessage is "special": roughly one message per second per channel, with short bursts allowed.
+POST_MESSAGE_PER_CHANNEL_PER_SECOND = 1.0
+POST_MESSAGE_BURST = 3
+
+# Lower value runs first.
+PRIORITY_HIGH = 0 # Placeholders and final answers the user is waiting on
+PRIORITY_NORMAL = 1 # File uploads and follow-up updates
+PRIORITY_LOW = 2 # Notes and anything that can wait
+
+MAX_RATE_LIMIT_RETRIES = 3
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0 # Set from Retry-After when Slack returns 429
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+class _Job:
+    def __init__(self, method: str, kwargs: dict, priority: int, seq: int):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class SlackScheduler:
+    """
+    Queues outbound Slack Web API calls and sends them in priority order within each method's
+    rate-limit tier (and chat.postMessage's per-channel limit), so bursts of answers don't
+    cascade into 429s. A 429 pauses the method for Retry-After seconds and the call is re-queued.
+    Use call() for a blocking call or client() for a drop-in WebClient replacement.
+    """
+    def __init__(self, web_client, max_concurrent_calls: int = 4):
+        self.web_client = web_client
+        self._queue = [] # heap of _Job
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_calls, thread_name_prefix="slack-call")
+        self._dispatcher = None
+        self.counters = {'calls': 0, 'rate_limited': 0, 'failed': 0}
+
+    def submit(self, method: str, priority: int = PRIORITY_NORMAL, **kwargs) -> Future:
+        """Queues a Web API call (e.g. "chat_update") and returns a Future for its response."""
+        job = _Job(method, kwargs, priority, next(self._seq))
+        with self._cond:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="slack-scheduler", daemon=True)
+                self._dispatcher.start()
+            heapq.heappush(self._queue, job)
+            self._cond.notify()
+        return job.future
+
+    def call(self, method: str, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Queues a Web API call and waits for its response. Slack errors are raised as usual."""
+        return self.submit(method, priority, **kwargs).result()
+
+    def client(self, priority: int = PRIORITY_NORMAL) -> "ScheduledClient":
+        return ScheduledClient(self, priority)
+
+    def _bucket_keys(self, job: _Job) -> list:
+        keys = [('method', job.method)]
+        if job.method == 'chat_postMessage':
+            keys = [('channel', job.kwargs.get('channel'))]
+        return keys
+
+    def _bucket(self, key: tuple) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if key[0] == 'channel':
+                bucket = TokenBucket(POST_MESSAGE_PER_CHANNEL_PER_SECOND, POST_MESSAGE_BURST)
+            else:
+                per_minute = TIER_LIMITS[METHOD_TIERS.get(key[1], DEFAULT_TIER)]
+                # Allow short bursts of up to 10% of the per-minute allowance.
+                bucket = TokenBucket(per_minute / 60.0, max(1, per_minute // 10))
+            self._buckets[key] = bucket
+        return bucket
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                now = time.monotonic()
+                ready, shortest_wait, skipped = None, None, []
+                # Pop in priority order; the first job whose buckets have a token is sent.
+                while self._queue:
+                    job = heapq.heappop(self._queue)
+                    buckets = [self._bucket(key) for key in self._bucket_keys(job)]
+                    wait = max(bucket.wait_time(now) for bucket in buckets)
+                    if wait == 0:
+                        for bucket in buckets:
+                            bucket.take(now)
+                        ready = job
+                        break
+                    skipped.append(job)
+                    shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+                for job in skipped:
+                    heapq.heappush(self._queue, job)
+                if ready is None:
+                    self._cond.wait(timeout=shortest_wait)
+                    continue
+            self._executor.submit(self._run, ready)
+
+    def _run(self, job: _Job):
+        job.attempts += 1
+        try:
+            response = getattr(self.web_client, job.method)(**job.kwargs)
+            with self._cond: # Calls run on several executor threads
+                self.counters['calls'] += 1
+            job.future.set_result(response)
+        except Exception as e:
+            retry_after = self._retry_after(e)
+            if retry_after is not None and job.attempts <= MAX_RATE_LIMIT_RETRIES:
+                print(f"Warning: Slack rate-limited {job.method}; retrying in {retry_after}s.")
+                with self._cond:
+                    self.counters['rate_limited'] += 1
+                    now = time.monotonic()
+                    for key in self._bucket_keys(job):
+                        bucket = self._bucket(key)
+                        bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+                    heapq.heappush(self._queue, job)
+                    self._cond.notify()
+                return
+            with self._cond:
+                self.counters['failed'] += 1
+            if DEBUG:
+                print(f"SlackScheduler: {job.method} failed: {e}")
+            job.future.set_exception(e)
+
+    @staticmethod
+    def _retry_after(error: Exception):
+        """Returns the Retry-After delay in seconds if the error is a Slack 429, else None."""
+        response = getattr(error, 'response', None)
+        if response is None or getattr(response, 'status_code', None) != 429:
+            return None
+        headers = getattr(response, 'headers', {}) or {}
+        value = headers.get('Retry-After') or headers.get('retry-after') or 1
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 1.0
+
+class ScheduledClient:
+    """
+    Stands in for a slack_sdk WebClient: client.chat_update(...) etc. go through the scheduler
+    with this client's priority. Lets helpers like chart_utils.upload_chart_to_slack stay unchanged.
+    """
+    def __init__(self, scheduler: SlackScheduler, priority: int = PRIORITY_NORMAL):
+        self._scheduler = scheduler
+        self._priority = priority
+
+    def __getattr__(self, method: str):
+        def scheduled_call(**kwargs):
+            return self._scheduler.call(method, self._priority, **kwargs)
+        return scheduled_call
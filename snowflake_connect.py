@@ -0,0 +1,22 @@
+import os
+from dotenv import load_dotenv
+
+# --- Snowflake Connection for Command-Line Tools ---
+# The same key-pair connection app.py opens, built from the .env file, for the ingestion
+# and loading tools that run outside the bot.
+
+def connect_from_env(warehouse: str = None, database: str = None, schema: str = None):
+    import snowflake.connector
+
+    load_dotenv()
+    return snowflake.connector.connect(
+        user=os.getenv("DEMO_USER"),
+        authenticator="SNOWFLAKE_JWT",
+        private_key_file=os.getenv("RSA_PRIVATE_KEY_PATH"),
+        account=os.getenv("ACCOUNT"),
+        warehouse=warehouse or os.getenv("WAREHOUSE"),
+        database=database or os.getenv("DEMO_DATABASE"),
+        schema=schema or os.getenv("DEMO_SCHEMA"),
+        role=os.getenv("DEMO_USER_ROLE"),
+        host=os.getenv("HOST")
+    )
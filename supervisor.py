@@ -0,0 +1,98 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# --- Supervisor Mode ---
+# Runs N copies of app.py, each with its own Socket Mode connection. Slack spreads events
+# across the open connections; shared state lives in SharedStore (shared_store.py) and
+# duplicate deliveries are dropped through SharedStore.claim().
+
+MIN_RESTART_DELAY = 1 # Seconds before restarting a worker that exited
+MAX_RESTART_DELAY = 60 # Upper bound for the exponential restart backoff
+STABLE_RUNTIME = 60 # A worker that ran at least this long gets its backoff reset
+
+class Worker:
+    def __init__(self, worker_id: int, script_path: str):
+        self.worker_id = worker_id
+        self.script_path = script_path
+        self.proc = None
+        self.started_at = 0.0
+        self.restart_delay = MIN_RESTART_DELAY
+        self.restart_at = 0.0
+
+    def start(self):
+        env = dict(os.environ)
+        env["BOT_WORKER_ID"] = str(self.worker_id)
+        env["BOT_WORKERS"] = "1" # Workers never start a supervisor of their own
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", self.script_path],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True
+        )
+        self.started_at = time.time()
+        threading.Thread(target=self._relay_output, name=f"worker-{self.worker_id}-output", daemon=True).start()
+        print(f">>>>>>>>>> Started worker {self.worker_id} (pid {self.proc.pid}).")
+
+    def _relay_output(self):
+        """Prefixes each line of the worker's output with its id."""
+        for line in self.proc.stdout:
+            print(f"[worker {self.worker_id}] {line}", end="")
+
+def run_supervisor(num_workers: int, script_path: str):
+    """
+    Starts num_workers worker processes running script_path and restarts any that exit,
+    with exponential backoff. SIGINT/SIGTERM stop all workers and return; SIGUSR1 is passed on to them.
+    """
+    workers = [Worker(i, script_path) for i in range(num_workers)]
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Supervisor received signal {signum}, stopping workers...")
+        stopping.set()
+
+    def forward_to_workers(signum, frame):
+        # SIGUSR1 starts a profile (see profiling.py) in every worker
+        for worker in workers:
+            if worker.proc is not None and worker.proc.poll() is None:
+                worker.proc.send_signal(signum)
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, forward_to_workers)
+
+    for worker in workers:
+        worker.start()
+
+    while not stopping.wait(timeout=1):
+        now = time.time()
+        for worker in workers:
+            if worker.proc is None:
+                if now >= worker.restart_at:
+                    worker.start()
+                continue
+            exit_code = worker.proc.poll()
+            if exit_code is None:
+                continue
+            if now - worker.started_at >= STABLE_RUNTIME:
+                worker.restart_delay = MIN_RESTART_DELAY
+            print(f"Warning: Worker {worker.worker_id} exited with code {exit_code}, restarting in {worker.restart_delay}s.")
+            worker.proc = None
+            worker.restart_at = now + worker.restart_delay
+            worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+
+    for worker in workers:
+        if worker.proc is not None and worker.proc.poll() is None:
+            worker.proc.terminate()
+    for worker in workers:
+        if worker.proc is not None:
+            try:
+                worker.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                worker.proc.kill()
+    print(">>>>>>>>>> All workers stopped.")
@@ -0,0 +1,7 @@
+# Makes the top-level modules importable when pytest is run from the repository root:
+# python3 -m pytest tests
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from memory_budget import MemoryAccountant
+from rate_limiter import DEFAULT_LIMITS, FairDispatcher, ReloadingConfig
+
+def dispatcher(**limits):
+    return FairDispatcher(ReloadingConfig(None, dict(DEFAULT_LIMITS, **limits)), max_concurrent_key="http_max_concurrent")
+
+async def with_small_executor(coroutine, threads=3):
+    # Each request also does blocking work in the default executor, as async_app's handlers do
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(threads))
+    return await asyncio.wait_for(coroutine, 10)
+
+def test_queued_questions_do_not_starve_the_executor():
+    turns = dispatcher(http_max_concurrent=1, max_queue=20, max_wait_seconds=1000)
+    finished = []
+
+    async def request(number):
+        await turns.acquire_async("C1")
+        try:
+            await asyncio.to_thread(time.sleep, 0.01)
+            finished.append(number)
+        finally:
+            turns.release(0.01)
+
+    async def main():
+        await asyncio.gather(*(request(number) for number in range(8)))
+    asyncio.run(with_small_executor(main()))
+    assert sorted(finished) == list(range(8))
+    assert turns.running == 0
+
+def test_cancelled_waiter_leaves_the_queue():
+    turns = dispatcher(http_max_concurrent=1, max_queue=20, max_wait_seconds=1000)
+
+    async def main():
+        await turns.acquire_async("C1")
+        waiter = asyncio.ensure_future(turns.acquire_async("C2"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        turns.release()
+    asyncio.run(main())
+    assert turns.running == 0
+    assert turns._waiting == []
+
+def test_queued_requests_wait_for_memory_without_a_thread():
+    memory = MemoryAccountant(budget_bytes=100, request_reserve=60, queue_timeout=5)
+    finished, queued = [], []
+
+    async def on_queued():
+        queued.append(True)
+
+    async def request(number):
+        lease = await memory.admit_async(on_queued=on_queued)
+        try:
+            await asyncio.to_thread(time.sleep, 0.01)
+            finished.append(number)
+        finally:
+            lease.release()
+
+    async def main():
+        await asyncio.gather(*(request(number) for number in range(6)))
+    asyncio.run(with_small_executor(main()))
+    assert sorted(finished) == list(range(6))
+    assert len(queued) == 5
+    assert memory.active == 0 and memory.waiting == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from event_filter import EventFilter
+
+def body(event_id='Ev1', **event):
+    return {'event_id': event_id, 'event': dict({'type': 'message', 'text': 'total sales?', 'user': 'U1',
+                                                  'client_msg_id': f'msg-{event_id}'}, **event)}
+
+def test_questions_from_people_pass():
+    events = EventFilter(report_every=0)
+    assert events.check(body()) is None
+    assert events.check(body('Ev2', subtype='thread_broadcast')) is None
+    assert events.counters['passed'] == 2
+
+@pytest.mark.parametrize('event, reason', [
+    ({'bot_id': 'B1'}, 'dropped_bot'),
+    ({'bot_profile': {'name': 'other bot'}}, 'dropped_bot'),
+    ({'subtype': 'bot_message'}, 'dropped_subtype'),
+    ({'subtype': 'message_changed'}, 'dropped_subtype'), # Edits
+    ({'subtype': 'message_deleted'}, 'dropped_subtype'),
+    ({'text': '   '}, 'dropped_empty'),
+])
+def test_non_questions_are_dropped(event, reason):
+    events = EventFilter(report_every=0)
+    assert events.check(body(**event)) == reason
+    assert events.counters[reason] == 1 and events.counters['passed'] == 0
+
+def test_the_bots_own_messages_are_dropped():
+    events = EventFilter(report_every=0)
+    assert events.check(body(user='UBOT'), bot_user_id='UBOT') == 'dropped_bot'
+    assert events.check(body('Ev2', user='U1'), bot_user_id='UBOT') is None
+
+def test_retries_and_duplicate_deliveries_are_dropped():
+    events = EventFilter(report_every=0)
+    assert events.check(body('Ev1')) is None
+    assert events.check(body('Ev1')) == 'dropped_duplicate' # Slack retry: same event_id
+    # Same message delivered as another event (e.g. message and app_mention)
+    assert events.check(body('Ev2', client_msg_id='msg-Ev1')) == 'dropped_duplicate'
+    assert events.counters['received'] == 3 and events.counters['dropped_duplicate'] == 2
+
+def test_seen_keys_expire_and_are_bounded():
+    events = EventFilter(window_seconds=0, report_every=0)
+    assert events.check(body('Ev1')) is None
+    assert events.check(body('Ev1')) is None # Outside the window, no longer remembered
+
+    events = EventFilter(max_entries=2, report_every=0)
+    events.check(body('Ev1'))
+    events.check(body('Ev2'))
+    assert events.stats()['seen_set_size'] == 2
+    assert events.check(body('Ev1')) is None # Evicted to make room
+
+def test_record_drop_reclassifies_a_passed_event():
+    events = EventFilter(report_every=0)
+    assert events.check(body()) is None
+    assert events.record_drop('dropped_claimed') == 'dropped_claimed'
+    assert events.counters['passed'] == 0 and events.counters['dropped_claimed'] == 1
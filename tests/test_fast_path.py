@@ -0,0 +1,37 @@
+import os
+
+from fast_path import FastPathRouter
+from semantic_model import load_semantic_model
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'retail_sales_data.yaml')
+
+def plan(question):
+    router = FastPathRouter(load_semantic_model(MODEL_FILE), report_every=0)
+    return router._plan(question)[0]
+
+def test_values_of_one_column_are_alternatives():
+    sql = plan("sales by product category for male and female")
+    assert "IN ('Male', 'Female')" in sql
+    assert " AND " not in sql
+
+def test_two_categories_are_summed_together():
+    sql = plan("total sales for beauty and clothing")
+    assert "IN ('Beauty', 'Clothing')" in sql
+    assert " AND " not in sql
+
+def test_values_of_different_columns_narrow_down():
+    sql = plan("total sales for female and beauty")
+    assert "= 'Female' AND " in sql and "= 'Beauty'" in sql
+
+def test_superlatives_with_a_grouping_go_to_the_agent():
+    # "the gender with the highest total", not each gender's largest transaction
+    assert plan("highest sales by gender") is None
+    assert plan("lowest sales per product category") is None
+    assert plan("biggest sales monthly") is None
+    assert "MAX(TOTAL_AMOUNT)" in plan("highest sales")
+    assert "MAX(TOTAL_AMOUNT)" in plan("max sales by gender")
+
+def test_per_before_a_measure_is_a_ratio_not_a_grouping():
+    assert plan("sales per unit") is None
+    assert plan("total sales per quantity") is None
+    assert "GROUP BY GENDER" in plan("sales per gender")
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+
+from memory_budget import MemoryAccountant, MemoryBudgetExceeded, estimate_rows_bytes
+
+def test_the_first_request_is_always_admitted():
+    memory = MemoryAccountant(budget_bytes=10, request_reserve=60, queue_timeout=0)
+    with memory.admit():
+        assert memory.active == 1
+        assert memory.used_bytes == 60
+        with pytest.raises(MemoryBudgetExceeded):
+            memory.admit()
+    assert memory.used_bytes == 0 and memory.active == 0
+
+def test_queued_request_is_admitted_when_room_frees_up():
+    memory = MemoryAccountant(budget_bytes=100, request_reserve=60, queue_timeout=5)
+    first = memory.admit()
+    queued = threading.Event()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(memory.admit(on_queued=queued.set)))
+    waiter.start()
+    assert queued.wait(5)
+    assert memory.waiting == 1 and not admitted
+    first.release()
+    waiter.join(5)
+    assert len(admitted) == 1 and memory.active == 1 and memory.waiting == 0
+    assert memory.counters == {'admitted': 2, 'queued': 1, 'rejected': 0, 'too_large': 0}
+
+def test_queued_request_is_rejected_after_the_timeout():
+    memory = MemoryAccountant(budget_bytes=100, request_reserve=60, queue_timeout=0.05)
+    with memory.admit():
+        with pytest.raises(MemoryBudgetExceeded):
+            memory.admit()
+    assert memory.waiting == 0
+    assert memory.counters['rejected'] == 1
+
+def test_a_request_growing_past_its_limit_is_stopped():
+    memory = MemoryAccountant(budget_bytes=1000, request_reserve=10, max_request_bytes=100)
+    lease = memory.admit()
+    lease.track('rows', 50)
+    lease.track('frame', 40)
+    assert lease.size == 90 and memory.used_bytes == 90
+    with pytest.raises(MemoryBudgetExceeded):
+        lease.track('chart', 20)
+    assert memory.counters['too_large'] == 1
+    lease.release()
+    lease.track('rows', 500) # Ignored once released
+    assert memory.used_bytes == 0 and memory.peak_bytes == 110
+
+def test_estimate_rows_bytes_scales_the_sample():
+    rows = [(1, 'a'), (2, 'b')]
+    assert estimate_rows_bytes(rows, 10) == estimate_rows_bytes(rows, 2) * 5
+    assert estimate_rows_bytes([], 10) == 0
+
+def test_admit_async_wakes_on_release_and_on_shrink():
+    memory = MemoryAccountant(budget_bytes=80, request_reserve=30, queue_timeout=5)
+
+    async def main():
+        first = await memory.admit_async()
+        first.track('rows', 80) # 80 + 30 no longer fits
+        second = asyncio.ensure_future(memory.admit_async())
+        await asyncio.sleep(0.01)
+        assert not second.done() and memory.waiting == 1
+        first.track('rows', 10) # Back down to its 30 byte reservation
+        second_lease = await asyncio.wait_for(second, 1)
+
+        third = asyncio.ensure_future(memory.admit_async())
+        await asyncio.sleep(0.01)
+        assert not third.done()
+        first.release()
+        third_lease = await asyncio.wait_for(third, 1)
+        second_lease.release()
+        third_lease.release()
+    asyncio.run(main())
+    assert memory.active == 0 and memory.waiting == 0 and memory.used_bytes == 0
+    assert memory.counters == {'admitted': 3, 'queued': 2, 'rejected': 0, 'too_large': 0}
+
+def test_admit_async_is_rejected_after_the_timeout():
+    memory = MemoryAccountant(budget_bytes=100, request_reserve=60, queue_timeout=0.05)
+
+    async def main():
+        with await memory.admit_async():
+            with pytest.raises(MemoryBudgetExceeded):
+                await memory.admit_async()
+    asyncio.run(main())
+    assert memory.waiting == 0 and memory.counters['rejected'] == 1
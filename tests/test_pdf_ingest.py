@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+import pdf_ingest
+from pdf_ingest import SQLiteBackend, diff_stage, run, split_text
+
+
+# --- diff_stage ---
+
+def test_diff_stage_finds_new_changed_and_removed_files():
+    stage = {
+        'new.pdf': ('m-new', '2024-01-02'),
+        'changed.pdf': ('m-2', '2024-01-02'),
+        'same.pdf': ('m-same', '2024-01-01'),
+    }
+    manifest = {
+        'changed.pdf': ('m-1', '2024-01-01'),
+        'same.pdf': ('m-same', '2024-01-01'),
+        'deleted.pdf': ('m-old', '2024-01-01'),
+    }
+    assert diff_stage(stage, manifest) == (['changed.pdf', 'new.pdf'], ['deleted.pdf'])
+
+
+def test_diff_stage_uses_last_modified_only_without_md5():
+    manifest = {'a.pdf': ('m', '2024-01-01'), 'b.pdf': (None, '2024-01-01')}
+    stage = {'a.pdf': ('m', '2024-06-01'), 'b.pdf': (None, '2024-06-01')}
+    assert diff_stage(stage, manifest) == (['b.pdf'], [])
+    assert diff_stage({'b.pdf': (None, '2024-01-01')}, {'b.pdf': (None, '2024-01-01')}) == ([], [])
+
+
+# --- split_text ---
+
+def test_split_text_carries_overlap_into_the_next_chunk():
+    assert split_text('aaaa bbbb cccc', 9, 4) == ['aaaa bbbb', 'bbbb cccc']
+    assert split_text('aaaa bbbb cccc', 9, 0) == ['aaaa bbbb', 'cccc']
+
+
+def test_split_text_boundaries():
+    assert split_text('aaaa bbbb', 9, 4) == ['aaaa bbbb'] # Exactly chunk_size fits in one chunk
+    assert split_text('', 9, 4) == []
+    assert split_text('one\n\ntwo three', 9, 0) == ['one', 'two three'] # Paragraphs split before words
+    assert split_text('abcdefghijkl xy', 9, 3) == ['abcdefghijkl', 'jkl xy'] # An overlong word is kept whole
+
+
+# --- SQLiteBackend ---
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_ingest, 'CHUNK_SIZE', 9)
+    monkeypatch.setattr(pdf_ingest, 'CHUNK_OVERLAP', 0)
+    stage_dir = tmp_path / 'stage'
+    stage_dir.mkdir()
+    backend = SQLiteBackend(str(tmp_path / 'ingest.db'), str(stage_dir))
+    backend.ensure_tables()
+    return backend
+
+
+def write_pdf(backend, name, text):
+    with open(os.path.join(backend.stage_dir, name), 'w') as f:
+        f.write(text)
+
+
+def chunk_counts(backend):
+    rows = backend.conn.execute(
+        f"SELECT RELATIVE_PATH, COUNT(*) FROM {backend.chunks_table} GROUP BY RELATIVE_PATH"
+    ).fetchall()
+    return dict(rows)
+
+
+def test_ingest_writes_and_shrinks_chunks(backend):
+    write_pdf(backend, 'a.pdf', 'aaaa bbbb cccc dddd eeee')
+    assert backend.ingest(['a.pdf']) == 3
+    assert chunk_counts(backend) == {'a.pdf': 3}
+
+    write_pdf(backend, 'a.pdf', 'aaaa zzzz') # A shorter new version drops the chunks past its end
+    assert backend.ingest(['a.pdf']) == 1
+    assert backend.conn.execute(f"SELECT PAGE_CONTENT, TITLE FROM {backend.chunks_table}").fetchall() == [('aaaa zzzz', 'a')]
+
+
+def test_record_and_delete_documents(backend):
+    write_pdf(backend, 'a.pdf', 'aaaa bbbb cccc')
+    write_pdf(backend, 'b.pdf', 'bbbb')
+    backend.ingest(['a.pdf', 'b.pdf'])
+    backend.record('a.pdf', 'm-a', '2024-01-01')
+    backend.record('a.pdf', 'm-a2', '2024-01-02')
+    backend.record('b.pdf', 'm-b', '2024-01-01')
+    assert backend.load_manifest() == {'a.pdf': ('m-a2', '2024-01-02'), 'b.pdf': ('m-b', '2024-01-01')}
+
+    backend.delete_documents(['a.pdf'])
+    assert chunk_counts(backend) == {'b.pdf': 1}
+    assert backend.load_manifest() == {'b.pdf': ('m-b', '2024-01-01')}
+
+
+def test_run_ingests_only_what_changed(backend):
+    write_pdf(backend, 'a.pdf', 'aaaa bbbb cccc')
+    write_pdf(backend, 'b.pdf', 'bbbb')
+    write_pdf(backend, 'notes.txt', 'not a pdf')
+    assert run(backend) == {'changed': 2, 'removed': 0, 'chunks': 3}
+    assert run(backend) == {'changed': 0, 'removed': 0, 'chunks': 0}
+
+    write_pdf(backend, 'a.pdf', 'aaaa')
+    os.remove(os.path.join(backend.stage_dir, 'b.pdf'))
+    assert run(backend, dry_run=True) == {'changed': 1, 'removed': 1, 'chunks': 0}
+    assert chunk_counts(backend) == {'a.pdf': 2, 'b.pdf': 1} # A dry run changes nothing
+
+    assert run(backend) == {'changed': 1, 'removed': 1, 'chunks': 1}
+    assert chunk_counts(backend) == {'a.pdf': 1}
+    assert set(backend.load_manifest()) == {'a.pdf'}
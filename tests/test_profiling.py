@@ -0,0 +1,33 @@
+import asyncio
+import os
+import signal
+import threading
+
+import pytest
+
+from profiling import profile_on_signal
+
+class FakeProfiler:
+    def __init__(self):
+        self.started = []
+
+    def start(self, seconds=None):
+        self.started.append((seconds, threading.current_thread()))
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason="no SIGUSR1 on Windows")
+def test_sigusr1_starts_a_profile_as_a_loop_callback():
+    profiler = FakeProfiler()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        profile_on_signal(profiler, 5, loop=loop)
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            for _ in range(100):
+                if profiler.started:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            loop.remove_signal_handler(signal.SIGUSR1)
+    asyncio.run(main())
+    assert profiler.started == [(5, threading.main_thread())]
@@ -0,0 +1,64 @@
+from query_guard import add_block_sample, QueryGuard, SAMPLE
+
+def test_samples_a_single_table():
+    sql = "SELECT PRODUCT_CATEGORY, SUM(TOTAL_AMOUNT) FROM DB.SCHEMA.SALES WHERE AGE > 30 GROUP BY 1"
+    assert add_block_sample(sql, 5) == (
+        "SELECT PRODUCT_CATEGORY, SUM(TOTAL_AMOUNT) FROM DB.SCHEMA.SALES SAMPLE BLOCK (5) WHERE AGE > 30 GROUP BY 1",
+        "DB.SCHEMA.SALES",
+    )
+
+def test_samples_only_one_side_of_a_join():
+    sql = "SELECT c.REGION, SUM(s.TOTAL_AMOUNT) FROM SALES s JOIN CUSTOMERS c ON s.CUSTOMER_ID = c.ID GROUP BY 1"
+    sampled, table = add_block_sample(sql, 5)
+    assert sampled.count("SAMPLE BLOCK") == 1
+    assert "FROM SALES s SAMPLE BLOCK (5) JOIN CUSTOMERS c ON" in sampled
+    assert table == "SALES"
+
+def test_samples_the_base_table_of_a_cte_once():
+    sql = (
+        "WITH __sales AS (SELECT DATE, TOTAL_AMOUNT FROM DB.SCHEMA.SALES), "
+        "monthly (MONTH, TOTAL) AS (SELECT DATE_TRUNC('MONTH', DATE), SUM(TOTAL_AMOUNT) FROM __sales GROUP BY 1) "
+        "SELECT m.MONTH, m.TOTAL FROM monthly AS m JOIN (SELECT MAX(TOTAL) AS TOP FROM monthly) t ON m.TOTAL = t.TOP"
+    )
+    sampled, table = add_block_sample(sql, 5)
+    assert sampled.count("SAMPLE BLOCK") == 1
+    assert "FROM DB.SCHEMA.SALES SAMPLE BLOCK (5))" in sampled
+    assert table == "DB.SCHEMA.SALES"
+
+def test_skips_extract_and_table_functions():
+    sampled, table = add_block_sample("SELECT EXTRACT(YEAR FROM DATE), COUNT(*) FROM SALES GROUP BY 1", 5)
+    assert sampled == "SELECT EXTRACT(YEAR FROM DATE), COUNT(*) FROM SALES SAMPLE BLOCK (5) GROUP BY 1"
+    assert add_block_sample("SELECT * FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()))", 5) is None
+
+def test_does_not_sample_twice():
+    assert add_block_sample("SELECT * FROM SALES SAMPLE BLOCK (10)", 5) is None
+    assert add_block_sample("SELECT 1", 5) is None
+
+class FakeCursor:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def execute(self, sql):
+        pass
+
+    def fetchone(self):
+        import json
+        return [json.dumps({"GlobalStats": self.stats, "Operations": []})]
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def cursor(self):
+        return FakeCursor(self.stats)
+
+def test_sample_note_names_the_sampled_table_and_percent():
+    guard = QueryGuard(limits={})
+    conn = FakeConnection({"bytesAssigned": 400 * 1024**3, "partitionsAssigned": 1000})
+    decision = guard.check("SELECT * FROM SALES s JOIN STORES t ON s.STORE_ID = t.ID", conn)
+    assert decision.action == SAMPLE
+    assert decision.sql.count("SAMPLE BLOCK (5)") == 1
+    assert "5% block sample of SALES" in decision.note
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+import query_runner
+from query_runner import QueryHandle, QueryCancelled, QueryTimeout
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.sfqid = None
+        self.description = [('CATEGORY',), ('TOTAL',)]
+
+    def execute_async(self, sql, **kwargs):
+        self.conn.submitted.append((sql, kwargs))
+        self.sfqid = f"query-{len(self.conn.submitted)}"
+
+    def get_results_from_sfqid(self, query_id):
+        self.conn.fetched.append(query_id)
+
+    def fetchall(self):
+        return [('Beauty', 10), ('Clothing', 20)]
+
+    def abort_query(self, query_id):
+        self.conn.aborted.append(query_id)
+        self.conn.running = 0
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Runs each query for the given number of status polls; running=None keeps it running."""
+    def __init__(self, running=0):
+        self.running = running
+        self.polls = 0
+        self.submitted = []
+        self.fetched = []
+        self.aborted = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_query_status_throw_if_error(self, query_id):
+        self.polls += 1
+        if self.running is None or self.polls <= self.running:
+            return 'RUNNING'
+        return 'SUCCESS'
+
+    def is_still_running(self, status):
+        return status == 'RUNNING'
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(query_runner, 'MIN_POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(query_runner, 'MAX_POLL_INTERVAL', 0.02)
+
+def test_submit_sends_the_statement_timeout_to_snowflake():
+    conn = FakeConnection()
+    submitted = []
+    QueryHandle(conn, "SELECT 1", timeout=42, on_submitted=submitted.append).run()
+    sql, kwargs = conn.submitted[0]
+    assert sql == "SELECT 1"
+    assert kwargs == {'_statement_params': {'STATEMENT_TIMEOUT_IN_SECONDS': 42}}
+    assert submitted == ["query-1"]
+
+def test_polls_until_done_and_fetches_by_query_id():
+    conn = FakeConnection(running=3)
+    df = QueryHandle(conn, "SELECT 1").run()
+    assert conn.polls == 4
+    assert conn.fetched == ["query-1"]
+    assert list(df.columns) == ['CATEGORY', 'TOTAL']
+    assert df.attrs['query_id'] == "query-1"
+    assert conn.aborted == []
+
+def test_cancel_aborts_the_running_query():
+    conn = FakeConnection(running=None)
+    handle = QueryHandle(conn, "SELECT 1", on_submitted=lambda query_id: threading.Timer(0.05, handle.cancel).start())
+    with pytest.raises(QueryCancelled):
+        handle.run()
+    assert "query-1" in conn.aborted
+    assert conn.fetched == []
+
+def test_cancel_before_submission_runs_nothing():
+    conn = FakeConnection()
+    handle = QueryHandle(conn, "SELECT 1")
+    handle.cancel()
+    with pytest.raises(QueryCancelled):
+        handle.run()
+    assert conn.submitted == []
+
+def test_timeout_aborts_the_query():
+    conn = FakeConnection(running=None)
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        QueryHandle(conn, "SELECT 1", timeout=0.1).run()
+    assert time.monotonic() - start < 2
+    assert conn.aborted == ["query-1"]
+
+def test_run_async_polls_and_times_out_like_run():
+    import asyncio
+    conn = FakeConnection(running=2)
+    df = asyncio.run(QueryHandle(conn, "SELECT 1").run_async())
+    assert len(df) == 2
+    conn = FakeConnection(running=None)
+    with pytest.raises(QueryTimeout):
+        asyncio.run(QueryHandle(conn, "SELECT 1", timeout=0.1).run_async())
+    assert conn.aborted == ["query-1"]
+
+def test_discarded_async_speculation_aborts_off_the_event_loop(monkeypatch):
+    import asyncio
+    from query_runner import AsyncSpeculativeQuery
+    conn = FakeConnection(running=None)
+    abort_threads = []
+    abort_query = FakeCursor.abort_query
+
+    def record_thread(cursor, query_id):
+        abort_threads.append(threading.current_thread())
+        abort_query(cursor, query_id)
+    monkeypatch.setattr(FakeCursor, 'abort_query', record_thread)
+
+    async def main():
+        speculative = AsyncSpeculativeQuery(conn)
+        speculative.start("SELECT 1")
+        while not conn.submitted:
+            await asyncio.sleep(0.01)
+        assert await speculative.result_for("SELECT 2") is None # Different SQL: the speculation is discarded
+        for _ in range(100):
+            if conn.aborted:
+                break
+            await asyncio.sleep(0.01)
+    asyncio.run(main())
+    assert conn.aborted == ["query-1"]
+    assert threading.main_thread() not in abort_threads
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from rate_limiter import DEFAULT_LIMITS, FairDispatcher, Overloaded, RateLimited, RateLimiter, ReloadingConfig
+from shared_store import SharedStore
+
+def config(**limits):
+    return ReloadingConfig(None, dict(DEFAULT_LIMITS, **limits))
+
+# --- FairDispatcher ---
+
+def test_waiting_channels_take_turns_by_weight():
+    turns = FairDispatcher(config(max_concurrent=1, max_queue=20, max_wait_seconds=1000,
+                                  channels={"HEAVY": {"weight": 3}}))
+    order = []
+
+    async def request(channel_id, name):
+        await turns.acquire_async(channel_id)
+        order.append(name)
+        await asyncio.sleep(0)
+        turns.release()
+
+    async def main():
+        await turns.acquire_async("OTHER")
+        queued = [asyncio.ensure_future(request(channel_id, name)) for channel_id, name in
+                  [("LIGHT", "light 1"), ("LIGHT", "light 2"), ("HEAVY", "heavy 1"), ("HEAVY", "heavy 2"), ("HEAVY", "heavy 3")]]
+        await asyncio.sleep(0.01)
+        turns.release()
+        await asyncio.wait_for(asyncio.gather(*queued), 5)
+    asyncio.run(main())
+    # Virtual finish times: heavy 1/3, 2/3, 1; light 1, 2 (ties go to the earlier question)
+    assert order == ["heavy 1", "heavy 2", "light 1", "heavy 3", "light 2"]
+    assert turns.running == 0
+
+def test_sheds_when_the_queue_is_full():
+    turns = FairDispatcher(config(max_concurrent=1, max_queue=1, max_wait_seconds=1000))
+
+    async def main():
+        await turns.acquire_async("C1")
+        waiter = asyncio.ensure_future(turns.acquire_async("C2"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await turns.acquire_async("C3")
+        turns.release()
+        await waiter
+        turns.release()
+    asyncio.run(main())
+    assert turns.counters == {'started': 2, 'queued': 1, 'shed': 1}
+
+def test_sheds_when_the_expected_wait_is_too_long():
+    turns = FairDispatcher(config(max_concurrent=1, max_queue=20, max_wait_seconds=15))
+    turns.service_seconds = 10
+
+    async def main():
+        await turns.acquire_async("C1")
+        waiter = asyncio.ensure_future(turns.acquire_async("C2")) # Expected to wait 10s
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded): # Expected to wait 20s
+            await turns.acquire_async("C3")
+        waiter.cancel()
+        turns.release()
+    asyncio.run(main())
+    assert turns.counters['shed'] == 1
+    assert turns.running == 0
+
+def test_a_turn_granted_to_a_cancelled_waiter_is_passed_on():
+    turns = FairDispatcher(config(max_concurrent=1, max_queue=20, max_wait_seconds=1000))
+
+    async def main():
+        await turns.acquire_async("C1")
+        cancelled = asyncio.ensure_future(turns.acquire_async("C2"))
+        next_in_line = asyncio.ensure_future(turns.acquire_async("C3"))
+        await asyncio.sleep(0.01)
+        turns.release() # Grants C2 its turn...
+        cancelled.cancel() # ...which is cancelled before it sees it
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await asyncio.wait_for(next_in_line, 5)
+        assert turns.running == 1
+        turns.release()
+    asyncio.run(main())
+    assert turns.running == 0
+    assert turns._waiting == []
+
+# --- ReloadingConfig ---
+
+def write_json(path, text, mtime):
+    with open(path, "w") as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+def test_config_reloads_and_keeps_the_last_good_settings(tmp_path):
+    path = str(tmp_path / "rate_limits.json")
+    limits = ReloadingConfig(path, DEFAULT_LIMITS, check_seconds=0)
+    assert limits.get() == DEFAULT_LIMITS # No file yet
+
+    write_json(path, json.dumps({"user": {"per_minute": 10}, "max_queue": 2}), 1000)
+    settings = limits.get()
+    assert settings["user"] == {"per_minute": 10, "burst": 3} # Merged over the defaults
+    assert settings["max_queue"] == 2
+
+    write_json(path, "{not json", 2000)
+    assert limits.get() == settings
+
+    os.remove(path)
+    assert limits.get() == DEFAULT_LIMITS
+
+# --- RateLimiter ---
+
+def test_rate_limiter_limits_users_and_channels(tmp_path):
+    store = SharedStore(str(tmp_path / "store.db"))
+    limiter = RateLimiter(store, config(user={"per_minute": 60, "burst": 2}, channel={"per_minute": 60, "burst": 3},
+                                        users={"VIP": {"per_minute": 0}}))
+    limiter.check("U1", "C1")
+    limiter.check("U1", "C1")
+    with pytest.raises(RateLimited) as limited:
+        limiter.check("U1", "C1")
+    assert limited.value.scope == "user"
+    assert 0 < limited.value.retry_after <= 1
+
+    limiter.check("VIP", "C1") # No user limit; takes the channel's last token
+    with pytest.raises(RateLimited) as limited:
+        limiter.check("VIP", "C1")
+    assert limited.value.scope == "channel"
+    assert limiter.counters == {'allowed': 3, 'limited_user': 1, 'limited_channel': 1}
@@ -0,0 +1,47 @@
+import time
+
+import pandas as pd
+
+from result_cache import RESULTS_NAMESPACE, ResultCache
+from shared_store import SharedStore
+
+def frame(rows):
+    return pd.DataFrame({'PRODUCT_CATEGORY': [f'category {n}' for n in range(rows)], 'SALES': list(range(rows))})
+
+def test_results_round_trip_between_workers(tmp_path):
+    path = str(tmp_path / 'store.db')
+    assert ResultCache(SharedStore(path)).put('1.0', frame(20))
+    other_worker = ResultCache(SharedStore(path))
+    assert other_worker.get('1.0').equals(frame(20))
+    assert other_worker.get('2.0') is None
+    assert other_worker.counters == {'stored': 0, 'too_large': 0, 'hits': 1, 'misses': 1}
+
+def test_results_expire_after_the_ttl(tmp_path):
+    results = ResultCache(SharedStore(str(tmp_path / 'store.db')), ttl=0.05)
+    results.put('1.0', frame(5))
+    assert results.get('1.0') is not None
+    time.sleep(0.1)
+    assert results.get('1.0') is None
+
+def test_oversized_results_are_not_cached(tmp_path):
+    results = ResultCache(SharedStore(str(tmp_path / 'store.db')), max_result_bytes=100)
+    assert not results.put('1.0', frame(1000))
+    assert results.get('1.0') is None
+    assert results.counters['too_large'] == 1
+
+def test_soonest_expiring_results_are_evicted_over_the_total_budget(tmp_path):
+    store = SharedStore(str(tmp_path / 'store.db'))
+    results = ResultCache(store, max_total_bytes=1)
+    results.put('probe', frame(50))
+    assert results.get('probe') is None # Over the total budget on its own
+
+    results = ResultCache(store, max_total_bytes=10**9)
+    results.put('1.0', frame(50))
+    entry_bytes = store._connection().execute(
+        "SELECT LENGTH(value) FROM kv WHERE namespace = ? AND key = '1.0'", (RESULTS_NAMESPACE,)).fetchone()[0]
+    results.max_total_bytes = int(entry_bytes * 2.5)
+    results.put('2.0', frame(50))
+    time.sleep(0.01)
+    results.put('3.0', frame(50)) # Three no longer fit: the one expiring soonest goes
+    assert results.get('1.0') is None
+    assert results.get('2.0') is not None and results.get('3.0') is not None
@@ -0,0 +1,117 @@
+import sys
+
+import pytest
+
+import query_runner
+from result_export import CSV, PARQUET, ExportError, export_query
+
+ROWS = [('Beauty', 10), ('Clothing', 20), ('Electronics', 30)]
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.sfqid = None
+        self.description = [('CATEGORY',), ('TOTAL',)]
+        self.position = 0
+
+    def execute_async(self, sql, **kwargs):
+        self.conn.submitted.append(sql)
+        self.sfqid = f"query-{len(self.conn.submitted)}"
+
+    def get_results_from_sfqid(self, query_id):
+        if query_id in self.conn.expired:
+            raise RuntimeError(f"Result of {query_id} is no longer available")
+        self.conn.fetched.append(query_id)
+
+    def fetchmany(self, size):
+        batch = self.conn.rows[self.position:self.position + size]
+        self.position += len(batch)
+        return batch
+
+    def fetch_arrow_batches(self):
+        import pyarrow as pa
+        for start in range(0, len(self.conn.rows), 2):
+            rows = self.conn.rows[start:start + 2]
+            yield pa.table({'CATEGORY': [row[0] for row in rows], 'TOTAL': [row[1] for row in rows]})
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, rows=ROWS, expired=()):
+        self.rows = list(rows)
+        self.expired = set(expired)
+        self.submitted = []
+        self.fetched = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_query_status_throw_if_error(self, query_id):
+        return 'SUCCESS'
+
+    def is_still_running(self, status):
+        return False
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(query_runner, 'MIN_POLL_INTERVAL', 0.01)
+
+def sampled(sql):
+    """Stands in for the query guard running the query on a sample."""
+    return f"{sql} LIMIT 2", "Results are based on a sample of the data.", None
+
+def test_csv_is_streamed_in_batches():
+    conn = FakeConnection()
+    export = export_query(conn, "SELECT 1", CSV, "sales", batch_rows=2)
+    assert export.filename == "sales.csv"
+    assert export.rows == 3
+    assert export.file.read().decode() == "CATEGORY,TOTAL\r\nBeauty,10\r\nClothing,20\r\nElectronics,30\r\n"
+    assert export.size == len("CATEGORY,TOTAL\r\nBeauty,10\r\nClothing,20\r\nElectronics,30\r\n")
+    export.close()
+
+def test_empty_csv_still_has_the_header():
+    export = export_query(FakeConnection(rows=[]), "SELECT 1", CSV, "sales")
+    assert export.rows == 0
+    assert export.file.read().decode() == "CATEGORY,TOTAL\r\n"
+
+def test_large_exports_spill_to_disk():
+    small = export_query(FakeConnection(), "SELECT 1", CSV, "sales")
+    assert not small.file._rolled
+    large = export_query(FakeConnection(rows=ROWS * 100), "SELECT 1", CSV, "sales", spool_bytes=1024)
+    assert large.file._rolled # Past spool_bytes the spooled file moved to local disk
+    assert large.rows == 300 and large.file.read().count(b"\r\n") == 301
+    small.close()
+    large.close()
+
+def test_stored_result_is_read_with_its_note():
+    conn = FakeConnection()
+    export = export_query(conn, "SELECT 1", CSV, "sales", query_id="query-0",
+                          note="Results are based on a sample of the data.", prepare=sampled)
+    assert conn.submitted == [] # No warehouse time
+    assert conn.fetched == ["query-0"]
+    assert export.note == "Results are based on a sample of the data."
+
+def test_expired_result_runs_the_query_again_through_the_guard():
+    conn = FakeConnection(expired={"query-0"})
+    export = export_query(conn, "SELECT 1", CSV, "sales", query_id="query-0", prepare=sampled)
+    assert conn.submitted == ["SELECT 1 LIMIT 2"]
+    assert export.note == "Results are based on a sample of the data." # The row-limit note of the new run
+    assert export.rows == 3
+
+def test_unknown_format_is_refused():
+    with pytest.raises(ExportError):
+        export_query(FakeConnection(), "SELECT 1", "xlsx", "sales")
+
+def test_parquet_without_pyarrow_is_an_export_error(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(ExportError):
+        export_query(FakeConnection(), "SELECT 1", PARQUET, "sales")
+
+def test_parquet_is_written_one_row_group_per_chunk():
+    pq = pytest.importorskip("pyarrow.parquet")
+    export = export_query(FakeConnection(), "SELECT 1", PARQUET, "sales")
+    assert export.filename == "sales.parquet" and export.rows == 3
+    parquet_file = pq.ParquetFile(export.file)
+    assert parquet_file.num_row_groups == 2
+    assert parquet_file.read().to_pydict() == {'CATEGORY': ['Beauty', 'Clothing', 'Electronics'], 'TOTAL': [10, 20, 30]}
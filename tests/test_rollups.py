@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+from rollups import RollupManager, NotRewritable, ROLLUP_NAMESPACE
+from semantic_model import load_semantic_model
+from shared_store import SharedStore
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'retail_sales_data.yaml')
+TABLE = "SLACK_DEMO.SLACK_SCHEMA.RETAIL_SALES_DATASET"
+ROLLUP_ALL = TABLE + "_ROLLUP_ALL"
+ROLLUP_DAY = TABLE + "_ROLLUP_DAY"
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [('LAST_ALTERED',)]
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+
+    def fetchall(self):
+        return [(self.conn.last_altered,)]
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, last_altered="2026-10-01 08:00:00"):
+        self.last_altered = last_altered
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+def manager(store=None, conn=None, **kwargs):
+    return RollupManager(conn, load_semantic_model(MODEL_FILE).tables[0], store, **kwargs)
+
+@pytest.mark.parametrize("sql, expected", [
+    (f"SELECT PRODUCT_CATEGORY, SUM(TOTAL_AMOUNT) AS TOTAL FROM {TABLE} "
+     "WHERE DATE >= '2023-01-01' AND DATE < '2023-04-01' GROUP BY PRODUCT_CATEGORY ORDER BY TOTAL DESC",
+     f"SELECT PRODUCT_CATEGORY, SUM(TOTAL_AMOUNT_SUM) AS TOTAL FROM {ROLLUP_DAY} "
+     "WHERE DATE >= '2023-01-01' AND DATE < '2023-04-01' GROUP BY PRODUCT_CATEGORY ORDER BY TOTAL DESC"),
+    (f"SELECT DATE_TRUNC('MONTH', DATE) AS MONTH, COUNT(*) AS N, MIN(AGE), MAX(QUANTITY) FROM {TABLE} GROUP BY 1 ORDER BY 1",
+     f"SELECT DATE_TRUNC('MONTH', DATE) AS MONTH, COALESCE(SUM(ROW_COUNT), 0) AS N, MIN(AGE_MIN), MAX(QUANTITY_MAX) "
+     f"FROM {ROLLUP_DAY} GROUP BY 1 ORDER BY 1"),
+    (f"WITH __retail AS (SELECT DATE, GENDER, TOTAL_AMOUNT FROM {TABLE}) "
+     "SELECT GENDER, SUM(TOTAL_AMOUNT) FROM __retail WHERE YEAR(DATE) = 2023 GROUP BY GENDER",
+     f"SELECT GENDER, SUM(TOTAL_AMOUNT_SUM) FROM {ROLLUP_DAY} WHERE YEAR(DATE) = 2023 GROUP BY GENDER"),
+    (f"SELECT s.GENDER, COUNT(s.TOTAL_AMOUNT) FROM {TABLE} s GROUP BY s.GENDER",
+     f"SELECT GENDER, COALESCE(SUM(TOTAL_AMOUNT_COUNT), 0) FROM {ROLLUP_ALL} s GROUP BY GENDER"),
+    (f"SELECT GENDER, SUM(TOTAL_AMOUNT) FROM {TABLE} GROUP BY GENDER HAVING MAX(TOTAL_AMOUNT) > 100",
+     f"SELECT GENDER, SUM(TOTAL_AMOUNT_SUM) FROM {ROLLUP_ALL} GROUP BY GENDER HAVING MAX(TOTAL_AMOUNT_MAX) > 100"),
+    (f"SELECT AGE, SUM(QUANTITY) FROM {TABLE} GROUP BY AGE",
+     f"SELECT AGE, SUM(QUANTITY_SUM) FROM {TABLE}_ROLLUP_AGE GROUP BY AGE"),
+])
+def test_equivalent_queries_are_rewritten(sql, expected):
+    assert manager().plan(sql)[1] == expected
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT GENDER, AVG(TOTAL_AMOUNT) FROM {TABLE} GROUP BY GENDER",
+    f"SELECT COUNT(DISTINCT PRODUCT_CATEGORY) FROM {TABLE}",
+    f"SELECT COUNT(DISTINCT CUSTOMER_ID) FROM {TABLE}",
+    f"SELECT CUSTOMER_ID, SUM(TOTAL_AMOUNT) FROM {TABLE} GROUP BY CUSTOMER_ID",
+    f"SELECT s.GENDER, SUM(s.TOTAL_AMOUNT) FROM {TABLE} s JOIN CUSTOMERS c ON s.CUSTOMER_ID = c.ID GROUP BY 1",
+    f"SELECT GENDER, SUM(TOTAL_AMOUNT) FROM {TABLE} GROUP BY GENDER HAVING TOTAL_AMOUNT > 100",
+    f"SELECT GENDER, SUM(TOTAL_AMOUNT * QUANTITY) FROM {TABLE} GROUP BY GENDER",
+    f"SELECT DATE, TOTAL_AMOUNT FROM {TABLE} WHERE DATE > '2023-01-01'",
+    f"SELECT * FROM {TABLE}",
+    f"SELECT GENDER, SUM(TOTAL_AMOUNT) FROM OTHER_TABLE GROUP BY GENDER",
+])
+def test_other_queries_are_refused(sql):
+    with pytest.raises(NotRewritable):
+        manager().plan(sql)
+    assert manager().rewrite(sql) == sql
+
+def test_rewrite_uses_only_a_fresh_rollup(tmp_path):
+    store = SharedStore(str(tmp_path / "store.db"))
+    conn = FakeConnection()
+    rollups = manager(store, conn, freshness_ttl=0)
+    sql = f"SELECT GENDER, SUM(TOTAL_AMOUNT) FROM {TABLE} GROUP BY GENDER"
+    rewritten = f"SELECT GENDER, SUM(TOTAL_AMOUNT_SUM) FROM {ROLLUP_ALL} GROUP BY GENDER"
+    assert rollups.rewrite(sql) == sql # Never refreshed
+    store.set(ROLLUP_NAMESPACE, "RETAIL_SALES_DATASET_ROLLUP_ALL",
+              json.dumps({'base_last_altered': conn.last_altered, 'refreshed_at': "2026-10-01 08:00:01"}))
+    assert rollups.rewrite(sql) == rewritten
+    conn.last_altered = "2026-10-02 08:00:00" # The fact table changed since the refresh
+    assert rollups.rewrite(sql) == sql
+    assert rollups.counters['rewritten'] == 1 and rollups.counters['stale'] == 2
+
+def test_refresh_runs_on_its_own_connection(tmp_path):
+    shared, own = FakeConnection(), FakeConnection()
+    rollups = manager(SharedStore(str(tmp_path / "store.db")), shared, connect=lambda: own)
+    rollups.enable_change_tracking()
+    rollups.refresh()
+    assert all("INFORMATION_SCHEMA" in sql for sql in shared.executed) # Only the freshness check
+    assert any(sql.startswith("CREATE OR REPLACE TABLE") for sql in own.executed)
+    assert any(sql.startswith("ALTER TABLE") for sql in own.executed)
+
+def test_last_altered_is_reused_for_freshness_ttl():
+    conn = FakeConnection()
+    rollups = manager(conn=conn)
+    assert rollups.freshness_ttl > 0
+    rollups.base_last_altered()
+    rollups.base_last_altered()
+    assert len(conn.executed) == 1
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from shared_store import SharedStore
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two stores on the same file, as two worker processes would open it."""
+    path = str(tmp_path / 'store.db')
+    return SharedStore(path), SharedStore(path)
+
+def test_claim_succeeds_once_across_connections(stores):
+    first, second = stores
+    assert first.claim('events', 'Ev1', ttl=60, value='worker 1')
+    assert not second.claim('events', 'Ev1', ttl=60, value='worker 2')
+    assert not first.claim('events', 'Ev1', ttl=60)
+    assert second.get('events', 'Ev1') == 'worker 1'
+    assert second.claim('events', 'Ev2', ttl=60)
+
+def test_an_expired_claim_can_be_claimed_again(stores):
+    first, second = stores
+    assert first.claim('leases', 'sync', ttl=0.05)
+    time.sleep(0.1)
+    assert second.claim('leases', 'sync', ttl=60, value='worker 2')
+    assert first.get('leases', 'sync') == 'worker 2'
+
+def test_concurrent_claims_have_one_winner(tmp_path):
+    path = str(tmp_path / 'store.db')
+    SharedStore(path) # Creates the table before the race
+    results = []
+    start = threading.Barrier(8)
+
+    def worker(number):
+        store = SharedStore(path)
+        start.wait()
+        results.append(store.claim('events', 'Ev1', ttl=60, value=number))
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [False] * 7 + [True]
+
+def test_token_bucket_is_shared_across_connections(stores):
+    first, second = stores
+    assert first.take_token('rate_limits', 'user:U1', rate=1, burst=2) == 0
+    assert second.take_token('rate_limits', 'user:U1', rate=1, burst=2) == 0
+    wait = first.take_token('rate_limits', 'user:U1', rate=1, burst=2)
+    assert 0.9 < wait <= 1
+    assert second.take_token('rate_limits', 'user:U2', rate=1, burst=2) == 0 # Buckets are per key
+
+def test_token_bucket_refills_at_its_rate(stores):
+    first, second = stores
+    assert first.take_token('rate_limits', 'user:U1', rate=20, burst=1) == 0
+    assert second.take_token('rate_limits', 'user:U1', rate=20, burst=1) > 0 # A refused take costs nothing
+    time.sleep(0.06)
+    assert second.take_token('rate_limits', 'user:U1', rate=20, burst=1) == 0
+    assert first.take_token('rate_limits', 'user:U1', rate=0, burst=1) == float('inf')
+
+def test_values_expire_and_purge(stores):
+    first, second = stores
+    first.set('sql', 'old', 'SELECT 1', ttl=0.05)
+    first.set('sql', 'kept', 'SELECT 2')
+    assert second.incr('counters', 'n') == 1
+    assert first.incr('counters', 'n', 2) == 3
+    time.sleep(0.1)
+    assert second.get('sql', 'old') is None
+    assert second.purge_expired() == 1
+    assert second.get('sql', 'kept') == 'SELECT 2'
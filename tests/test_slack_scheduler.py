@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+import slack_scheduler
+from slack_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, SlackScheduler
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSlackError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+class FakeClient:
+    """Records chat_update calls; raises the queued errors first, then answers with the text sent."""
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+        self.call_times = []
+        self.lock = threading.Lock()
+
+    def chat_update(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs['text'])
+            self.call_times.append(time.monotonic())
+            if self.errors:
+                raise self.errors.pop(0)
+        return {'ok': True, 'text': kwargs['text']}
+
+
+def test_429_waits_for_retry_after_then_retries():
+    client = FakeClient([FakeSlackError(429, {'Retry-After': '0.2'})])
+    scheduler = SlackScheduler(client)
+
+    assert scheduler.call('chat_update', text='hello') == {'ok': True, 'text': 'hello'}
+    assert client.calls == ['hello', 'hello']
+    assert client.call_times[1] - client.call_times[0] >= 0.2
+    assert scheduler.counters == {'calls': 1, 'rate_limited': 1, 'failed': 0}
+
+
+def test_gives_up_after_the_retry_limit():
+    errors = [FakeSlackError(429, {'Retry-After': '0'}) for _ in range(slack_scheduler.MAX_RATE_LIMIT_RETRIES + 1)]
+    client = FakeClient(errors)
+    scheduler = SlackScheduler(client)
+
+    with pytest.raises(FakeSlackError):
+        scheduler.call('chat_update', text='hello')
+    assert len(client.calls) == slack_scheduler.MAX_RATE_LIMIT_RETRIES + 1
+    assert scheduler.counters == {'calls': 0, 'rate_limited': slack_scheduler.MAX_RATE_LIMIT_RETRIES, 'failed': 1}
+
+
+def test_other_errors_are_not_retried():
+    client = FakeClient([FakeSlackError(500)])
+    scheduler = SlackScheduler(client)
+
+    with pytest.raises(FakeSlackError):
+        scheduler.call('chat_update', text='hello')
+    assert client.calls == ['hello']
+    assert scheduler.counters == {'calls': 0, 'rate_limited': 0, 'failed': 1}
+
+
+def test_high_priority_calls_go_before_normal_ones():
+    client = FakeClient()
+    scheduler = SlackScheduler(client, max_concurrent_calls=1)
+
+    # Queue everything before the dispatcher can pick anything up
+    with scheduler._cond:
+        futures = [
+            scheduler.submit('chat_update', PRIORITY_NORMAL, text='normal 1'),
+            scheduler.submit('chat_update', PRIORITY_HIGH, text='high 1'),
+            scheduler.submit('chat_update', PRIORITY_NORMAL, text='normal 2'),
+            scheduler.submit('chat_update', PRIORITY_HIGH, text='high 2'),
+        ]
+    for future in futures:
+        future.result(timeout=5)
+    assert client.calls == ['high 1', 'high 2', 'normal 1', 'normal 2']
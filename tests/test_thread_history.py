@@ -0,0 +1,43 @@
+from shared_store import SharedStore
+from thread_history import ThreadHistory
+
+
+def texts(messages):
+    return [(message['role'], message['content'][0]['text']) for message in messages]
+
+
+def test_turns_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'store.db')
+    first = ThreadHistory(SharedStore(path))
+    second = ThreadHistory(SharedStore(path))
+
+    first.add_turn('C1:1.0', 'total sales?', '42', 'SELECT SUM(TOTAL_AMOUNT) FROM T')
+
+    assert texts(second.get_messages('C1:1.0')) == [
+        ('user', 'total sales?'),
+        ('assistant', '42\n\nSQL used:\nSELECT SUM(TOTAL_AMOUNT) FROM T'),
+    ]
+    assert second.get_messages('C1:2.0') == []
+
+
+def test_keeps_the_last_turns_within_the_token_budget(tmp_path):
+    history = ThreadHistory(SharedStore(str(tmp_path / 'store.db')), max_turns=2, max_tokens=1000)
+    for number in range(3):
+        history.add_turn('t', f'question {number}', f'answer {number}')
+    assert texts(history.get_messages('t')) == [
+        ('user', 'question 1'), ('assistant', 'answer 1'),
+        ('user', 'question 2'), ('assistant', 'answer 2'),
+    ]
+
+    history.max_tokens = 8 # Room for one short turn only
+    assert texts(history.get_messages('t')) == [('user', 'question 2'), ('assistant', 'answer 2')]
+
+
+def test_threads_expire_and_empty_answers_are_skipped(tmp_path):
+    history = ThreadHistory(SharedStore(str(tmp_path / 'store.db')), ttl=-1)
+    history.add_turn('t', 'question', 'answer')
+    assert history.get_messages('t') == []
+
+    history.ttl = 60
+    history.add_turn('t', 'question', '  ')
+    assert history.get_messages('t') == []
@@ -0,0 +1,29 @@
+import os
+
+from cortex_chat import ANALYST_TOOL, SEARCH_TOOL, ALL_TOOLS
+from semantic_model import load_semantic_model
+from tool_selector import ToolSelector
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'retail_sales_data.yaml')
+TITLES = ["DI_CIC-Retail outlook_2.pdf.coredownload", "snp-global"]
+
+def selector():
+    return ToolSelector(load_semantic_model(MODEL_FILE), TITLES, report_every=0)
+
+def test_generic_words_do_not_pick_the_analyst():
+    assert selector().select("How is inflation affecting retailers?") == ALL_TOOLS
+    assert selector().select("What is the trend in sales?") == ALL_TOOLS
+    assert selector().select("How are customers spending?") == ALL_TOOLS
+
+def test_cue_phrases_match_whole():
+    assert selector().scores("How is inflation affecting retailers?") == (0, 0)
+    assert selector().scores("How many transactions were there?")[0] == 1
+
+def test_clear_questions_get_one_tool():
+    assert selector().select("total sales by gender") == (ANALYST_TOOL,)
+    assert selector().select("How many customers bought beauty products?") == (ANALYST_TOOL,)
+    assert selector().select("What does the retail outlook report say about inflation?") == (SEARCH_TOOL,)
+
+def test_one_match_is_not_enough():
+    assert selector().select("chart it") == ALL_TOOLS
+    assert selector().select("Why?") == ALL_TOOLS
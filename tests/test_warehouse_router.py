@@ -0,0 +1,36 @@
+import time
+
+from warehouse_router import ConnectionPool
+
+class FakeConnection:
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+def test_only_connections_idle_past_the_interval_get_heartbeats():
+    pool = ConnectionPool("WH", FakeConnection, max_size=2)
+    with pool.acquire() as first:
+        with pool.acquire() as second:
+            pass
+    assert pool.idle_connections() == [second, first]
+    assert pool.idle_connections(idle_seconds=60) == [] # Both just used
+
+    time.sleep(0.05)
+    with pool.acquire() as reused:
+        assert reused is first # Most recently returned first
+    assert pool.idle_connections(idle_seconds=0.04) == [second]
+
+def test_checked_out_and_broken_connections_are_not_idle():
+    pool = ConnectionPool("WH", FakeConnection, max_size=2)
+    with pool.acquire() as conn:
+        assert pool.idle_connections() == []
+    conn.closed = True
+    with pool.acquire() as replacement:
+        assert replacement is not conn
+    assert pool.idle_connections() == [replacement]
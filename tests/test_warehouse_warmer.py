@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from shared_store import SharedStore
+from warehouse_warmer import WarehouseWarmer
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [('name',), ('state',), ('size',), ('auto_suspend',)]
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if sql.startswith("ALTER WAREHOUSE"):
+            self.conn.state = 'STARTED'
+
+    def fetchone(self):
+        return ('ANALYST_WH', self.conn.state, 'X-Small', 600)
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.state = 'SUSPENDED'
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def resumes(self):
+        return sum(1 for sql in self.executed if sql.startswith("ALTER WAREHOUSE"))
+
+def make_warmer(tmp_path):
+    conn = FakeConnection()
+    warmer = WarehouseWarmer(SharedStore(str(tmp_path / "store.db")), conn, ["ANALYST_WH"],
+                             business_hours=set(range(8, 18)), business_days=set(range(0, 7)), max_credits_per_day=10)
+    return warmer, conn
+
+def test_prewarms_once_per_predicted_hour(tmp_path):
+    warmer, conn = make_warmer(tmp_path)
+    warmer.prewarm(datetime(2026, 10, 19, 7, 56))
+    assert conn.resumes() == 1
+    # The warehouse auto-suspends again during the hour: no resume on every tick
+    for minute in range(57, 60):
+        conn.state = 'SUSPENDED'
+        warmer.prewarm(datetime(2026, 10, 19, 7, minute))
+    for minute in range(0, 55, 5):
+        warmer.prewarm(datetime(2026, 10, 19, 8, minute))
+    assert conn.resumes() == 1
+    warmer.prewarm(datetime(2026, 10, 19, 8, 56))
+    assert conn.resumes() == 2
+
+def test_no_prewarm_outside_predicted_hours(tmp_path):
+    warmer, conn = make_warmer(tmp_path)
+    warmer.prewarm(datetime(2026, 10, 19, 20, 56))
+    assert conn.executed == []
+
+def test_skips_when_questions_keep_it_warm(tmp_path):
+    warmer, conn = make_warmer(tmp_path)
+    warmer.record_request(datetime(2026, 10, 19, 9, 30))
+    warmer.prewarm(datetime(2026, 10, 19, 9, 56))
+    assert conn.resumes() == 0
+    assert warmer.counters['skipped_traffic'] == 1
@@ -0,0 +1,82 @@
+import json
+
+DEBUG = False
+
+class ThreadHistory:
+    """
+    Compact, size-bounded conversation history per Slack thread, sent to the Cortex Agent
+    in the `messages` array so follow-up questions don't need a full re-explanation.
+    Each thread keeps its last max_turns question/answer pairs (with the SQL used). The
+    messages sent are capped at max_tokens (estimated). Turns live in the SharedStore, so a
+    follow-up is answered in context by whichever worker receives it; a thread left alone
+    for ttl seconds is forgotten.
+    """
+    def __init__(self, store, namespace: str = "thread_history", ttl: float = 24 * 3600, max_turns: int = 4,
+                 max_tokens: int = 1500, max_answer_chars: int = 600, chars_per_token: int = 4):
+        self.store = store
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_answer_chars = max_answer_chars
+        self.chars_per_token = chars_per_token
+
+    def get_messages(self, thread_key: str) -> list:
+        """
+        Returns prior turns of the thread as Cortex Agent messages, oldest first,
+        keeping the newest turns that fit in the token budget.
+        """
+        stored = self.store.get(self.namespace, thread_key)
+        if not stored:
+            return []
+        turns = json.loads(stored) # [question, answer] pairs, oldest first
+
+        selected = []
+        budget = self.max_tokens
+        for question, answer in reversed(turns):
+            cost = self._estimate_tokens(question) + self._estimate_tokens(answer)
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append((question, answer))
+
+        messages = []
+        for question, answer in reversed(selected):
+            messages.append(self._message("user", question))
+            messages.append(self._message("assistant", answer))
+        if DEBUG:
+            print(f"ThreadHistory: sending {len(selected)} prior turn(s) for thread {thread_key}.")
+        return messages
+
+    def add_turn(self, thread_key: str, question: str, answer_text: str, sql: str = ''):
+        """Records a question and a compact form of the answer (text plus the SQL that produced it)."""
+        answer = (answer_text or '').strip()
+        if len(answer) > self.max_answer_chars:
+            answer = answer[:self.max_answer_chars] + "..."
+        if sql:
+            answer = f"{answer}\n\nSQL used:\n{sql.strip()}".strip()
+        if not answer:
+            return
+
+        def append(stored):
+            turns = json.loads(stored) if stored else []
+            turns.append([question, answer])
+            return json.dumps(turns[-self.max_turns:])
+
+        # Read-modify-write in one transaction, so turns recorded by two workers at once are both kept
+        self.store.update(self.namespace, thread_key, append, ttl=self.ttl)
+
+    def _estimate_tokens(self, text: str) -> int:
+        return len(text) // self.chars_per_token + 1
+
+    @staticmethod
+    def _message(role: str, text: str) -> dict:
+        return {
+            "role": role,
+            "content": [
+                {
+                    "type": "text",
+                    "text": text
+                }
+            ]
+        }
@@ -0,0 +1,123 @@
+import os
+import threading
+
+from cortex_chat import SEARCH_TOOL, ANALYST_TOOL, ALL_TOOLS
+from fast_path import tokenize, AGGREGATES, COLUMN_ALIASES, TIME_GRAINS, STOPWORDS
+from semantic_model import TIME_DIMENSION
+
+DEBUG = False
+
+# --- Per-Question Tool Selection ---
+# Offering the agent both tools makes it spend planning time choosing between them. Clearly
+# numeric questions (columns, synonyms, sample values and aggregate words from the semantic
+# model) only get the Cortex Analyst tool; clearly document questions (words from the search
+# corpus titles, plus document cues) only get Cortex Search. Anything else gets both.
+# Phrases are matched whole ("how many", not "how"), and one side needs at least `margin`
+# matches with none on the other, so a single word never decides.
+
+DATA_CUES = [
+    'how many', 'how much', 'breakdown', 'chart', 'plot', 'graph', 'percentage', 'rank', 'distribution', 'dataset',
+]
+DOCUMENT_CUES = [
+    'report', 'document', 'pdf', 'article', 'according to', 'say', 'says', 'said', 'mention', 'mentioned',
+    'outlook', 'forecast', 'summary', 'summarize', 'explain', 'why', 'insight', 'industry',
+]
+# Words from file names that say nothing about a document's subject.
+TITLE_NOISE = {'pdf', 'coredownload', 'di', 'cic', 'global', '2', 'v', 'final', 'draft'}
+# Model words that are everyday retail vocabulary ("How are customers spending?"), not a sign of a data question.
+GENERIC_WORDS = {
+    'sale', 'spend', 'spending', 'revenue', 'customer', 'shopper', 'buyer', 'amount', 'volume', 'date', 'day', 'mean', 'overall',
+}
+
+_STOPWORD_STEMS = set(tokenize(" ".join(STOPWORDS)))
+
+def _phrases(phrases) -> set:
+    """Whole phrases, as tokenized by fast_path.tokenize (words joined by spaces)."""
+    return {" ".join(tokens) for tokens in map(tokenize, map(str, phrases)) if tokens}
+
+def _title_words(titles) -> set:
+    """The words of document titles; a question names a document by its subject, not its file name."""
+    return {token for title in titles for token in tokenize(str(title))
+            if token not in _STOPWORD_STEMS and token not in TITLE_NOISE}
+
+def document_titles_from_dir(path: str) -> list:
+    """Titles of the PDFs in a local directory (the files uploaded to the SLACK_PDFS stage)."""
+    if not os.path.isdir(path):
+        return []
+    return [name.rsplit('.pdf', 1)[0] for name in sorted(os.listdir(path)) if name.lower().endswith('.pdf')]
+
+def document_titles_from_snowflake(conn, table: str = "parsed_pdfs") -> list:
+    """Distinct titles of the chunks indexed by the info_search service."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT DISTINCT TITLE FROM {table}")
+        return [row[0] for row in cursor.fetchall() if row[0]]
+    finally:
+        cursor.close()
+
+class ToolSelector:
+    """
+    Chooses which agent tools to offer for a question by counting phrase matches against a data
+    vocabulary and a document vocabulary. One side must have at least `margin` matches with the
+    other side at zero, otherwise both tools are offered.
+    """
+    def __init__(self, model, document_titles: list, margin: int = 2, report_every: int = 50):
+        self.margin = margin
+        self.report_every = report_every
+        phrases = []
+        for table in model.tables:
+            phrases += [table.name] + table.synonyms
+            for column in table.columns.values():
+                phrases += [column.name] + column.synonyms + COLUMN_ALIASES.get(column.name, [])
+                if not column.is_numeric and column.kind != TIME_DIMENSION:
+                    phrases += column.sample_values # Numbers and dates would match any year or count
+        for words in list(AGGREGATES.values()) + list(TIME_GRAINS.values()):
+            phrases += words
+        self.data_terms = (_phrases(phrases) - GENERIC_WORDS - _STOPWORD_STEMS) | _phrases(DATA_CUES)
+        self.document_terms = _phrases(DOCUMENT_CUES) | _title_words(document_titles)
+        overlap = self.data_terms & self.document_terms # Words like "retail" say nothing on their own
+        self.data_terms -= overlap
+        self.document_terms -= overlap
+        self.longest = max(len(term.split()) for term in self.data_terms | self.document_terms)
+        self.counters = {'questions': 0, ANALYST_TOOL: 0, SEARCH_TOOL: 0, 'both': 0}
+        self._lock = threading.Lock()
+
+    def scores(self, question: str) -> tuple:
+        """
+        Returns (data_matches, document_matches): the question is scanned left to right for the
+        longest known phrase, so "units sold" counts once, not also as "unit".
+        """
+        tokens = tokenize(question)
+        data, documents, i = set(), set(), 0
+        while i < len(tokens):
+            for length in range(min(self.longest, len(tokens) - i), 0, -1):
+                phrase = " ".join(tokens[i:i + length])
+                if phrase in self.data_terms:
+                    data.add(phrase)
+                    break
+                if phrase in self.document_terms:
+                    documents.add(phrase)
+                    break
+            else:
+                length = 1
+            i += length
+        return len(data), len(documents)
+
+    def select(self, question: str) -> tuple:
+        """Returns the tool names to offer the agent for this question."""
+        data, documents = self.scores(question)
+        if data >= self.margin and documents == 0:
+            tools, outcome = (ANALYST_TOOL,), ANALYST_TOOL
+        elif documents >= self.margin and data == 0:
+            tools, outcome = (SEARCH_TOOL,), SEARCH_TOOL
+        else:
+            tools, outcome = ALL_TOOLS, 'both'
+        with self._lock:
+            self.counters['questions'] += 1
+            self.counters[outcome] += 1
+            if self.report_every and self.counters['questions'] % self.report_every == 0:
+                print(f">>>>>>>>>> Tool selection: {self.counters[ANALYST_TOOL]} analyst only, "
+                      f"{self.counters[SEARCH_TOOL]} search only, {self.counters['both']} both.")
+        if DEBUG:
+            print(f"ToolSelector: data={data} documents={documents} -> {', '.join(tools)} for '{question}'")
+        return tools
@@ -0,0 +1,154 @@
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from query_guard import explain_stats, format_bytes
+
+DEBUG = False
+
+# Each join makes a query this much "heavier" than its bytes scanned alone suggest.
+JOIN_WEIGHT = 0.5
+
+_SIZE = re.compile(r'^\s*([\d.]+)\s*(B|KB|MB|GB|TB)?\s*$', re.IGNORECASE)
+_UNITS = {None: 1, 'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+
+def parse_size(text: str) -> float:
+    """Parses sizes such as "500MB" or "2.5 GB" into bytes."""
+    match = _SIZE.match(text)
+    if not match:
+        raise ValueError(f"Invalid size '{text}'.")
+    number, unit = match.groups()
+    return float(number) * _UNITS[unit.upper() if unit else None]
+
+def parse_routes(spec: str, default_warehouse: str) -> list:
+    """
+    Parses WAREHOUSE_ROUTES, e.g. "SLACK_XS:1GB,SLACK_S:100GB,SLACK_M", into a list of
+    (warehouse, max_weight_bytes) from smallest to largest. The last warehouse takes everything
+    above the previous limits. An empty spec routes everything to default_warehouse.
+    """
+    routes = []
+    for part in (spec or '').split(','):
+        if not part.strip():
+            continue
+        name, _, limit = part.partition(':')
+        routes.append((name.strip(), parse_size(limit) if limit.strip() else float('inf')))
+    if not routes:
+        return [(default_warehouse, float('inf'))]
+    last_name, _ = routes[-1]
+    routes[-1] = (last_name, float('inf'))
+    return routes
+
+class ConnectionPool:
+    """
+    A bounded pool of Snowflake connections using one warehouse. Connections are created on
+    demand up to max_size; acquire() waits for a free one after that.
+    """
+    def __init__(self, warehouse: str, connect, max_size: int = 4):
+        self.warehouse = warehouse
+        self.connect = connect # Callable: warehouse -> new connection
+        self.max_size = max_size
+        self._idle = queue.LifoQueue() # Most recently used first, so idle extras can time out
+        self._created = 0
+        self._idle_since = {} # id(conn) -> time.monotonic() when it was last returned to the pool
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        conn = self._get(timeout)
+        healthy = True
+        try:
+            yield conn
+        except Exception:
+            healthy = not self._is_closed(conn)
+            raise
+        finally:
+            if healthy:
+                self._idle_since[id(conn)] = time.monotonic()
+                self._idle.put(conn)
+            else:
+                self._discard(conn)
+
+    def _get(self, timeout: float):
+        try:
+            conn = self._idle.get_nowait()
+            if not self._is_closed(conn):
+                return conn
+            self._discard(conn)
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.max_size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                conn = self.connect(self.warehouse)
+                if DEBUG:
+                    print(f"ConnectionPool: opened connection {self._created}/{self.max_size} on {self.warehouse}.")
+                return conn
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        self._idle_since.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def idle_connections(self, idle_seconds: float = 0) -> list:
+        """
+        Snapshot of the connections that have sat idle in the pool for at least idle_seconds
+        (used by keepalive heartbeats; a connection in recent use needs none).
+        """
+        cutoff = time.monotonic() - idle_seconds
+        return [conn for conn in list(self._idle.queue) if self._idle_since.get(id(conn), cutoff + 1) <= cutoff]
+
+    @staticmethod
+    def _is_closed(conn) -> bool:
+        is_closed = getattr(conn, 'is_closed', None)
+        return bool(is_closed()) if callable(is_closed) else False
+
+class WarehouseRouter:
+    """
+    Sends each generated query to one of several configured warehouses by estimated weight
+    (bytes scanned from EXPLAIN, scaled up for joins), with one connection pool per warehouse,
+    so small lookups never queue behind heavy scans.
+    """
+    def __init__(self, routes: list, connect, control_conn, pool_size: int = 4):
+        self.routes = routes
+        self.control_conn = control_conn # Used for EXPLAIN when no stats were provided
+        self.pools = {warehouse: ConnectionPool(warehouse, connect, pool_size) for warehouse, _ in routes}
+        self.counters = {warehouse: 0 for warehouse, _ in routes}
+
+    def choose(self, sql: str, stats: dict = None) -> str:
+        if len(self.routes) == 1:
+            return self.routes[0][0]
+        if stats is None:
+            try:
+                stats = explain_stats(sql, self.control_conn)
+            except Exception as e:
+                print(f"Warning: EXPLAIN failed, routing to the largest warehouse: {e}")
+                return self.routes[-1][0]
+        weight = stats.get("bytesAssigned", 0) * (1 + JOIN_WEIGHT * stats.get("joins", 0))
+        for warehouse, max_weight in self.routes:
+            if weight <= max_weight:
+                if DEBUG:
+                    print(f"WarehouseRouter: weight {format_bytes(weight)} -> {warehouse}.")
+                return warehouse
+        return self.routes[-1][0]
+
+    @contextmanager
+    def connection(self, sql: str, stats: dict = None):
+        """Yields a pooled connection on the warehouse chosen for the query."""
+        warehouse = self.choose(sql, stats)
+        self.counters[warehouse] += 1
+        with self.pools[warehouse].acquire() as conn:
+            yield conn
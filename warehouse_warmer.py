@@ -0,0 +1,172 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+DEBUG = False
+
+# --- Warehouse Pre-Warming and Session Keepalive ---
+# The warehouse auto-suspends when idle, so the first question after a quiet period pays the
+# resume latency, and idle Snowflake sessions can expire overnight. This background service
+# keeps sessions alive with cheap heartbeats (SELECT 1 runs in cloud services, not on the
+# warehouse) and resumes the warehouse shortly before each hour of predicted demand, within a
+# daily credit ceiling. Within an hour a warehouse that auto-suspends is left alone: resuming it
+# every tick would spend the ceiling on nobody, and real questions resume it anyway.
+
+TRAFFIC_NAMESPACE = "traffic" # Requests per local "YYYY-MM-DD:HH", shared by all workers
+BUDGET_NAMESPACE = "prewarm" # Estimated pre-warm credits per day
+PREWARMED_NAMESPACE = "prewarmed" # Local "YYYY-MM-DD:HH" hours already decided on, so each is pre-warmed at most once
+LEASE_NAMESPACE = "leases" # Only one worker pre-warms; every worker sends its own heartbeats
+TRAFFIC_TTL_SECONDS = 35 * 24 * 3600
+
+# Credits per hour by warehouse size (standard warehouses), as reported by SHOW WAREHOUSES.
+CREDITS_PER_HOUR = {
+    'X-SMALL': 1, 'SMALL': 2, 'MEDIUM': 4, 'LARGE': 8, 'X-LARGE': 16,
+    '2X-LARGE': 32, '3X-LARGE': 64, '4X-LARGE': 128, '5X-LARGE': 256, '6X-LARGE': 512,
+}
+
+def parse_range(text: str) -> set:
+    """Parses "8-18" or "0-4,6" into a set of integers (ranges are inclusive)."""
+    values = set()
+    for part in (text or '').split(','):
+        if not part.strip():
+            continue
+        start, _, end = part.partition('-')
+        values.update(range(int(start), int(end or start) + 1))
+    return values
+
+class WarehouseWarmer:
+    """
+    Background keepalive and pre-warm service. Demand is predicted from business hours and
+    from the bot's own request history (same weekday and hour over the last few weeks).
+    """
+    def __init__(self, store, control_conn, warehouses: list, heartbeat_conns=None, worker_id: str = "0",
+                 interval: int = 60, heartbeat_interval: int = 900, lead_minutes: int = 5,
+                 business_hours: set = None, business_days: set = None, history_weeks: int = 4,
+                 min_hourly_requests: float = 1.0, max_credits_per_day: float = 1.0):
+        self.store = store
+        self.control_conn = control_conn
+        self.warehouses = warehouses
+        self.heartbeat_conns = heartbeat_conns # Optional callable returning extra idle connections to ping
+        self.worker_id = worker_id
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.lead = timedelta(minutes=lead_minutes)
+        self.business_hours = business_hours if business_hours is not None else set(range(8, 18))
+        self.business_days = business_days if business_days is not None else set(range(0, 5))
+        self.history_weeks = history_weeks
+        self.min_hourly_requests = min_hourly_requests
+        self.max_credits_per_day = max_credits_per_day
+        self._last_heartbeat = 0.0
+        self._stop = threading.Event()
+        self.counters = {'heartbeats': 0, 'resumes': 0, 'skipped_budget': 0, 'skipped_traffic': 0}
+
+    def record_request(self, when: datetime = None):
+        """Counts one incoming question (answered or not) in the shared traffic history."""
+        when = when or datetime.now()
+        self.store.incr(TRAFFIC_NAMESPACE, when.strftime("%Y-%m-%d:%H"), 1, ttl=TRAFFIC_TTL_SECONDS)
+
+    def predicted_demand(self, when: datetime) -> bool:
+        """True if questions are expected in the hour containing `when`."""
+        if when.weekday() in self.business_days and when.hour in self.business_hours:
+            return True
+        counts = []
+        for weeks_ago in range(1, self.history_weeks + 1):
+            past = when - timedelta(weeks=weeks_ago)
+            counts.append(self.store.get(TRAFFIC_NAMESPACE, past.strftime("%Y-%m-%d:%H")) or 0)
+        return sum(counts) / len(counts) >= self.min_hourly_requests
+
+    def start(self):
+        threading.Thread(target=self._run, name="warehouse-warmer", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Warning: Warehouse warmer failed: {e}")
+
+    def tick(self):
+        now = time.time()
+        if now - self._last_heartbeat >= self.heartbeat_interval:
+            self._last_heartbeat = now
+            self.heartbeat()
+        if self.max_credits_per_day > 0 and self._is_leader():
+            self.prewarm(datetime.now())
+
+    def prewarm(self, now: datetime):
+        """
+        Resumes the warehouses once per predicted hour, `lead` before it starts, unless questions
+        in the current hour already keep them warm.
+        """
+        target = now + self.lead
+        if not self.predicted_demand(target):
+            return
+        if not self.store.claim(PREWARMED_NAMESPACE, target.strftime("%Y-%m-%d:%H"), ttl=2 * 3600, value=self.worker_id):
+            return # Already decided for this hour
+        if (self.store.get(TRAFFIC_NAMESPACE, now.strftime("%Y-%m-%d:%H")) or 0) >= self.min_hourly_requests:
+            self.counters['skipped_traffic'] += 1
+            if DEBUG:
+                print("WarehouseWarmer: not pre-warming, questions are already keeping the warehouses warm.")
+            return
+        for warehouse in self.warehouses:
+            self.ensure_warm(warehouse)
+
+    def heartbeat(self):
+        """Runs SELECT 1 on this worker's sessions so they don't expire while idle."""
+        connections = [self.control_conn] + (list(self.heartbeat_conns()) if self.heartbeat_conns else [])
+        for conn in connections:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                self.counters['heartbeats'] += 1
+            except Exception as e:
+                print(f"Warning: Session heartbeat failed: {e}")
+
+    def ensure_warm(self, warehouse: str):
+        """Resumes the warehouse if it is suspended and the day's pre-warm credit ceiling allows it."""
+        info = self._warehouse_info(warehouse)
+        if info is None or info.get('state', '').upper() not in ('SUSPENDED', 'SUSPENDING'):
+            return
+        # A resume bills at least 60 seconds, then runs until auto-suspend if no query arrives.
+        billed_seconds = max(60, int(info.get('auto_suspend') or 600))
+        credits = CREDITS_PER_HOUR.get(info.get('size', '').upper(), 2) * billed_seconds / 3600
+        budget_key = datetime.now().strftime("%Y-%m-%d")
+        spent = self.store.get(BUDGET_NAMESPACE, budget_key) or 0
+        if spent + credits > self.max_credits_per_day:
+            self.counters['skipped_budget'] += 1
+            if DEBUG:
+                print(f"WarehouseWarmer: not resuming {warehouse}, daily ceiling reached ({spent:.2f} credits).")
+            return
+        cursor = self.control_conn.cursor()
+        try:
+            cursor.execute("ALTER WAREHOUSE IDENTIFIER(%s) RESUME IF SUSPENDED", (warehouse,))
+        finally:
+            cursor.close()
+        self.store.incr(BUDGET_NAMESPACE, budget_key, credits, ttl=2 * 24 * 3600)
+        self.counters['resumes'] += 1
+        print(f">>>>>>>>>> Pre-warmed warehouse {warehouse} ahead of expected questions (~{credits:.2f} credits).")
+
+    def _warehouse_info(self, warehouse: str) -> dict:
+        cursor = self.control_conn.cursor()
+        try:
+            cursor.execute("SHOW WAREHOUSES LIKE %s", (warehouse,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return {column[0].lower(): value for column, value in zip(cursor.description, row)}
+        finally:
+            cursor.close()
+
+    def _is_leader(self) -> bool:
+        """One worker at a time holds the pre-warm lease; it is renewed on every tick."""
+        ttl = self.interval * 3
+        if self.store.claim(LEASE_NAMESPACE, "warehouse-warmer", ttl=ttl, value=self.worker_id):
+            return True
+        if self.store.get(LEASE_NAMESPACE, "warehouse-warmer") == self.worker_id:
+            self.store.set(LEASE_NAMESPACE, "warehouse-warmer", self.worker_id, ttl=ttl)
+            return True
+        return False